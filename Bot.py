@@ -1,22 +1,12 @@
-import socket
 import threading
 import random
 
-from colorama import Fore
+from colors import Fore
 
 from client import Client
 
+import protocol
 
-def get_local_ipv4_address():
-    """
-        Get the local IPv4 address of the machine.
-
-        :return: The local IPv4 address.
-        """
-    # Get the local hostname
-    temp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    temp_sock.connect(("8.8.8.8", 80))
-    return temp_sock.getsockname()[0]
 
 class Bot(Client):
     """
@@ -32,7 +22,7 @@ class Bot(Client):
                 :param server_port: The port number of the server.
                 :param isBot: Boolean indicating whether the client is a bot.
                 """
-        super().__init__(name)
+        super().__init__(name, headless=True)
         self.name = name
         self.address = address
         self.server_port = server_port
@@ -48,7 +38,30 @@ class Bot(Client):
         answer = random.choice(
             ['0', '1'])  # Randomly choose from the options
         print(f"{self.name} answered {answer}\n")
-        client_socket.sendall(answer.encode())
+        client_socket.sendall(protocol.encode_frame(protocol.ANSWER, answer))
+
+    def play_connection(self, client_socket):
+        """
+                Play every game the server assigns to the bot over an already connected socket, until the server
+                closes it. Used by the server's warm bot pool, where the bot stays connected between games.
+
+                :param client_socket: The socket connected to the server.
+                """
+        try:
+            client_socket.sendall(protocol.encode_frame(protocol.BOT, self.name))
+            reader = protocol.FrameReader(client_socket)
+            while True:
+                frame = reader.read_frame()
+                if frame is None:
+                    break
+                if frame[0] == protocol.PING:
+                    client_socket.sendall(protocol.PONG_FRAME)
+                elif frame[0] == protocol.QUESTION:
+                    self.answering_questions(client_socket)
+        except OSError:
+            pass
+        finally:
+            client_socket.close()
 
     def run(self):
         """
@@ -0,0 +1,884 @@
+import asyncio
+import collections
+import threading
+import time
+import random
+import sys
+
+from Bot import Bot
+
+import protocol
+
+import messages
+
+import metrics
+
+from pacing import DEFAULT_PACING
+
+from heartbeat import DEFAULT_HEARTBEAT, tune_keepalive
+
+from question_bank import open_question_bank
+
+from sessions import RESUME_WINDOW, SessionTable
+
+from spectators import SpectatorFeed, stream_feed
+
+from game_log import GAME_LOG_FILE, GameLog, GameRecorder
+
+from scoring import RoundScore
+
+from virtual_player import VirtualPlayer, is_virtual
+
+from server import MAX_ROUNDS, bot_names, builtin_bank, get_leaderboard, server_load, startup, udp_broadcast
+
+"""
+This script implements an asyncio server mode for the Trivia King game.
+
+It is an alternative to server.tcp_server: instead of one thread per socket for every broadcast, answer collection
+and elimination message, the whole game runs on a single event loop using asyncio streams
+(StreamReader / StreamWriter). The lobby, broadcasts, answer collection and eliminations are coroutines, so a single
+process can hold thousands of players without creating a thread per message.
+Every connection is read in the background, so a closed connection is noticed at once, and the server pings the
+players so that a silent dead connection is flagged within the heartbeat bound instead of stalling the rounds.
+Players are routed into game rooms: a new lobby opens as soon as the current one fills or starts its game, so many
+games run side by side and players arriving mid-game join the next lobby right away instead of being refused.
+Players that open a session (see sessions.py) stay connected when their game is over and are routed into the next
+lobby, and a player whose connection is lost keeps their seat, in the lobby or in the game, until the resume window
+is over.
+Every room publishes its game to a spectator feed (see spectators.py), which is streamed to its eliminated players
+until the game is over and to the spectators watching the room.
+
+The game logic, questions and messages are the same as in server.py, so the regular client and bots work unchanged.
+
+The script includes the following functionalities:
+- AsyncPlayer: A player connected to the asyncio server.
+- Room: A lobby of players that runs its own game.
+- AsyncTriviaServer: Routes accepted players into the filling room and runs the rooms' games side by side.
+- send_to_all: Sends a message to all players.
+- elimination_msg: Sends an elimination message to a player.
+- play_trivia: Receives a player's answer and records it in the round's score.
+- play: Manages a round of the trivia game.
+- record_winner: Records the winner of a game and returns the top three players and the winner's rank.
+- run_async_server: Runs the asyncio server until interrupted.
+"""
+
+LOBBY_TIMEOUT = 10
+DRAIN_TIMEOUT = 5
+MIN_PLAYERS = 4
+ROOM_CAPACITY = 100
+MAX_ROOMS = 50
+
+
+class AsyncPlayer:
+    """
+    A player connected to the asyncio server.
+    """
+
+    def __init__(self, client_id, name, reader, writer):
+        """
+        Initialize the AsyncPlayer object.
+
+        :param client_id: id of the player
+        :param name: name of the player
+        :param reader: asyncio StreamReader of the connection
+        :param writer: asyncio StreamWriter of the connection
+        """
+        self.client_id = client_id
+        self.name = name
+        self.reader = reader
+        self.writer = writer
+        self.connected = True
+        self.last_seen = time.monotonic()
+        self.inbox = asyncio.Queue()
+        self.reader_task = None
+        self.session = None
+        self.room = None
+        # (question, deadline) of the question the player is expected to answer, or None
+        self.question = None
+        # Whether the connection is a bot started by the server, which said so with a BOT frame
+        self.bot = False
+
+    def start(self):
+        """
+        Start reading the player's messages in the background.
+        """
+        self.reader_task = asyncio.get_running_loop().create_task(self.read_messages())
+
+    async def read_messages(self):
+        """
+        Reads the player's messages until the connection is closed. Every message refreshes last_seen; PONG frames
+        are only heartbeats, the other messages are queued for receive.
+        """
+        reader = self.reader
+        try:
+            while True:
+                frame = await protocol.read_frame_async(reader)
+                if frame is None:
+                    break
+                self.last_seen = time.monotonic()
+                if frame[0] != protocol.PONG:
+                    self.inbox.put_nowait(frame)
+        except OSError:
+            pass
+        finally:
+            # A connection replaced by a resumed session no longer speaks for the player
+            if reader is self.reader:
+                self.disconnected()
+
+    def disconnected(self):
+        """
+        Mark the player as disconnected, waking up a pending receive. The resume window of the player's session
+        starts.
+        """
+        if self.connected:
+            self.connected = False
+            self.inbox.put_nowait(None)
+            if self.session is not None:
+                self.session.detach()
+
+    def attach(self, reader, writer):
+        """
+        Moves the player onto a new connection, when the player resumes their session.
+        :param reader: asyncio StreamReader of the new connection
+        :param writer: asyncio StreamWriter of the new connection
+        """
+        self.reader = reader
+        self.writer = writer
+        self.connected = True
+        self.last_seen = time.monotonic()
+        # A receive pending on the old connection gets the frames of the new one
+        while not self.inbox.empty():
+            self.inbox.get_nowait()
+        self.start()
+
+    def has_seat(self):
+        """
+        Check if the player keeps their seat: the player is connected, or may still resume their session.
+        :return: True if the player stays in the game
+        """
+        return self.connected or (self.session is not None and self.session.is_resumable())
+
+    def discard_pending(self):
+        """
+        Discard the messages received but not read yet, like a late answer to the previous question.
+        """
+        while not self.inbox.empty():
+            if self.inbox.get_nowait() is None:
+                self.inbox.put_nowait(None)
+                break
+
+    def send(self, data):
+        """
+        Queue already encoded data on the player's connection without waiting for it to be sent.
+        :param data: bytes to send
+        """
+        if not self.connected:
+            return
+        try:
+            self.writer.write(data)
+        except (OSError, RuntimeError):
+            self.disconnected()
+
+    async def flush(self):
+        """
+        Wait until the queued data has been sent. A player that does not drain in time is marked as disconnected.
+        """
+        if not self.connected:
+            return
+        try:
+            await asyncio.wait_for(self.writer.drain(), DRAIN_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            self.disconnected()
+
+    async def receive(self, timeout):
+        """
+        Receive a message from the player.
+        :param timeout: seconds to wait for the message
+        :return: the text of the message, or None if the player disconnected
+        """
+        frame = await self.receive_frame(timeout)
+        return None if frame is None else frame[1]
+
+    async def receive_frame(self, timeout):
+        """
+        Receive a frame from the player. A player who lost their connection but may still resume their session is
+        waited for.
+        :param timeout: seconds to wait for the frame
+        :return: (msg_type, text) of the frame, or None if the player disconnected
+        """
+        if not self.has_seat() and self.inbox.empty():
+            return None
+        return await asyncio.wait_for(self.next_frame(), timeout)
+
+    async def next_frame(self):
+        while True:
+            frame = await self.inbox.get()
+            if frame is not None or not self.has_seat():
+                return frame
+
+    def close(self):
+        """
+        Close the player's connection.
+        """
+        self.disconnected()
+        try:
+            self.writer.close()
+        except (OSError, RuntimeError):
+            pass
+        if self.reader_task is not None and self.reader_task is not asyncio.current_task():
+            self.reader_task.cancel()
+
+
+async def send_to_all(players, msg, msg_type=protocol.INFO):
+    """
+    Sends a message to all players. The message is encoded once and written to every connection, then all the
+    connections are drained together.
+    :param players: dict of player id to AsyncPlayer
+    :param msg: message to send, or already encoded frames
+    :param msg_type: protocol message type of the message
+    :return:
+    """
+    started = time.perf_counter()
+    data = protocol.encode_frame(msg_type, msg) if isinstance(msg, str) else msg
+    recipients = [player for player in players.values() if not is_virtual(player)]
+    for player in recipients:
+        player.send(data)
+    await asyncio.gather(*(player.flush() for player in recipients))
+    metrics.BROADCAST.observe(time.perf_counter() - started)
+
+
+async def elimination_msg(player, message):
+    """
+    Sends an elimination message to a player.
+    :param player: the eliminated AsyncPlayer
+    :param message: the pre-encoded elimination frame of the player
+    :return:
+    """
+    player.send(message)
+    await player.flush()
+
+
+async def play_trivia(player, round_score, deadline, question):
+    """
+    Receives a player's answer and records it in the round's score.
+    :param player: AsyncPlayer answering the question
+    :param round_score: RoundScore of the round
+    :param deadline: event loop time at which the answer window closes
+    :param question: the question, asked again if the player resumes their session before answering
+    :return:
+    """
+    loop = asyncio.get_running_loop()
+    asked = loop.time()
+    player.question = (question, deadline)
+    try:
+        ans = await player.receive(max(0.0, deadline - asked))
+    except asyncio.TimeoutError:
+        # The heartbeat tells dead players apart, so a live player that did not answer is just late
+        metrics.ANSWER_TIMEOUTS.inc()
+        ans = 'NONE'
+    else:
+        if ans is not None:
+            metrics.ANSWERS.inc()
+            metrics.ANSWER_LATENCY.observe(loop.time() - asked)
+    finally:
+        player.question = None
+    if ans is None:
+        return
+    round_score.record(player.client_id, ans)
+
+
+async def play(players, question_id, next_round="", game_messages=None, pacing=DEFAULT_PACING,
+               question_bank=builtin_bank, recorder=None, feed=None):
+    """
+    Manages a round of the trivia game.
+
+    Args:
+    - players (dict): A dictionary of player IDs to the AsyncPlayer objects still in the game.
+    - question_id (int): The id of the trivia question to be asked.
+    - next_round (str): Information about the next round (default="").
+    - game_messages (GameMessages): The pre-encoded messages of the game (default=None, encoded for this round).
+    - pacing (Pacing): The delays and answer window of the round (default=DEFAULT_PACING).
+    - question_bank: The bank the question is read from (default=builtin_bank).
+    - recorder (GameRecorder): The recorder of the game's events (default=None, the round is not recorded).
+    - feed (SpectatorFeed): The spectator feed the round is published to (default=None, nobody watches).
+
+    Returns:
+    True if no players are eliminated in the round.
+    """
+    metrics.ROUNDS.inc()
+    with metrics.ROUND_DURATION.time():
+        return await play_round(players, question_id, next_round, game_messages, pacing, question_bank, recorder,
+                                feed)
+
+
+async def play_round(players, question_id, next_round, game_messages, pacing, question_bank, recorder=None,
+                     feed=None):
+    """
+    Plays a round of the trivia game, see play.
+    """
+    question, answer = question_bank.get(question_id)
+    if game_messages is None:
+        game_messages = messages.GameMessages({pid: player.name for pid, player in players.items()}, [question])
+    print(next_round)
+    round_header = game_messages.round_header_frame(next_round)
+    if feed is not None:
+        feed.publish(round_header)
+    await send_to_all(players, round_header)
+    await asyncio.sleep(pacing.question_delay)
+    print(f"True or False: {question}\n")
+    for player in players.values():
+        player.discard_pending()
+    if feed is not None:
+        feed.publish(game_messages.watched_question(question))
+    await send_to_all(players, game_messages.question(question))
+
+    round_score = RoundScore(players.keys())
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + pacing.answer_timeout
+    # The round closes as soon as every player has answered, or when the answer window is over
+    # Virtual bots answer with a function call; the other players are waited on together
+    for player in players.values():
+        if is_virtual(player):
+            reply = player.answer(question)
+            if reply is not None:
+                round_score.record(player.client_id, reply)
+                metrics.ANSWERS.inc()
+    await asyncio.gather(*(play_trivia(player, round_score, deadline, question)
+                           for player in list(players.values()) if not is_virtual(player)))
+    if not pacing.close_early:
+        await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+    # The whole round is scored at once, after the answer window closes
+    round_score.score(answer)
+    if recorder is not None:
+        recorder.round(question_id, answer, round_score,
+                       [] if round_score.nobody_eliminated() else round_score.eliminated())
+    if round_score.nobody_eliminated():
+        print('Nobody is eliminated this round! Let"s move to the next round.')
+        if feed is not None:
+            feed.publish(messages.NOBODY_ELIMINATED_FRAME)
+        await send_to_all(players, messages.NOBODY_ELIMINATED_FRAME)
+        await asyncio.sleep(pacing.next_round_delay)
+        return True
+    await asyncio.sleep(pacing.results_delay)
+    mess = game_messages.results(round_score, last_two=len(players) <= 2)
+    print(mess)
+    results = messages.encode_info(mess)
+    if feed is not None:
+        feed.publish(results)
+    await send_to_all(players, results)
+    await asyncio.sleep(pacing.next_round_delay)
+
+    await asyncio.gather(*(elimination_msg(players.pop(player_id), game_messages.eliminations[player_id])
+                           for player_id in round_score.eliminated()))
+
+
+class Room:
+    """
+    A class representing a game room: a lobby that fills up with players and then runs its own game. Several rooms
+    can play side by side on the same event loop.
+    """
+
+    def __init__(self, room_id, capacity=None, pacing=DEFAULT_PACING, question_bank=builtin_bank, game_log=None):
+        """
+        Initialize the Room object.
+
+        :param room_id: id of the room
+        :param capacity: maximum number of players in the room, or None for no limit
+        :param pacing: the Pacing of the room's game
+        :param question_bank: the bank the questions of the room's game are chosen from
+        :param game_log: the GameLog the events of the room's game are appended to, or None
+        """
+        self.room_id = room_id
+        self.capacity = capacity
+        self.pacing = pacing
+        self.question_bank = question_bank
+        self.game_log = game_log
+        self.lobby = {}
+        self.joined = asyncio.Event()
+        self.bots_needed = 0
+        self.opened_at = None
+        self.feed = SpectatorFeed()
+        # player id -> task streaming the feed to an eliminated player
+        self.watching = {}
+
+    def is_full(self):
+        """
+        Check if the lobby reached its capacity.
+        :return: True if no more players can join the room
+        """
+        return self.capacity is not None and len(self.lobby) >= self.capacity
+
+    def add(self, player):
+        """
+        Adds a player to the lobby of the room.
+        :param player: the AsyncPlayer joining
+        """
+        player.send(messages.WELCOME_FRAME)
+        print(f"Player {player.name} joined the lobby of room {self.room_id}.\n")
+        player.room = self
+        if self.opened_at is None:
+            self.opened_at = time.monotonic()
+        self.lobby[player.client_id] = player
+        self.joined.set()
+        metrics.PLAYERS_JOINED.inc()
+
+    async def wait_for_lobby(self):
+        """
+        Waits until at least one player is in the lobby and either the lobby is full or no new player has joined for
+        LOBBY_TIMEOUT seconds.
+        """
+        while not self.lobby:
+            self.joined.clear()
+            await self.joined.wait()
+        while not self.is_full():
+            self.joined.clear()
+            try:
+                await asyncio.wait_for(self.joined.wait(), LOBBY_TIMEOUT)
+            except asyncio.TimeoutError:
+                break
+
+    async def wait_for_bots(self):
+        """
+        Waits for the bots started for this room to join its lobby.
+        """
+        while self.bots_needed > 0:
+            self.joined.clear()
+            try:
+                await asyncio.wait_for(self.joined.wait(), LOBBY_TIMEOUT)
+            except asyncio.TimeoutError:
+                break
+
+    def spectate(self, player):
+        """
+        Streams the rest of the game to an eliminated player, from the next frame published.
+        :param player: the eliminated AsyncPlayer
+        """
+        self.watching[player.client_id] = asyncio.create_task(stream_feed(self.feed, player, self.feed.head))
+
+    async def run_game(self, players):
+        """
+        Runs a single game with the given players.
+        :param players: dict of player id to AsyncPlayer
+        """
+        all_players = dict(players)
+        metrics.GAMES.inc()
+        recorder = None
+        if self.game_log is not None:
+            recorder = GameRecorder()
+            for pid, player in players.items():
+                recorder.join(pid, player.name, is_virtual(player) or player.bot)
+        print(f'Room {self.room_id} is starting a game.\n')
+        self.feed.publish(messages.INTRO_FRAMES)
+        await send_to_all(players, messages.INTRO_FRAMES)
+        await asyncio.sleep(self.pacing.intro_delay)
+        # Choose the questions of the game, and encode its messages once before the first round
+        game_questions = self.question_bank.game_questions(MAX_ROUNDS)
+        game_messages = messages.GameMessages({pid: player.name for pid, player in players.items()},
+                                              [self.question_bank.get(qid)[0] for qid in game_questions])
+        self.feed.publish(game_messages.players_list)
+        await send_to_all(players, game_messages.players_list)
+        await asyncio.sleep(self.pacing.players_list_delay)
+
+        i = 1
+        for question_id in game_questions:
+            for player_id, player in list(players.items()):
+                if not player.connected and (getattr(player, 'session', None) is None or not player.has_seat()):
+                    print(f'{player.name} has disconnected from the game.')
+                    players.pop(player_id)
+                    notice = messages.encode_info(f'{player.name} has disconnected from the game.\n')
+                    self.feed.publish(notice)
+                    await send_to_all(players, notice)
+            if len(players) < 2:
+                break
+            next_round = game_messages.round_header(i, players.keys())
+            i += 1
+            in_round = dict(players)
+            res = await play(players, question_id, next_round=next_round, game_messages=game_messages,
+                             pacing=self.pacing, question_bank=self.question_bank, recorder=recorder, feed=self.feed)
+            # The eliminated players watch the rest of the game, the bots are done
+            for player_id, player in in_round.items():
+                if player_id not in players and not is_virtual(player) and not player.bot:
+                    self.spectate(player)
+            if res is True and len(players) == 1:
+                break
+
+        # The final result is sent to the players still connected, and to the eliminated players and the spectators
+        # through the feed
+        finalists = {pid: player for pid, player in all_players.items() if pid not in self.watching}
+        if len(players) == 0:
+            self.feed.close(messages.TIED_FRAME)
+            await send_to_all(finalists, messages.TIED_FRAME)
+            print(f"No players left in room {self.room_id}.\nGame over.\n\n")
+        elif len(players) > 1:
+            print(f"Game is tied in room {self.room_id} !\n")
+            self.feed.close(messages.TIED_FRAME)
+            await send_to_all(finalists, messages.TIED_FRAME)
+        else:
+            name = next(iter(players.values())).name
+            await asyncio.sleep(self.pacing.winner_delay)
+            loop = asyncio.get_running_loop()
+            top_three_players, winner_rank = await loop.run_in_executor(None, record_winner, name)
+            game_over_mess, game_over_frame = game_messages.game_over(name, top_three_players, winner_rank)
+            print(game_over_mess)
+            self.feed.close(game_over_frame)
+            await send_to_all(finalists, game_over_frame)
+            await asyncio.sleep(self.pacing.rankings_delay)
+            print(f"Game over in room {self.room_id}.\n\n")
+        if recorder is not None:
+            recorder.result(next(iter(players)) if len(players) == 1 else None)
+            await asyncio.get_running_loop().run_in_executor(None, self.game_log.append, recorder)
+        self.feed.close()
+        # An eliminated player that stopped reading was dropped by its stream, which closed that connection
+        await asyncio.gather(*self.watching.values())
+        await asyncio.sleep(self.pacing.game_over_delay)
+        # The players with a session stay connected for the next game
+        for player in all_players.values():
+            if getattr(player, 'session', None) is None:
+                player.close()
+
+
+def record_winner(name):
+    """
+    Records the winner in the leaderboard and returns the top three players. Runs in an executor since the
+    leaderboard is written to disk.
+    :param name: name of the winner
+    :return: list of the top three players and their wins, and the winner's rank
+    """
+    with metrics.LEADERBOARD_WRITE.time():
+        leaderboard = get_leaderboard()
+        leaderboard.increment(name)
+        return leaderboard.top(3), leaderboard.rank(name)
+
+
+class AsyncTriviaServer:
+    """
+    A class representing the asyncio server and its room scheduler. Every accepted player is routed into the room
+    that is currently filling. As soon as that room is full or starts its game a new room is opened, so players never
+    have to wait for a running game to finish, and up to max_rooms games are played side by side.
+    """
+
+    def __init__(self, host, port, fill_bots=True, add_bots=0, room_capacity=ROOM_CAPACITY, max_rooms=MAX_ROOMS,
+                 pacing=DEFAULT_PACING, heartbeat=DEFAULT_HEARTBEAT, question_bank=builtin_bank, virtual_bots=True,
+                 load=server_load, game_log=None, reuse_port=False, resume_window=RESUME_WINDOW):
+        """
+        Initialize the AsyncTriviaServer object.
+
+        :param host: The IP address of the server.
+        :param port: The port number to bind the server socket.
+        :param fill_bots: Whether to add bots to the game if there are not enough human players.
+        :param add_bots: The number of additional bots to add to every game.
+        :param room_capacity: The maximum number of players in a room, or None for no limit.
+        :param max_rooms: The maximum number of games played at the same time.
+        :param pacing: The Pacing of the rooms' games.
+        :param heartbeat: The HeartbeatPolicy of the connections.
+        :param question_bank: The bank the questions of the games are chosen from.
+        :param virtual_bots: Whether the bots play inside the server process instead of connecting over TCP.
+        :param load: The ServerLoad sent in the server's offers, kept up to date with the filling room and the games.
+        :param game_log: The GameLog the events of every game are appended to, or None.
+        :param reuse_port: Whether to bind with SO_REUSEPORT, so several worker processes accept on the same port.
+        :param resume_window: Seconds the seat of a player with a session is kept after the connection is lost.
+        """
+        self.host = host
+        self.port = port
+        self.fill_bots = fill_bots
+        self.add_bots = add_bots
+        self.room_capacity = room_capacity
+        self.max_rooms = max_rooms
+        self.pacing = pacing
+        self.heartbeat = heartbeat
+        self.question_bank = question_bank
+        self.virtual_bots = virtual_bots
+        self.load = load
+        self.game_log = game_log
+        self.reuse_port = reuse_port
+        self.sessions = SessionTable(resume_window)
+        self.load.capacity = room_capacity or 0
+        self.connections = {}
+        self.heartbeat_task = None
+        self.next_id = 0
+        self.next_room_id = 0
+        self.filling = None
+        # room id -> Room, of the rooms filling or playing their game
+        self.rooms = {}
+        self.waiting_rooms = collections.deque()
+        self.bot_rooms = collections.deque()
+        self.games = set()
+        self.room_slots = None
+
+    def open_room(self):
+        """
+        Opens a new room that accepts the next players.
+        :return: the new Room
+        """
+        self.next_room_id += 1
+        self.filling = Room(self.next_room_id, self.room_capacity, self.pacing, self.question_bank, self.game_log)
+        self.rooms[self.filling.room_id] = self.filling
+        self.waiting_rooms.append(self.filling)
+        self.load.lobby_size = 0
+        self.load.starts_at = None
+        return self.filling
+
+    async def handle_client(self, reader, writer):
+        """
+        Handles a new connection: receives the player's name and routes the player into the filling room. Bots started
+        by the server introduce themselves with a BOT frame and are routed into the room that is waiting for them. A
+        player sending RESUME opens a session, or gets their seat back with the token of their session, and a
+        connection sending WATCH is a spectator.
+        :param reader: asyncio StreamReader of the connection
+        :param writer: asyncio StreamWriter of the connection
+        """
+        self.next_id += 1
+        player = AsyncPlayer(self.next_id, "", reader, writer)
+        if writer.get_extra_info('socket') is not None:
+            tune_keepalive(writer.get_extra_info('socket'), self.heartbeat.dead_after, self.heartbeat.ack_timeout)
+        player.start()
+        self.connections[player.client_id] = player
+        metrics.CONNECTED_PLAYERS.set(len(self.connections))
+        try:
+            frame = await player.receive_frame(LOBBY_TIMEOUT)
+        except asyncio.TimeoutError:
+            player.close()
+            return
+        if frame is None:
+            player.close()
+            return
+        if frame[0] == protocol.WATCH:
+            await self.watch(player, frame[1])
+            return
+        if frame[0] == protocol.RESUME:
+            token, player.name = protocol.decode_resume(frame[1])
+            session = self.sessions.resume(token) if token else None
+            if session is not None:
+                await self.resume(session, player)
+                return
+            player.session = self.sessions.open(player.name, player)
+            player.send(protocol.encode_frame(protocol.SESSION, player.session.token))
+        else:
+            player.name = frame[1]
+            player.bot = frame[0] == protocol.BOT
+        if player.bot and self.bot_rooms:
+            room = self.bot_rooms[0]
+            room.bots_needed -= 1
+            if room.bots_needed <= 0:
+                self.bot_rooms.popleft()
+            room.add(player)
+            await send_to_all(room.lobby, f"Player {player.name} joined the lobby.\n")
+        else:
+            await self.route(player)
+
+    async def route(self, player):
+        """
+        Routes a player into the filling room.
+        :param player: the AsyncPlayer joining
+        """
+        room = self.filling
+        if room.is_full():
+            room = self.open_room()
+        room.add(player)
+        if room is self.filling:
+            self.load.lobby_size = len(room.lobby)
+            self.load.starts_at = time.monotonic() + LOBBY_TIMEOUT
+        if room.is_full() and room is self.filling:
+            self.open_room()
+        await send_to_all(room.lobby, f"Player {player.name} joined the lobby.\n")
+
+    async def resume(self, session, connection):
+        """
+        Gives a returning player their seat back: the player of the session is moved onto the new connection, and
+        stays in the game or lobby they were in.
+        :param session: the Session of the player
+        :param connection: the AsyncPlayer of the new connection
+        """
+        player = session.player
+        # The new connection is read by the player of the session from now on
+        connection.reader_task.cancel()
+        await asyncio.wait([connection.reader_task])
+        self.connections.pop(connection.client_id, None)
+        if player.connected:
+            # The server did not notice the old connection was lost yet
+            player.close()
+        await asyncio.wait([player.reader_task])
+        player.attach(connection.reader, connection.writer)
+        # What the new connection sent after RESUME, like an answer, was read by its own reader
+        while not connection.inbox.empty():
+            frame = connection.inbox.get_nowait()
+            if frame is not None:
+                player.inbox.put_nowait(frame)
+        session.attach(player)
+        self.connections[player.client_id] = player
+        print(f"Player {player.name} reconnected.\n")
+        player.send(protocol.encode_frame(protocol.SESSION, session.token))
+        if player.room is None:
+            await self.route(player)
+        else:
+            player.send(messages.WELCOME_BACK_FRAME)
+            if player.question is not None:
+                # The round is waiting for the player's answer: the question is asked again with the time left
+                question, deadline = player.question
+                player.send(messages.resumed_question(question, deadline - asyncio.get_running_loop().time()))
+            stream = player.room.watching.get(player.client_id)
+            if stream is not None and stream.done() and not player.room.feed.closed:
+                # The stream of an eliminated player failed with the lost connection, it goes on with the game
+                player.room.spectate(player)
+            await player.flush()
+
+    async def watch(self, spectator, room_id):
+        """
+        Streams the feed of a room to a spectator until the room's game is over.
+        :param spectator: the AsyncPlayer of the spectator's connection
+        :param room_id: id of the room to watch, or '' for the filling room
+        """
+        self.connections.pop(spectator.client_id, None)
+        room = self.rooms.get(int(room_id)) if room_id.isdigit() else None
+        if room is None:
+            room = self.filling
+        spectator.send(protocol.encode_frame(protocol.INFO, f'You are watching room {room.room_id}.\n'))
+        # A spectator of a running game starts with the oldest frames of the feed
+        await stream_feed(room.feed, spectator)
+        spectator.close()
+
+    async def keep_sessions(self, room):
+        """
+        Routes the players with a session into the next lobby when the game of their room is over. A player whose
+        connection is lost is routed when they resume their session.
+        :param room: the Room whose game is over
+        """
+        for player in list(room.lobby.values()):
+            if getattr(player, 'session', None) is None:
+                continue
+            player.room = None
+            if player.connected:
+                player.discard_pending()
+                await self.route(player)
+
+    async def run_room(self, room):
+        """
+        Adds the bots a room needs and runs its game.
+        :param room: the Room to run
+        """
+        try:
+            missing = MIN_PLAYERS - len(room.lobby) if self.fill_bots else 0
+            if missing > 0:
+                print('Not enough players. Adding bots to the game.')
+                await send_to_all(room.lobby, messages.NOT_ENOUGH_PLAYERS_FRAME)
+            room.bots_needed = max(missing, 0) + self.add_bots
+            if room.bots_needed > 0 and self.virtual_bots:
+                # Virtual bots join the lobby at once, without a connection
+                for _ in range(room.bots_needed):
+                    self.next_id += 1
+                    bot = VirtualPlayer(self.next_id, random.choice(bot_names))
+                    room.add(bot)
+                    await send_to_all(room.lobby, f"Player {bot.name} joined the lobby.\n")
+                room.bots_needed = 0
+            elif room.bots_needed > 0:
+                self.bot_rooms.append(room)
+                for _ in range(room.bots_needed):
+                    bot = Bot(random.choice(bot_names), address=self.host, server_port=self.port, isBot=True)
+                    threading.Thread(target=bot.run, daemon=True).start()
+                await room.wait_for_bots()
+                if room in self.bot_rooms:
+                    self.bot_rooms.remove(room)
+            players = {player_id: player for player_id, player in room.lobby.items() if player.connected}
+            await room.run_game(players)
+            await self.keep_sessions(room)
+        finally:
+            room.feed.close()
+            self.rooms.pop(room.room_id, None)
+            self.room_slots.release()
+
+    def game_done(self, game):
+        """
+        Forgets a finished game.
+        :param game: the task of the game
+        """
+        self.games.discard(game)
+        self.load.games_in_progress = len(self.games)
+
+    async def heartbeat_loop(self):
+        """
+        Pings every connected player at the heartbeat interval, and closes the connections of the players that were
+        not heard from within the heartbeat bound.
+        """
+        while True:
+            await asyncio.sleep(self.heartbeat.interval)
+            for session in self.sessions.expire():
+                print(f"{session.name} did not come back in time and lost their seat.")
+            now = time.monotonic()
+            for player in list(self.connections.values()):
+                if not player.connected:
+                    self.connections.pop(player.client_id, None)
+                elif self.heartbeat.is_dead(player.last_seen, now):
+                    print(f"{player.name} stopped responding and was disconnected.")
+                    player.close()
+                    self.connections.pop(player.client_id, None)
+                else:
+                    player.send(protocol.PING_FRAME)
+            metrics.CONNECTED_PLAYERS.set(len(self.connections))
+
+    async def serve(self):
+        """
+        Accepts players and runs games forever. The filling room is closed when it is full or its fill window expires,
+        a new room is opened right away, and the closed room plays its game in its own task.
+        """
+        self.room_slots = asyncio.Semaphore(self.max_rooms)
+        self.open_room()
+        server = await asyncio.start_server(self.handle_client, self.host, self.port, reuse_address=True,
+                                            reuse_port=self.reuse_port or None)
+        self.heartbeat_task = asyncio.create_task(self.heartbeat_loop())
+        async with server:
+            while True:
+                room = self.waiting_rooms[0]
+                await room.wait_for_lobby()
+                metrics.LOBBY_FILL.observe(time.monotonic() - room.opened_at)
+                self.waiting_rooms.popleft()
+                if room is self.filling:
+                    self.open_room()
+                await self.room_slots.acquire()
+                game = asyncio.create_task(self.run_room(room))
+                self.games.add(game)
+                game.add_done_callback(self.game_done)
+                self.load.games_in_progress = len(self.games)
+
+
+def run_async_server(host, port, fill_bots=True, add_bots=0, room_capacity=ROOM_CAPACITY, max_rooms=MAX_ROOMS,
+                     pacing=DEFAULT_PACING, heartbeat=DEFAULT_HEARTBEAT, question_bank=builtin_bank, virtual_bots=True,
+                     game_log=None):
+    """
+    Runs the asyncio server until interrupted.
+
+    Args:
+    - host (str): The IP address of the server.
+    - port (int): The port number to bind the server socket.
+    - fill_bots (bool): Whether to add bots to the game if there are not enough human players (default=True).
+    - add_bots (int): The number of additional bots to add to the game (default=0).
+    - room_capacity (int): The maximum number of players in a room (default=ROOM_CAPACITY).
+    - max_rooms (int): The maximum number of games played at the same time (default=MAX_ROOMS).
+    - pacing (Pacing): The delays and answer window of the games (default=DEFAULT_PACING).
+    - heartbeat (HeartbeatPolicy): The bound within which dead connections are detected (default=DEFAULT_HEARTBEAT).
+    - question_bank: The bank the questions of the games are chosen from (default=builtin_bank).
+    - virtual_bots (bool): Whether the bots play inside the server process instead of connecting over TCP
+      (default=True).
+    - game_log (GameLog): The log the events of every game are appended to (default=None, the games are not logged).
+    """
+    try:
+        asyncio.run(AsyncTriviaServer(host, port, fill_bots, add_bots, room_capacity, max_rooms, pacing,
+                                      heartbeat, question_bank, virtual_bots, game_log=game_log).serve())
+    except KeyboardInterrupt:
+        print("Shutting down the server... Goodbye!")
+
+
+if __name__ == "__main__":
+    # Start the server
+    try:
+        host, port = startup()
+        thread_a = threading.Thread(target=udp_broadcast, daemon=True)
+        thread_a.start()
+        time.sleep(0.5)
+        # An optional JSONL or CSV question bank can be given on the command line
+        bank = open_question_bank(sys.argv[1]) if len(sys.argv) > 1 else builtin_bank
+        run_async_server(host, port, False, 2, question_bank=bank, game_log=GameLog(GAME_LOG_FILE))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Server is shutting down...Goodbye!")
@@ -0,0 +1,100 @@
+import threading
+import warnings
+
+"""
+This module implements the audio asset manager of the client.
+
+Playing a sound used to initialize the pygame mixer and decode the WAV file from disk every time, so every round
+stalled the client while drum_roll.wav (3.5 MB) was read and decoded again. A SoundBank initializes the mixer once and
+decodes every sound file once; the Sound objects are cached and replayed. The sounds can be preloaded in the
+background when the client starts, so the first round does not stall either.
+
+When audio is disabled, pygame is missing or the mixer cannot be opened (no audio device), the SoundBank does nothing,
+so the client plays on silently.
+
+The module includes the following functionalities:
+- SoundBank: Loads, caches and plays the sounds of the game.
+"""
+
+SOUND_FILES = ('drum_roll.wav', 'win_sound.wav')
+
+
+class SoundBank:
+    """
+    Loads every sound once and plays the cached Sound objects. Does nothing when audio is unavailable.
+    """
+
+    def __init__(self, enabled=True):
+        """
+        Initialize the SoundBank object. The mixer is only initialized when the first sound is loaded.
+
+        :param enabled: whether to play sounds at all
+        """
+        self.enabled = enabled
+        self.mixer = None
+        self.sounds = {}
+        self.lock = threading.Lock()
+
+    def init(self):
+        """
+        Initializes the mixer, once. Audio is disabled if pygame or an audio device is missing.
+        :return: True if sounds can be played
+        """
+        if self.mixer is None and self.enabled:
+            try:
+                # Filter out the specific warning message
+                warnings.filterwarnings("ignore",
+                                        message="Your system is avx2 capable but pygame was not built with support for it.")
+                import pygame
+
+                pygame.mixer.init()
+                self.mixer = pygame.mixer
+            except Exception:
+                # pygame raises its own pygame.error when there is no audio device
+                self.enabled = False
+        return self.enabled
+
+    def load(self, sound_file):
+        """
+        Get the Sound of a file, decoding the file on first use.
+        :param sound_file: path of the sound file
+        :return: the Sound, or None if audio is unavailable or the file cannot be loaded
+        """
+        with self.lock:
+            if not self.init():
+                return None
+            if sound_file not in self.sounds:
+                try:
+                    self.sounds[sound_file] = self.mixer.Sound(sound_file)
+                except Exception:
+                    # A missing or unreadable file is not played, and not retried
+                    self.sounds[sound_file] = None
+            return self.sounds[sound_file]
+
+    def preload(self, sound_files=SOUND_FILES):
+        """
+        Loads sounds in a background thread, so they are ready before they are first played.
+        :param sound_files: paths of the sound files
+        """
+        if self.enabled:
+            threading.Thread(target=lambda: [self.load(sound_file) for sound_file in sound_files], daemon=True).start()
+
+    def play(self, sound_file):
+        """
+        Play a sound.
+        :param sound_file: path of the sound file
+        :return: the Sound playing, or None
+        """
+        sound = self.load(sound_file)
+        if sound is not None:
+            sound.play()
+        return sound
+
+    @staticmethod
+    def stop(sound):
+        """
+        Stop playing a sound.
+        :param sound: the Sound returned by play, or None
+        """
+        if sound is not None:
+            sound.stop()
@@ -0,0 +1,259 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import protocol
+
+from offers import ServerLoad, pack_offer, parse_offer
+from pacing import NO_PACING
+
+"""
+This script is the benchmark suite of the server's hot paths.
+
+Every benchmark is run several times and its timings are written to a JSON file. Given a baseline JSON file from an
+earlier run, the script compares the medians and exits with status 1 if a benchmark got slower than the allowed
+threshold, so regressions in round latency or leaderboard cost are caught before a deploy.
+
+Benchmarks:
+- send_to_all/<n>: server.send_to_all fan-out of one message to n sockets (10, 100, 1000).
+- play_round/<n>: a full server.play round with n players answering over socketpairs, without the pacing sleeps.
+- update_excel/<rows>, get_top_three_players/<rows>: the legacy Excel leaderboard with 1k and 100k rows.
+- leaderboard_increment/<rows>, leaderboard_top/<rows>: the same operations on the SQLite leaderboard.
+- leaderboard_top100/<rows>, leaderboard_rank/<rows>, leaderboard_around/<rows>: the rankings of the SQLite
+  leaderboard, answered by its in-memory index.
+- udp_offer_pack, udp_offer_unpack: 10000 offers.pack_offer / offers.parse_offer calls on the original UDP offer.
+- udp_load_offer_pack, udp_load_offer_unpack: the same on the load-aware UDP offer.
+
+Usage example:
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --baseline bench.json --threshold 0.2
+"""
+
+def measure(func, repeat, setup=None):
+    """
+    Time a function.
+    :param func: the function to time
+    :param repeat: number of runs
+    :param setup: function called before every run, not timed
+    :return: dict of the timings in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'runs': repeat, 'median': statistics.median(times), 'mean': statistics.fmean(times), 'min': min(times),
+            'max': max(times)}
+
+
+def make_socketpairs(amount):
+    """
+    Create connected socket pairs playing the clients of the server.
+    :param amount: number of pairs
+    :return: dict of client id to the server side socket, and the list of the client side sockets
+    """
+    server_side = {}
+    client_side = []
+    for client_id in range(1, amount + 1):
+        a, b = socket.socketpair()
+        server_side[client_id] = a
+        client_side.append(b)
+    return server_side, client_side
+
+
+def drain(sockets):
+    """
+    Read and discard everything already received on the sockets.
+    :param sockets: list of sockets
+    """
+    for sock in sockets:
+        sock.setblocking(False)
+        try:
+            while sock.recv(65536):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        sock.setblocking(True)
+
+
+def close_all(sockets):
+    for sock in sockets:
+        sock.close()
+
+
+def bench_send_to_all(server, sizes, repeat):
+    results = {}
+    for size in sizes:
+        server_side, client_side = make_socketpairs(size)
+        msg = protocol.encode_frame(protocol.INFO, 'Nobody is eliminated this round! Let"s move to the next round.')
+        results[f'send_to_all/{size}'] = measure(lambda: server.send_to_all(server_side, msg), repeat,
+                                                 setup=lambda: drain(client_side))
+        close_all(server_side.values())
+        close_all(client_side)
+    return results
+
+
+def answering_client(sock, answer):
+    """
+    A minimal client answering every question, until the connection is closed.
+    :param sock: the client side socket
+    :param answer: the answer to send
+    """
+    reader = protocol.FrameReader(sock)
+    try:
+        while True:
+            frame = reader.read_frame()
+            if frame is None:
+                return
+            if frame[0] == protocol.QUESTION:
+                sock.sendall(protocol.encode_frame(protocol.ANSWER, answer))
+    except OSError:
+        return
+
+
+def bench_play_round(server, sizes, repeat):
+    results = {}
+    question_id = next(qid for qid in range(len(server.builtin_bank)) if server.builtin_bank.get(qid)[1])
+    # Every player answers correctly, so nobody is eliminated and the round can be replayed
+    for size in sizes:
+        server_side, client_side = make_socketpairs(size)
+        clients = [threading.Thread(target=answering_client, args=(sock, 'T'), daemon=True) for sock in client_side]
+        for t in clients:
+            t.start()
+        names = {client_id: f'player_{client_id}' for client_id in server_side}
+        # The round's console output is discarded so it does not dominate the timings
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[f'play_round/{size}'] = measure(
+                lambda: server.play(dict(server_side), dict(names), question_id, [], next_round='Round 1',
+                                    pacing=NO_PACING), repeat)
+        close_all(server_side.values())
+        for t in clients:
+            t.join()
+        close_all(client_side)
+    return results
+
+
+def make_workbook(filename, rows):
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append([None, None])
+    for i in range(rows):
+        ws.append([f'player_{i}', i % 50 + 1])
+    wb.save(filename)
+
+
+def bench_leaderboards(server, sizes, repeat, workdir):
+    from leaderboard import SQLiteLeaderboard
+
+    results = {}
+    for rows in sizes:
+        label = f'{rows // 1000}k'
+        excel = os.path.join(workdir, f'winners_{label}.xlsx')
+        make_workbook(excel, rows)
+        results[f'update_excel/{label}'] = measure(lambda: server.update_excel(excel, f'player_{rows // 2}'), repeat)
+        results[f'get_top_three_players/{label}'] = measure(lambda: server.get_top_three_players(excel), repeat)
+
+        board = SQLiteLeaderboard(os.path.join(workdir, f'winners_{label}.db'))
+        for i in range(rows):
+            board.increment(f'player_{i}', i % 50 + 1)
+        results[f'leaderboard_increment/{label}'] = measure(lambda: board.increment(f'player_{rows // 2}'), repeat)
+        results[f'leaderboard_top/{label}'] = measure(lambda: board.top(3), repeat)
+        results[f'leaderboard_top100/{label}'] = measure(lambda: board.top(100), repeat)
+        results[f'leaderboard_rank/{label}'] = measure(lambda: board.rank(f'player_{rows // 3}'), repeat)
+        results[f'leaderboard_around/{label}'] = measure(lambda: board.around(rows // 2), repeat)
+        board.close()
+    return results
+
+
+def bench_udp_offer(server, repeat):
+    name = server.pad_server_name('Lucky Bunnies')
+    load = ServerLoad(capacity=32)
+    load.lobby_size = 12
+    load.games_in_progress = 3
+    load.starts_at = time.monotonic() + 20
+    results = {}
+    for label, offer_load in (('udp_offer', None), ('udp_load_offer', load)):
+        packed = pack_offer(name, 40000, offer_load)
+
+        def pack(offer_load=offer_load):
+            for _ in range(10000):
+                pack_offer(name, 40000, offer_load)
+
+        def unpack(packed=packed):
+            for _ in range(10000):
+                parse_offer(packed, '127.0.0.1')
+
+        results[f'{label}_pack'] = measure(pack, repeat)
+        results[f'{label}_unpack'] = measure(unpack, repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare the medians of the results with a baseline.
+    :param results: dict of benchmark name to timings
+    :param baseline: dict of benchmark name to timings of the baseline run
+    :param threshold: allowed relative slowdown, e.g. 0.2 for 20%
+    :return: list of (name, baseline median, new median) of the regressions
+    """
+    regressions = []
+    for name, timings in sorted(results.items()):
+        if name not in baseline:
+            continue
+        old, new = baseline[name]['median'], timings['median']
+        change = (new - old) / old if old else 0.0
+        print(f'{name:35} {old * 1000:12.3f} ms -> {new * 1000:12.3f} ms  {change:+8.1%}')
+        if change > threshold:
+            regressions.append((name, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite of the Trivia King server's hot paths.")
+    parser.add_argument('--output', default='bench_results.json', help='JSON file to write the results to')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed relative slowdown of a median before it is a regression (default=0.2)')
+    parser.add_argument('--repeat', type=int, default=5, help='runs of every benchmark (default=5)')
+    parser.add_argument('--quick', action='store_true', help='skip the 1000 socket and 100k row sizes')
+    args = parser.parse_args()
+
+    import server
+
+    socket_sizes = [10, 100] if args.quick else [10, 100, 1000]
+    row_sizes = [1000] if args.quick else [1000, 100000]
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        results.update(bench_send_to_all(server, socket_sizes, args.repeat))
+        results.update(bench_play_round(server, socket_sizes, args.repeat))
+        results.update(bench_leaderboards(server, row_sizes, args.repeat, workdir))
+        results.update(bench_udp_offer(server, args.repeat))
+
+    for name, timings in sorted(results.items()):
+        print(f"{name:35} median {timings['median'] * 1000:12.3f} ms")
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}')
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
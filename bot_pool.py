@@ -0,0 +1,125 @@
+import random
+import socket
+import threading
+
+import protocol
+
+from Bot import Bot
+
+from heartbeat import is_connection_alive
+
+"""
+This module implements the warm bot pool of the threaded server.
+
+A game that needed bots used to start a new Bot client per bot, accept its connection and wait for its handshake, one
+bot after the other, while the players waited for the game to start. The pool keeps bot connections that are already
+connected and identified: a game takes the bots it needs in one call, and gives them back when it is over, since a
+pooled bot stays connected between games. The pool is refilled on demand, so the bot fill time of a game does not
+depend on how many bots it needs.
+
+Pooled bots are connected to the server over socket pairs rather than through the listening socket, so the pool never
+competes with the lobby for incoming connections and a human can never be taken for a bot.
+
+The module includes the following functionalities:
+- BotPool: A pool of bot connections that stay connected between games.
+"""
+
+DRAIN_SIZE = 65536
+
+
+class BotPool:
+    """
+    A pool of bot connections that stay connected between games.
+    """
+
+    def __init__(self, names, size=8):
+        """
+        Initialize the BotPool object.
+
+        :param names: names to choose the bots' names from
+        :param size: number of idle bots the pool keeps ready
+        """
+        self.names = names
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def spawn(self):
+        """
+        Starts a new bot and completes its handshake.
+        :return: (socket, name) of the bot, or None if the handshake failed
+        """
+        server_side, bot_side = socket.socketpair()
+        bot = Bot(random.choice(self.names), address=None, server_port=None, isBot=True)
+        threading.Thread(target=bot.play_connection, args=(bot_side,), daemon=True).start()
+        try:
+            frame = protocol.recv_frame(server_side)
+        except OSError:
+            frame = None
+        if frame is None or frame[0] != protocol.BOT:
+            server_side.close()
+            return None
+        return server_side, frame[1]
+
+    def fill(self):
+        """
+        Starts bots until the pool holds size idle bots.
+        """
+        with self.lock:
+            while len(self.idle) < self.size:
+                connection = self.spawn()
+                if connection is not None:
+                    self.idle.append(connection)
+
+    def take(self, count):
+        """
+        Takes bots out of the pool, starting new ones if the pool does not hold enough.
+        :param count: number of bots
+        :return: list of (socket, name) of the bots
+        """
+        with self.lock:
+            taken = []
+            while self.idle and len(taken) < count:
+                sock, name = self.idle.pop()
+                if is_connection_alive(sock):
+                    taken.append((sock, name))
+                else:
+                    sock.close()
+            while len(taken) < count:
+                connection = self.spawn()
+                if connection is not None:
+                    taken.append(connection)
+            return taken
+
+    def release(self, connections):
+        """
+        Gives bots back to the pool at the end of a game. Messages the bots sent but the game did not read are
+        discarded, and bots that disconnected or exceed the size of the pool are closed.
+        :param connections: list of (socket, name) of the bots
+        """
+        with self.lock:
+            for sock, name in connections:
+                if len(self.idle) < self.size and is_connection_alive(sock) and self.discard_pending(sock):
+                    self.idle.append((sock, name))
+                else:
+                    sock.close()
+
+    @staticmethod
+    def discard_pending(sock):
+        """
+        Discards the data received on a bot's socket but not read, like PONG frames.
+        :param sock: the bot's socket
+        :return: False if the connection was closed
+        """
+        timeout = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            while True:
+                if sock.recv(DRAIN_SIZE) == b'':
+                    return False
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.settimeout(timeout)
@@ -1,16 +1,40 @@
+import os
+import selectors
 import socket
-import struct
+import sys
 import threading
 import time
-import warnings
 
-# Filter out the specific warning message
-warnings.filterwarnings("ignore", message="Your system is avx2 capable but pygame was not built with support for it.")
+import protocol
 
-import pygame
-from colorama import Fore
+from audio import SoundBank
 
-LISTEN_PORT = 13117
+from colors import Fore
+
+from offers import LOAD_OFFER_PORT, OFFER_PORT, choose_offer, parse_offer
+
+LISTEN_PORT = OFFER_PORT
+OFFER_WINDOW = 2
+ANSWER_TIMEOUT = 10
+# Seconds the client keeps trying to get its seat back after the connection is lost, and between two tries
+RESUME_TIMEOUT = 10
+RESUME_RETRY = 1
+
+
+def open_answer_input(selector):
+    """
+    Registers the standard input with the selector, so typed answers are read together with the server's messages.
+    :param selector: the selector of the TCP connection
+    :return: True if the standard input was registered, False if it cannot be selected (on Windows, select only
+             accepts sockets, and epoll refuses regular files)
+    """
+    if sys.platform == 'win32' or sys.stdin is None:
+        return False
+    try:
+        selector.register(sys.stdin.fileno(), selectors.EVENT_READ)
+    except (AttributeError, ValueError, OSError):
+        return False
+    return True
 
 """
 A class representing a client for the networking game. The client runs forever, until the user interrupts the program.
@@ -21,25 +45,35 @@ class Client:
     Initialize the Client object.
 
     :param name: The name of the client.
+    :param offer_window: Seconds to listen for offers before choosing the least busy server, or 0 to connect to the
+                         first offer heard.
+    :param headless: Whether to play without audio, so pygame is never imported (default=the TRIVIA_HEADLESS
+                     environment variable).
+    :param watch: Whether to watch the games as a spectator instead of playing.
     """
-    def __init__(self, name):
+    def __init__(self, name, offer_window=0, headless=None, watch=False):
         self.name = name
+        self.watch = watch
+        self.offer_window = offer_window
+        if headless is None:
+            headless = os.environ.get('TRIVIA_HEADLESS', '') not in ('', '0')
+        self.headless = headless
+        self.audio = SoundBank(enabled=not headless)
         self.first = True
         self.address = 0
         self.server_port = 0
         self.disconnect = False
+        # The session token given by the server, which keeps the player connected between games
+        self.token = None
 
     """
-    Play a sound.
+    Play a sound. The sound is decoded once and then replayed from the client's SoundBank.
 
     :param sound_file: The file path of the sound.
-    :return: The pygame Sound object.
+    :return: The pygame Sound object, or None if audio is unavailable.
     """
     def play_sound(self, sound_file):
-        pygame.mixer.init()  # Initialize the mixer
-        sound = pygame.mixer.Sound(sound_file)  # Load the WAV file
-        sound.play()
-        return sound
+        return self.audio.play(sound_file)
 
     def stop_sound(self, sound):
         """
@@ -47,8 +81,7 @@ class Client:
 
                 :param sound: The pygame Sound object to stop.
             """
-        if sound:
-            sound.stop()
+        self.audio.stop(sound)
 
     def receive_udp_message(self):
         """
@@ -57,32 +90,43 @@ class Client:
                 The offer includes a magic cookie, offer message, server name, and server port.
                 If the magic cookie and message type are correct, the client attempts to connect to the server through TCP
                 using the provided server port and address.
+                With an offer window, the client keeps listening for offer_window seconds after the first offer, and
+                connects to the least busy of the servers it heard. The original offers and the load-aware offers
+                are received on their own ports.
         """
-        # Create a UDP socket
+        # Create a UDP socket for each kind of offer
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                sock.bind(('', LISTEN_PORT))  # Bind to all available interfaces
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock, \
+                    socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as load_sock, \
+                    selectors.DefaultSelector() as selector:
+                for udp_socket, port in ((sock, LISTEN_PORT), (load_sock, LOAD_OFFER_PORT)):
+                    udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                    udp_socket.bind(('', port))  # Bind to all available interfaces
+                    selector.register(udp_socket, selectors.EVENT_READ)
 
                 if self.first:
                     print(Fore.YELLOW + "Client started, listening for offer requests...")
 
-                # Receive data from the socket
-                while True:
-                    sock.setblocking(True)
-                    data, address = sock.recvfrom(1024)
-                    address = address[0]
-                    magic_cookie, message_type, server_name, server_port = struct.unpack('!IB32sH', data)
-                    server_name = server_name.rstrip(b'\0').decode('utf-8')
-                    if magic_cookie != 0xabcddcba or message_type != 0x2:
-                        continue
-                    else:
-                        print(
-                            Fore.CYAN + f"Received offer from server '{server_name}' at address {address}, attempting to connect...")
-                        self.address = address
-                        self.server_port = server_port
+                # Receive data from the sockets
+                offers = []
+                deadline = None
+                while deadline is None or time.monotonic() < deadline:
+                    ready = selector.select(None if deadline is None else max(0.001, deadline - time.monotonic()))
+                    if not ready:
                         break
-            sock.close()
+                    for key, _ in ready:
+                        data, address = key.fileobj.recvfrom(1024)
+                        offer = parse_offer(data, address[0])
+                        if offer is None:
+                            continue
+                        offers.append(offer)
+                        if deadline is None:
+                            deadline = time.monotonic() + self.offer_window
+                offer = choose_offer(offers)
+                print(
+                    Fore.CYAN + f"Received offer from server '{offer.server_name}' at address {offer.address}, attempting to connect...")
+                self.address = offer.address
+                self.server_port = offer.port
         except KeyboardInterrupt:
             self.disconnect = True
             print(Fore.RED + 'Disconnecting.... Goodbye!')
@@ -91,6 +135,7 @@ class Client:
         """
         Get user input with a 10 second timer. If the user has not answered within the 10 seconds, then a default
         answer will be sent back to the server, eliminating the player.
+        Only used where the standard input cannot be selected, see tcp_client.
         :return: user input
         """
         flag = False
@@ -100,7 +145,7 @@ class Client:
             flag = True
             print(Fore.RED + 'Time is up! Enter any input to proceed')
 
-        my_timer = threading.Timer(10, timeout)
+        my_timer = threading.Timer(ANSWER_TIMEOUT, timeout)
         my_timer.start()
         user_input = input(Fore.YELLOW + 'Please enter your answer: \n').strip()
         my_timer.cancel()
@@ -116,68 +161,175 @@ class Client:
                 :param client_socket: The TCP socket connected to the server.
                 """
         answer = self.get_input()
-        client_socket.sendall(answer.encode())
+        client_socket.sendall(protocol.encode_frame(protocol.ANSWER, answer))
+
+    def reconnect(self, host, port):
+        """
+        Reconnects to the server after the connection was lost, so the player gets their seat back with the session
+        token. The client gives up after RESUME_TIMEOUT seconds, and listens for offers again.
 
-    def tcp_client(self, host, port, isBot=False):
+        :param host: The IP address of the server.
+        :param port: The port number of the server.
+        :return: the connected socket, or None
+        """
+        give_up_at = time.monotonic() + RESUME_TIMEOUT
+        try:
+            while time.monotonic() < give_up_at:
+                try:
+                    return socket.create_connection((host, port), timeout=RESUME_RETRY)
+                except OSError:
+                    time.sleep(RESUME_RETRY)
+        except KeyboardInterrupt:
+            self.disconnect = True
+        self.token = None
+        return None
+
+    def tcp_client(self, host, port, isBot=False, connection=None, deadline=None):
         """
                 Connect to the server via TCP and handle communication.
+                A player opens a session with the server: the connection is kept between games, and a lost
+                connection is resumed with the session token.
 
                 :param host: The IP address of the server.
                 :param port: The port number of the server.
                 :param isBot: Boolean indicating whether the client is a bot.
+                :param connection: A socket already connected to the server, when resuming the session.
+                :param deadline: The time.monotonic() time at which the answer to the pending question is due, when
+                                 the session is resumed during a question.
         """
+        sound = None
+        redirect = None
+        lost = False
         try:
             # Create a TCP/IP socket
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
+            with connection or socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
                 try:
-                    client_socket.connect((host, port))
-                    client_socket.sendall(self.name.encode())
-                    while True:
-                        client_socket.settimeout(None)
-                        data = client_socket.recv(1024)
-                        if data.decode().startswith("Game over!") or data.decode().startswith("Game is tied"):
-                            if not isBot:
-                                print(Fore.RED + data.decode())
-                                self.stop_sound(sound)
-                                if f'Congratulations to the winner: {self.name}' in data.decode():
-                                    self.play_sound('win_sound.wav')
-                            if isBot:
-                                self.disconnect = True
-                            break
-                        elif data.decode().startswith(f"True or False:"):
-                            if not isBot:
-                                print(Fore.CYAN + data.decode())
-                            self.answering_questions(client_socket)
-                        elif data.decode() != "":
-                            if not isBot:
-                                print(Fore.LIGHTMAGENTA_EX + data.decode())
-                                if data.decode().startswith('Round'):
-                                    sound = self.play_sound('drum_roll.wav')
-                                if data.decode().startswith('Sorry'):
-                                    self.stop_sound(sound)
-
-                        elif data.decode() == "":
-                            break
+                    if connection is None:
+                        client_socket.connect((host, port))
+                    client_socket.settimeout(None)
+                    if self.watch:
+                        client_socket.sendall(protocol.encode_frame(protocol.WATCH, ''))
+                    elif isBot:
+                        client_socket.sendall(protocol.encode_frame(protocol.BOT, self.name))
+                    else:
+                        client_socket.sendall(protocol.encode_frame(
+                            protocol.RESUME, protocol.encode_resume(self.token or '', self.name)))
+                    reader = protocol.FrameReader(client_socket)
+                    with selectors.DefaultSelector() as selector:
+                        selector.register(client_socket, selectors.EVENT_READ)
+                        # A human's answers are read in this loop too, so the client keeps handling the server's
+                        # messages while the player types, and the answer is sent as soon as it is entered
+                        prompt = not isBot and open_answer_input(selector)
+                        typed = bytearray()
+                        done = False
+                        while not done:
+                            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+                            # The server's messages are read first, so a lost connection is noticed before any
+                            # answer is sent on it: what was typed is then left for the resumed connection
+                            events = selector.select(timeout)
+                            for key, _ in sorted(events, key=lambda event: event[0].fileobj is not client_socket):
+                                if key.fileobj is client_socket:
+                                    done = lost = not reader.receive()
+                                    continue
+                                if lost:
+                                    break
+                                data = os.read(key.fd, 1024)
+                                if data == b'':
+                                    # The standard input was closed, the questions will time out
+                                    selector.unregister(key.fd)
+                                typed += data
+                                while b'\n' in typed:
+                                    line, _, typed[:] = typed.partition(b'\n')
+                                    # A line typed while no question is asked is dropped, so it never answers the
+                                    # next question
+                                    if deadline is not None:
+                                        answer = line.decode(errors='replace').strip()
+                                        client_socket.sendall(protocol.encode_frame(protocol.ANSWER, answer))
+                                        deadline = None
+                            if deadline is not None and time.monotonic() >= deadline:
+                                print(Fore.RED + 'Time is up!')
+                                client_socket.sendall(protocol.encode_frame(protocol.ANSWER, 'NONE'))
+                                deadline = None
+                            while not done:
+                                frame = reader.pop_frame()
+                                if frame is None:
+                                    break
+                                msg_type, message = frame
+                                if msg_type == protocol.PING:
+                                    client_socket.sendall(protocol.PONG_FRAME)
+                                elif msg_type == protocol.REDIRECT:
+                                    # A cluster coordinator sends the client to the node it should play on
+                                    node_host, _, node_port = message.rpartition(':')
+                                    redirect = (node_host, int(node_port))
+                                    done = True
+                                elif msg_type == protocol.SESSION:
+                                    self.token = message
+                                elif msg_type == protocol.GAME_OVER:
+                                    if not isBot:
+                                        print(Fore.RED + message)
+                                        self.stop_sound(sound)
+                                        if f'Congratulations to the winner: {self.name}' in message:
+                                            self.play_sound('win_sound.wav')
+                                    if isBot:
+                                        self.disconnect = True
+                                    if self.token is not None:
+                                        # The server keeps the session, and moves the player into the next lobby
+                                        print(Fore.YELLOW + 'Staying connected for the next game...\n')
+                                        deadline = None
+                                    else:
+                                        done = True
+                                elif msg_type == protocol.QUESTION:
+                                    if not isBot:
+                                        print(Fore.CYAN + message)
+                                    if prompt:
+                                        print(Fore.YELLOW + 'Please enter your answer: ')
+                                        # A question asked again after resuming the session keeps its deadline
+                                        if deadline is None:
+                                            deadline = time.monotonic() + ANSWER_TIMEOUT
+                                    else:
+                                        self.answering_questions(client_socket)
+                                elif not isBot:
+                                    print(Fore.LIGHTMAGENTA_EX + message)
+                                    if msg_type == protocol.ROUND:
+                                        sound = self.play_sound('drum_roll.wav')
+                                    elif msg_type == protocol.ELIMINATED:
+                                        self.stop_sound(sound)
                 except ConnectionRefusedError:
                     print(Fore.YELLOW + "Game currently in progress. Trying again in 10 seconds....\n")
                     time.sleep(10)
 
         except (OSError, UnboundLocalError):
-            pass
+            lost = True
         except (KeyboardInterrupt,UnboundLocalError):
             self.disconnect = True
 
         finally:
             client_socket.close()
             self.first = False
-            if not isBot:
+            resuming = lost and self.token is not None and not self.disconnect
+            if not isBot and redirect is None:
                 if self.disconnect:
                     print(Fore.RED + 'Shutting down client.... Goodbye!')
+                elif resuming:
+                    print(Fore.YELLOW + 'Connection lost, reconnecting to keep your seat...\n')
                 else:
                     print(Fore.RED + 'Server disconnected, listening for offer requests...\n\n')
                 self.stop_sound(sound)
+        if redirect is not None:
+            if not isBot:
+                print(Fore.CYAN + f"Redirected to the game server at {redirect[0]}:{redirect[1]}...")
+            self.tcp_client(redirect[0], redirect[1], isBot=isBot)
+        elif resuming:
+            connection = self.reconnect(host, port)
+            if connection is not None:
+                # A question asked before the connection was lost is still waiting for its answer
+                self.tcp_client(host, port, isBot=isBot, connection=connection, deadline=deadline)
+            elif not self.disconnect:
+                print(Fore.RED + 'Could not reconnect, listening for offer requests...\n\n')
 
     def run(self):
+        # Decode the sounds while waiting for an offer, so the first round does not stall
+        self.audio.preload()
         while not self.disconnect:
             self.receive_udp_message()
             if not self.disconnect:
@@ -186,7 +338,8 @@ class Client:
 
 if __name__ == "__main__":
     player_name = 'gab'
-    client = Client(player_name)
+    client = Client(player_name, offer_window=OFFER_WINDOW, headless=True if '--headless' in sys.argv else None,
+                    watch='--watch' in sys.argv)
     client.run()
 
 
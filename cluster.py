@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import threading
+import time
+
+import protocol
+
+from async_server import AsyncTriviaServer
+from offers import NO_CAPACITY, UNKNOWN_START, ServerLoad
+from server import startup, udp_broadcast
+
+"""
+This script implements the cluster mode of the Trivia King server.
+
+A single server process is limited by the CPU and the sockets one Python process can use. In cluster mode several
+server nodes, on one host or several, share a lightweight coordinator:
+- Every node is an asyncio server (async_server.AsyncTriviaServer) that reports its load to the coordinator over a
+  REPORT frame every REPORT_INTERVAL seconds: the size and capacity of its filling lobby, its games in progress and
+  the estimated start of its next game.
+- The coordinator is the server the clients know about: it broadcasts the UDP offers. A client connecting to it sends
+  its name as usual, and receives a REDIRECT frame with the address of the node to play on. The client then connects
+  to that node, so the coordinator never carries game traffic.
+
+The coordinator sends players to the node whose lobby is filling, so lobbies fill up and start quickly, and only opens
+the lobby of another node when no lobby is filling. A node that stops reporting is forgotten.
+
+The script includes the following functionalities:
+- NodeState: The last load reported by a node.
+- Coordinator: Tracks the nodes and redirects the arriving clients.
+- report_load: Reports the load of a node to the coordinator.
+- run_node: Runs a node of the cluster.
+- run_local_cluster: Runs a coordinator and several nodes on localhost, for testing.
+
+Usage example:
+    python cluster.py coordinator --port 5000
+    python cluster.py node --port 5001 --coordinator 127.0.0.1:5000
+    python cluster.py local --nodes 3 --port 5000
+"""
+
+REPORT_INTERVAL = 1
+REPORT_TIMEOUT = 5
+NO_NODES = 'No game servers are available, please try again later.\n'
+
+
+class NodeState:
+    """
+    The last load reported by a node.
+    """
+
+    def __init__(self, host, port):
+        """
+        Initialize the NodeState object.
+
+        :param host: address the node accepts players on
+        :param port: port the node accepts players on
+        """
+        self.host = host
+        self.port = port
+        self.lobby_size = 0
+        self.capacity = NO_CAPACITY
+        self.games_in_progress = 0
+        self.estimated_start = UNKNOWN_START
+        self.last_report = time.monotonic()
+
+    def update(self, report):
+        """
+        Update the state from a report.
+        :param report: dict decoded from the REPORT frame
+        """
+        self.lobby_size = report['lobby_size']
+        self.capacity = report['capacity']
+        self.games_in_progress = report['games_in_progress']
+        self.estimated_start = report['estimated_start']
+        self.last_report = time.monotonic()
+
+    def is_full(self):
+        return self.capacity != NO_CAPACITY and self.lobby_size >= self.capacity
+
+    def rank(self):
+        """
+        Get the rank of the node, lower is better: a lobby with room first, then the fullest filling lobby, then the
+        node running the fewest games.
+        :return: a sortable rank
+        """
+        return int(self.is_full()), int(self.lobby_size == 0), -self.lobby_size, self.games_in_progress
+
+
+class Coordinator:
+    """
+    The coordinator of the cluster: tracks the load of the nodes and redirects the arriving clients to them.
+    """
+
+    def __init__(self, host, port, report_timeout=REPORT_TIMEOUT):
+        """
+        Initialize the Coordinator object.
+
+        :param host: The IP address of the coordinator.
+        :param port: The port number the nodes and the clients connect to.
+        :param report_timeout: Seconds without a report after which a node is forgotten.
+        """
+        self.host = host
+        self.port = port
+        self.report_timeout = report_timeout
+        self.nodes = {}
+
+    def choose_node(self):
+        """
+        Chooses the node the next client plays on, forgetting the nodes that stopped reporting. The chosen lobby is
+        counted one player larger until the node's next report, so a burst of clients is spread correctly.
+        :return: the NodeState, or None if there are no nodes
+        """
+        now = time.monotonic()
+        for key, node in list(self.nodes.items()):
+            if now - node.last_report > self.report_timeout:
+                print(f'Node {node.host}:{node.port} stopped reporting.')
+                self.nodes.pop(key)
+        node = min(self.nodes.values(), key=NodeState.rank, default=None)
+        if node is not None:
+            node.lobby_size += 1
+        return node
+
+    async def handle_connection(self, reader, writer):
+        """
+        Handles a connection: a node reporting its load, or a client to redirect.
+        :param reader: asyncio StreamReader of the connection
+        :param writer: asyncio StreamWriter of the connection
+        """
+        try:
+            frame = await asyncio.wait_for(protocol.read_frame_async(reader), REPORT_TIMEOUT)
+            if frame is None:
+                return
+            if frame[0] == protocol.REPORT:
+                await self.track_node(reader, frame)
+            elif frame[0] in (protocol.NAME, protocol.BOT, protocol.RESUME):
+                # A session is opened by the node the client is redirected to
+                name = protocol.decode_resume(frame[1])[1] if frame[0] == protocol.RESUME else frame[1]
+                node = self.choose_node()
+                if node is None:
+                    writer.write(protocol.encode_frame(protocol.GAME_OVER, NO_NODES))
+                else:
+                    print(f'Redirecting {name} to node {node.host}:{node.port}.')
+                    writer.write(protocol.encode_frame(protocol.REDIRECT, f'{node.host}:{node.port}'))
+                await writer.drain()
+        except (OSError, ValueError, KeyError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    async def track_node(self, reader, frame):
+        """
+        Tracks the reports of a node until its connection is closed.
+        :param reader: asyncio StreamReader of the node's connection
+        :param frame: the first REPORT frame of the node
+        """
+        report = json.loads(frame[1])
+        key = (report['host'], report['port'])
+        node = self.nodes.get(key) or NodeState(*key)
+        self.nodes[key] = node
+        print(f'Node {node.host}:{node.port} joined the cluster.')
+        try:
+            while frame is not None:
+                if frame[0] == protocol.REPORT:
+                    node.update(json.loads(frame[1]))
+                frame = await protocol.read_frame_async(reader)
+        finally:
+            if self.nodes.get(key) is node:
+                print(f'Node {node.host}:{node.port} left the cluster.')
+                self.nodes.pop(key)
+
+    async def serve(self):
+        """
+        Accepts nodes and clients forever.
+        """
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port, reuse_address=True)
+        print(f'Coordinator listening on {self.host}:{self.port}')
+        async with server:
+            await server.serve_forever()
+
+
+async def report_load(host, port, load, coordinator, interval=REPORT_INTERVAL):
+    """
+    Reports the load of a node to the coordinator every interval seconds, reconnecting when the connection is lost.
+    :param host: address the node accepts players on
+    :param port: port the node accepts players on
+    :param load: ServerLoad of the node
+    :param coordinator: (host, port) of the coordinator
+    :param interval: seconds between two reports
+    """
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(*coordinator)
+            try:
+                while True:
+                    report = {'host': host, 'port': port, 'lobby_size': load.lobby_size, 'capacity': load.capacity,
+                              'games_in_progress': load.games_in_progress,
+                              'estimated_start': load.estimated_start()}
+                    writer.write(protocol.encode_frame(protocol.REPORT, json.dumps(report)))
+                    await writer.drain()
+                    await asyncio.sleep(interval)
+            finally:
+                writer.close()
+        except OSError:
+            await asyncio.sleep(interval)
+
+
+async def run_node(host, port, coordinator, fill_bots=True, add_bots=0, **server_options):
+    """
+    Runs a node of the cluster: an asyncio server that reports its load to the coordinator.
+    :param host: The IP address of the node.
+    :param port: The port number of the node.
+    :param coordinator: (host, port) of the coordinator
+    :param fill_bots: Whether to add bots to the game if there are not enough human players.
+    :param add_bots: The number of additional bots to add to every game.
+    :param server_options: other keyword arguments of AsyncTriviaServer
+    """
+    load = ServerLoad()
+    node = AsyncTriviaServer(host, port, fill_bots, add_bots, load=load, **server_options)
+    print(f'Node listening on {host}:{port}, reporting to {coordinator[0]}:{coordinator[1]}')
+    await asyncio.gather(node.serve(), report_load(host, port, load, coordinator))
+
+
+def run_local_cluster(nodes, port, host='127.0.0.1'):
+    """
+    Runs a coordinator and several nodes on localhost, every node in its own process.
+    :param nodes: number of nodes
+    :param port: port of the coordinator; the nodes use the following ports
+    :param host: address of the cluster
+    """
+    processes = [subprocess.Popen([sys.executable, __file__, 'node', '--host', host, '--port', str(port + i),
+                                   '--coordinator', f'{host}:{port}']) for i in range(1, nodes + 1)]
+    try:
+        asyncio.run(Coordinator(host, port).serve())
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(':')
+    return host, int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cluster mode of the Trivia King server.')
+    parser.add_argument('role', choices=['coordinator', 'node', 'local'], help='what to run')
+    parser.add_argument('--host', help='address to listen on (default=the local address)')
+    parser.add_argument('--port', type=int, required=True, help='port to listen on')
+    parser.add_argument('--coordinator', type=parse_address, help='host:port of the coordinator, for a node')
+    parser.add_argument('--nodes', type=int, default=2, help='number of nodes of a local cluster (default=2)')
+    parser.add_argument('--add-bots', type=int, default=0, help='additional bots in every game of a node')
+    parser.add_argument('--no-broadcast', dest='broadcast', action='store_false',
+                        help="don't broadcast the coordinator's UDP offers")
+    args = parser.parse_args()
+    args.host = startup(host=args.host, port=args.port)[0]
+
+    try:
+        if args.role == 'node':
+            if args.coordinator is None:
+                parser.error('a node needs --coordinator')
+            asyncio.run(run_node(args.host, args.port, args.coordinator, add_bots=args.add_bots))
+            return
+        if args.broadcast:
+            # The clients discover the cluster through the coordinator's offers
+            threading.Thread(target=udp_broadcast, kwargs={'load': None, 'port': args.port}, daemon=True).start()
+        if args.role == 'coordinator':
+            asyncio.run(Coordinator(args.host, args.port).serve())
+        else:
+            run_local_cluster(args.nodes, args.port, args.host)
+    except KeyboardInterrupt:
+        print('Shutting down... Goodbye!')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+This module is a lazy stand-in for colorama's Fore.
+
+colorama is only imported the first time a color is used, so importing the client, the bots or the servers does not
+pay for it, and when colorama is not installed the text is printed without colors.
+
+The module includes the following functionalities:
+- Fore: The foreground colors, like colorama.Fore.
+"""
+
+
+class LazyFore:
+    """
+    The foreground colors of colorama, imported on first use. Every color is an empty string without colorama.
+    """
+
+    def __getattr__(self, name):
+        try:
+            from colorama import Fore as fore
+        except ImportError:
+            return ''
+        value = getattr(fore, name)
+        # Cache the color so the next uses skip __getattr__
+        setattr(self, name, value)
+        return value
+
+
+Fore = LazyFore()
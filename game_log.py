@@ -0,0 +1,249 @@
+import os
+import struct
+import threading
+import time
+
+from scoring import NO_ANSWER
+
+"""
+This module implements the game event log of the Trivia King servers.
+
+Nothing about a finished game used to be kept but the winner's win count. A GameRecorder now records the events of a
+game as it is played: the players who joined, the question of every round with its answer, the answer of every player
+with the time it took, the eliminations and the result. When the game is over, its events are appended to the log as
+a single block, so the games a server plays side by side never interleave, a game is never half written and the log
+is only ever appended to.
+
+The log is a compact binary file:
+- A file header: the magic bytes TKGL and the format version.
+- One block per game: a GAME header with the length of the block's events, the time the game started (seconds since
+  the epoch) and its number of events, followed by the events. An event is a one byte event type followed by its
+  fixed size fields, and a name for a JOIN event.
+
+The length of every block is in its header, so the offsets of the games are found by skipping from header to header
+without reading the events (GameLog.offsets), and a game is read by seeking to its offset (GameLog.read_game). The
+games are replayed at full speed by replay.py.
+
+The module includes the following functionalities:
+- Game: The events of a game read from the log.
+- GameRecorder: Records the events of a game while it is played.
+- GameLog: The append-only log of the games of a server.
+"""
+
+GAME_LOG_FILE = 'games.log'
+LOG_MAGIC = b'TKGL'
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct('!4sB')
+GAME = struct.Struct('!IdI')
+
+# Event types
+JOIN = 0x01
+ROUND = 0x02
+ANSWER = 0x03
+ELIMINATED = 0x04
+RESULT = 0x05
+
+# The fields of every event type, after the event type byte
+EVENTS = {
+    JOIN: struct.Struct('!IBB'),  # player id, is a bot, length of the name (followed by the name)
+    ROUND: struct.Struct('!IIB'),  # ms since the game started, question id, correct answer
+    ANSWER: struct.Struct('!IBI'),  # player id, answer code, ms since the question was sent
+    ELIMINATED: struct.Struct('!I'),  # player id
+    RESULT: struct.Struct('!II'),  # ms since the game started, id of the winner or NO_WINNER
+}
+NO_WINNER = 0xffffffff
+
+
+class Game:
+    """
+    The events of a game read from the log.
+    """
+
+    def __init__(self, offset, started):
+        """
+        Initialize the Game object.
+
+        :param offset: offset of the game's block in the log
+        :param started: time the game started, in seconds since the epoch
+        """
+        self.offset = offset
+        self.started = started
+        # player id -> (name, is a bot)
+        self.players = {}
+        # One dict per round, with the keys question_id, answer, at, answers (player id -> (answer code, ms)) and
+        # eliminated (list of player ids)
+        self.rounds = []
+        self.winner = None
+        self.duration = None
+
+
+class GameRecorder:
+    """
+    Records the events of a game while it is played. The events are kept in memory until the game is appended to
+    the log.
+    """
+
+    def __init__(self):
+        """
+        Initialize the GameRecorder object.
+        """
+        self.started = time.time()
+        self.started_at = time.monotonic()
+        self.events = bytearray()
+        self.count = 0
+
+    def add(self, event_type, *fields):
+        self.events.append(event_type)
+        self.events += EVENTS[event_type].pack(*fields)
+        self.count += 1
+
+    def elapsed_ms(self):
+        return min(int((time.monotonic() - self.started_at) * 1000), 0xffffffff)
+
+    def join(self, player_id, name, bot=False):
+        """
+        Records a player of the game.
+        :param player_id: id of the player
+        :param name: name of the player
+        :param bot: whether the player is a bot
+        """
+        name = name.encode('utf-8')[:255]
+        self.add(JOIN, player_id, int(bot), len(name))
+        self.events += name
+
+    def round(self, question_id, answer, round_score, eliminated):
+        """
+        Records a scored round: its question, the answer of every player of the round and the eliminations.
+        :param question_id: id of the question asked
+        :param answer: the correct answer, True or False
+        :param round_score: the scored RoundScore of the round
+        :param eliminated: ids of the players eliminated in the round
+        """
+        self.add(ROUND, self.elapsed_ms(), question_id, int(answer))
+        for player_id, code, answered_at in zip(round_score.player_ids, round_score.codes, round_score.answered_at):
+            delay = 0 if code == NO_ANSWER else min(int((answered_at - round_score.opened_at) * 1000), 0xffffffff)
+            self.add(ANSWER, player_id, code, max(0, delay))
+        for player_id in eliminated:
+            self.add(ELIMINATED, player_id)
+
+    def result(self, winner=None):
+        """
+        Records the result of the game.
+        :param winner: id of the winner, or None if the game ended without a winner
+        """
+        self.add(RESULT, self.elapsed_ms(), NO_WINNER if winner is None else winner)
+
+    def block(self):
+        """
+        :return: the game's block, as appended to the log
+        """
+        return GAME.pack(len(self.events), self.started, self.count) + self.events
+
+
+class GameLog:
+    """
+    The append-only log of the games of a server.
+    """
+
+    def __init__(self, filename):
+        """
+        Initialize the GameLog object. The file is created when the first game is appended.
+
+        :param filename: path of the log
+        """
+        self.filename = filename
+        self.lock = threading.Lock()
+
+    def append(self, recorder):
+        """
+        Appends a recorded game to the log, with a single write.
+        :param recorder: the GameRecorder of the game
+        :return: the offset of the game in the log
+        """
+        block = recorder.block()
+        with self.lock, open(self.filename, 'ab') as f:
+            if f.tell() == 0:
+                f.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION))
+            offset = f.tell()
+            f.write(block)
+        return offset
+
+    def offsets(self):
+        """
+        Get the offsets of the games, reading only the headers of the blocks. A block cut short at the end of the log
+        is ignored.
+        :return: list of the offsets
+        """
+        if not os.path.exists(self.filename):
+            return []
+        offsets = []
+        with open(self.filename, 'rb') as f:
+            self.check_header(f)
+            size = os.fstat(f.fileno()).st_size
+            offset = f.tell()
+            while offset + GAME.size <= size:
+                length = GAME.unpack(f.read(GAME.size))[0]
+                if offset + GAME.size + length > size:
+                    break
+                offsets.append(offset)
+                offset += GAME.size + length
+                f.seek(offset)
+        return offsets
+
+    def read_game(self, offset):
+        """
+        Reads a game.
+        :param offset: offset of the game, from offsets
+        :return: the Game
+        """
+        with open(self.filename, 'rb') as f:
+            f.seek(offset)
+            length, started, count = GAME.unpack(f.read(GAME.size))
+            data = f.read(length)
+        return parse_events(Game(offset, started), data, count)
+
+    def games(self):
+        """
+        Reads every game of the log, in the order they were appended.
+        :return: generator of Game
+        """
+        for offset in self.offsets():
+            yield self.read_game(offset)
+
+    @staticmethod
+    def check_header(f):
+        header = f.read(LOG_HEADER.size)
+        if len(header) < LOG_HEADER.size or LOG_HEADER.unpack(header) != (LOG_MAGIC, LOG_VERSION):
+            raise ValueError(f'{f.name} is not a game log')
+
+
+def parse_events(game, data, count):
+    """
+    Parses the events of a game's block.
+    :param game: the Game to fill
+    :param data: the events of the block
+    :param count: number of events
+    :return: the Game
+    """
+    position = 0
+    for _ in range(count):
+        event_type = data[position]
+        fields = EVENTS[event_type].unpack_from(data, position + 1)
+        position += 1 + EVENTS[event_type].size
+        if event_type == JOIN:
+            player_id, bot, length = fields
+            game.players[player_id] = (data[position:position + length].decode('utf-8', errors='replace'), bool(bot))
+            position += length
+        elif event_type == ROUND:
+            at, question_id, answer = fields
+            game.rounds.append({'question_id': question_id, 'answer': bool(answer), 'at': at, 'answers': {},
+                                'eliminated': []})
+        elif event_type == ANSWER:
+            player_id, code, delay = fields
+            game.rounds[-1]['answers'][player_id] = (code, delay)
+        elif event_type == ELIMINATED:
+            game.rounds[-1]['eliminated'].append(fields[0])
+        elif event_type == RESULT:
+            game.duration, winner = fields
+            game.winner = None if winner == NO_WINNER else winner
+    return game
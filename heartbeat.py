@@ -0,0 +1,107 @@
+import selectors
+import socket
+
+"""
+This module implements the liveness detection of the players' connections.
+
+Sending an empty message does not detect a dead peer: sock.sendall(b"") succeeds whatever the state of the connection,
+so a dead player used to be noticed only after waiting out the answer timeout. Liveness is now detected on three
+levels:
+- The kernel: SO_KEEPALIVE probes idle connections within a configurable bound, and TCP_USER_TIMEOUT fails
+  connections whose sent data is not acknowledged within ack_timeout seconds (tune_keepalive). ack_timeout is shorter
+  than an answer window, so a player whose host vanished during a round is dropped before the answer deadline: the
+  threaded server keeps pinging the players it waits for, which gives the kernel data to time out on.
+- Readability: a socket that is readable but has no data to peek at was closed by its peer (is_connection_alive).
+- The application: the server sends PING frames and the client answers each with a PONG frame. A player that has not
+  sent anything for longer than the dead_after bound is flagged as dead (HeartbeatPolicy). The default bound is
+  shorter than the default answer window, so a silent player is flagged before a round's deadline.
+
+The module includes the following functionalities:
+- HeartbeatPolicy: The ping interval and the bound within which dead connections are flagged.
+- tune_keepalive: Configures the kernel keepalive and user timeout of a TCP socket.
+- is_connection_alive: Checks without blocking whether the peer of a socket closed the connection.
+"""
+
+
+class HeartbeatPolicy:
+    """
+    The ping interval and the bound (in seconds) within which dead connections are flagged.
+    """
+
+    def __init__(self, interval=2, dead_after=12, ack_timeout=5):
+        """
+        Initialize the HeartbeatPolicy object.
+
+        :param interval: seconds between two PING frames
+        :param dead_after: seconds without hearing from a player before it is flagged as dead
+        :param ack_timeout: seconds within which the data sent to a player must be acknowledged by its host, shorter
+                            than an answer window
+        """
+        self.interval = interval
+        self.dead_after = dead_after
+        self.ack_timeout = ack_timeout
+
+    def is_dead(self, last_seen, now):
+        """
+        Check if a player is dead.
+        :param last_seen: time the player was last heard from
+        :param now: the current time, on the same clock
+        :return: True if the player was silent for longer than dead_after
+        """
+        return now - last_seen > self.dead_after
+
+
+DEFAULT_HEARTBEAT = HeartbeatPolicy()
+
+
+def tune_keepalive(sock, dead_after=DEFAULT_HEARTBEAT.dead_after, ack_timeout=DEFAULT_HEARTBEAT.ack_timeout):
+    """
+    Configures the kernel keepalive and user timeout of a TCP socket, so a dead peer fails an idle connection within
+    about dead_after seconds, and a connection with unacknowledged data within ack_timeout seconds. Options the
+    platform does not support are skipped.
+    :param sock: the TCP socket
+    :param dead_after: seconds within which a dead peer of an idle connection is detected
+    :param ack_timeout: seconds within which sent data must be acknowledged
+    """
+    idle = max(1, int(dead_after / 2))
+    count = 3
+    interval = max(1, int((dead_after - idle) / count))
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+        elif hasattr(socket, 'TCP_KEEPALIVE'):
+            # macOS names the idle time option TCP_KEEPALIVE
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle)
+        if hasattr(socket, 'TCP_KEEPINTVL'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+        if hasattr(socket, 'TCP_KEEPCNT'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+        if hasattr(socket, 'TCP_USER_TIMEOUT'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, int(min(dead_after, ack_timeout) * 1000))
+    except OSError:
+        pass
+
+
+def is_connection_alive(sock):
+    """
+    Checks without blocking whether the peer of a socket closed the connection. A readable socket with no data to
+    peek at was closed; data waiting to be read is left in the socket.
+    :param sock: the socket to check
+    :return: False if the connection is closed or broken, True otherwise
+    """
+    try:
+        with selectors.DefaultSelector() as selector:
+            selector.register(sock, selectors.EVENT_READ)
+            if not selector.select(timeout=0):
+                return True
+        timeout = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            return sock.recv(1, socket.MSG_PEEK) != b''
+        except BlockingIOError:
+            return True
+        finally:
+            sock.settimeout(timeout)
+    except (OSError, ValueError):
+        return False
@@ -0,0 +1,418 @@
+import bisect
+import os
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+
+"""
+This module implements the all time leaderboard of the Trivia King server.
+
+The leaderboard used to be the winners.xlsx workbook, which was loaded, scanned and saved on every win. The backends
+here update a single player's win count without touching the rest of the data:
+- SQLiteLeaderboard: an SQLite table with an index on the wins column. Increments are B-tree operations, O(log n).
+- LogLeaderboard: an append-only log with one line per win, replayed into the in-memory index on startup.
+
+Both backends keep a RankedIndex of the players in memory, updated with every win, which answers the rankings without
+touching the disk: the top-K players for any K, the rank of a player and the players around a rank.
+
+The module includes the following functionalities:
+- Leaderboard: The interface shared by the backends.
+- RankedIndex: The in-memory ranking of the players.
+- open_leaderboard: Opens the backend matching a file name, importing the Excel workbook the first time.
+- import_excel: Imports the wins recorded in the winners.xlsx workbook into a leaderboard.
+"""
+
+LEADERBOARD_FILE = 'winners.db'
+EXCEL_FILE = 'winners.xlsx'
+# Initial number of win counts covered by the Fenwick tree of a RankedIndex, doubled when a player gets past it
+INDEX_SIZE = 1024
+
+
+class Leaderboard(ABC):
+    """
+    The interface of a leaderboard backend. A backend must implement every abstract method to be created.
+    """
+
+    @abstractmethod
+    def increment(self, name, amount=1):
+        """
+        Adds wins to a player.
+        :param name: name of the player
+        :param amount: number of wins to add
+        :return: the player's new number of wins
+        """
+
+    @abstractmethod
+    def wins(self, name):
+        """
+        Get the number of wins of a player.
+        :param name: name of the player
+        :return: the number of wins, 0 for an unknown player
+        """
+
+    @abstractmethod
+    def top(self, k=3):
+        """
+        Get the players with the most wins.
+        :param k: number of players to return
+        :return: list of (name, wins) tuples, most wins first
+        """
+
+    @abstractmethod
+    def rank(self, name):
+        """
+        Get the rank of a player. Players are ranked by wins, most first, then by name.
+        :param name: name of the player
+        :return: the rank, 1 for the most wins, or None for a player without wins
+        """
+
+    @abstractmethod
+    def around(self, rank, radius=2):
+        """
+        Get the players ranked near a rank.
+        :param rank: the rank
+        :param radius: number of players to return above and below the rank
+        :return: list of (rank, name, wins) tuples, from rank - radius to rank + radius
+        """
+
+    def is_empty(self):
+        """
+        Check if no wins were recorded yet.
+        :return: True if the leaderboard is empty
+        """
+        return not self.top(1)
+
+    def close(self):
+        """
+        Close the backend.
+        """
+
+
+class RankedIndex:
+    """
+    The players ranked by wins, most first, then by name.
+
+    The players are grouped by their number of wins, every group keeping its names sorted, and a Fenwick tree counts
+    the players at every number of wins. An increment moves a player to another group and updates two counts of the
+    tree. The number of players with more wins than a player, and the number of wins at a given rank, are prefix sums
+    of the tree, O(log W) for W the highest number of wins; the names are then read from the groups in order.
+    """
+
+    def __init__(self):
+        self.scores = {}
+        # wins -> sorted list of the names of the players with that many wins
+        self.groups = {}
+        # The distinct numbers of wins, in increasing order
+        self.counts = []
+        # tree[i] counts the players whose number of wins is in (i - lowbit(i), i]
+        self.tree = [0] * (INDEX_SIZE + 1)
+        self.players = 0
+
+    def _update(self, wins, delta):
+        while wins < len(self.tree):
+            self.tree[wins] += delta
+            wins += wins & -wins
+
+    def _rebuild(self, wins):
+        """
+        Rebuilds the Fenwick tree from the groups, in O(W), with room for a number of wins.
+        :param wins: the number of wins to cover
+        """
+        size = len(self.tree) - 1
+        while size < wins:
+            size *= 2
+        self.tree = [0] * (size + 1)
+        for count, group in self.groups.items():
+            self.tree[count] = len(group)
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                self.tree[parent] += self.tree[i]
+
+    def _at_most(self, wins):
+        """
+        :return: the number of players with at most wins wins
+        """
+        wins = min(wins, len(self.tree) - 1)
+        total = 0
+        while wins > 0:
+            total += self.tree[wins]
+            wins -= wins & -wins
+        return total
+
+    def _above(self, wins):
+        """
+        :return: the number of players with more than wins wins
+        """
+        return self.players - self._at_most(wins)
+
+    def _wins_at(self, rank):
+        """
+        Finds the number of wins of the player at a rank, by descending the Fenwick tree.
+        :param rank: a rank between 1 and the number of players
+        :return: the number of wins
+        """
+        # The player at the rank is the position-th player in increasing order of wins
+        position = self.players - rank + 1
+        wins = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            if wins + step < len(self.tree) and self.tree[wins + step] < position:
+                wins += step
+                position -= self.tree[wins]
+            step >>= 1
+        return wins + 1
+
+    def load(self, scores):
+        """
+        Replaces the content of the index, in one pass.
+        :param scores: iterable of (name, wins) tuples, one per player
+        """
+        self.scores = dict(scores)
+        self.groups = {}
+        for name, wins in self.scores.items():
+            if wins > 0:
+                self.groups.setdefault(wins, []).append(name)
+        for group in self.groups.values():
+            group.sort()
+        self.counts = sorted(self.groups)
+        self.players = sum(len(group) for group in self.groups.values())
+        self._rebuild(self.counts[-1] if self.counts else 0)
+
+    def add(self, name, amount):
+        """
+        Adds wins to a player.
+        :param name: name of the player
+        :param amount: number of wins to add
+        :return: the player's new number of wins
+        """
+        old = self.scores.get(name, 0)
+        new = old + amount
+        if old > 0:
+            group = self.groups[old]
+            del group[bisect.bisect_left(group, name)]
+            if not group:
+                del self.groups[old]
+                del self.counts[bisect.bisect_left(self.counts, old)]
+            self._update(old, -1)
+            self.players -= 1
+        self.scores[name] = new
+        # Players without wins are not ranked
+        if new > 0:
+            if new >= len(self.tree):
+                self._rebuild(new)
+            if new not in self.groups:
+                self.groups[new] = []
+                bisect.insort(self.counts, new)
+            bisect.insort(self.groups[new], name)
+            self._update(new, 1)
+            self.players += 1
+        return new
+
+    def rank(self, name):
+        """
+        :return: the rank of a player, or None for a player without wins
+        """
+        wins = self.scores.get(name, 0)
+        if wins <= 0:
+            return None
+        return self._above(wins) + bisect.bisect_left(self.groups[wins], name) + 1
+
+    def page(self, first, count):
+        """
+        Get the players at consecutive ranks.
+        :param first: the first rank
+        :param count: number of players
+        :return: list of (rank, name, wins) tuples
+        """
+        first = max(first, 1)
+        if first > self.players or count <= 0:
+            return []
+        wins = self._wins_at(first)
+        start = first - self._above(wins) - 1
+        result = []
+        index = bisect.bisect_left(self.counts, wins)
+        while index >= 0 and len(result) < count:
+            wins = self.counts[index]
+            for name in self.groups[wins][start:start + count - len(result)]:
+                result.append((first + len(result), name, wins))
+            start = 0
+            index -= 1
+        return result
+
+    def top(self, k):
+        return [(name, wins) for rank, name, wins in self.page(1, k)]
+
+    def around(self, rank, radius):
+        first = max(rank - radius, 1)
+        return self.page(first, rank + radius - first + 1)
+
+
+class SQLiteLeaderboard(Leaderboard):
+    """
+    A leaderboard stored in an SQLite database, and ranked in a RankedIndex. The index is loaded when the database is
+    opened, and reloaded when another connection, like another server process, wrote the database.
+    """
+
+    def __init__(self, filename):
+        """
+        Initialize the SQLiteLeaderboard object.
+
+        :param filename: path of the database file
+        """
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS players (name TEXT PRIMARY KEY, wins INTEGER NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS players_by_wins ON players (wins DESC, name)')
+        self.conn.commit()
+        self.index = None
+        self.data_version = None
+
+    def _refresh(self):
+        """
+        Loads the index, or reloads it if another connection changed the database since it was loaded. Called with
+        the lock held.
+        :return: the RankedIndex
+        """
+        # data_version only changes with the commits of other connections
+        data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if self.index is None or data_version != self.data_version:
+            self.index = RankedIndex()
+            self.index.load(self.conn.execute('SELECT name, wins FROM players'))
+            self.data_version = data_version
+        return self.index
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            index = self._refresh()
+            with self.conn:
+                self.conn.execute('INSERT INTO players (name, wins) VALUES (?, ?) '
+                                  'ON CONFLICT (name) DO UPDATE SET wins = wins + excluded.wins', (name, amount))
+                wins = self.conn.execute('SELECT wins FROM players WHERE name = ?', (name,)).fetchone()[0]
+            index.add(name, wins - index.scores.get(name, 0))
+            return wins
+
+    def wins(self, name):
+        with self.lock:
+            return self._refresh().scores.get(name, 0)
+
+    def top(self, k=3):
+        with self.lock:
+            return self._refresh().top(k)
+
+    def rank(self, name):
+        with self.lock:
+            return self._refresh().rank(name)
+
+    def around(self, rank, radius=2):
+        with self.lock:
+            return self._refresh().around(rank, radius)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class LogLeaderboard(Leaderboard):
+    """
+    A leaderboard stored as an append-only log of wins, ranked in a RankedIndex. Each line of the log is a number of
+    wins and a player name separated by a tab.
+    """
+
+    def __init__(self, filename):
+        """
+        Initialize the LogLeaderboard object, replaying the existing log into the index.
+
+        :param filename: path of the log file
+        """
+        self.lock = threading.Lock()
+        self.index = RankedIndex()
+        if os.path.exists(filename):
+            with open(filename, encoding='utf-8') as log:
+                for line in log:
+                    amount, _, name = line.rstrip('\n').partition('\t')
+                    if name:
+                        self.index.add(name, int(amount))
+        self.log = open(filename, 'a', encoding='utf-8')
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.log.write(f'{amount}\t{name}\n')
+            self.log.flush()
+            return self.index.add(name, amount)
+
+    def wins(self, name):
+        return self.index.scores.get(name, 0)
+
+    def top(self, k=3):
+        with self.lock:
+            return self.index.top(k)
+
+    def rank(self, name):
+        with self.lock:
+            return self.index.rank(name)
+
+    def around(self, rank, radius=2):
+        with self.lock:
+            return self.index.around(rank, radius)
+
+    def close(self):
+        with self.lock:
+            self.log.close()
+
+
+def import_excel(filename, leaderboard):
+    """
+    Imports the wins recorded in an Excel workbook (a name column and a wins column) into a leaderboard.
+    Rows without a name or a number of wins are skipped, and duplicate names are summed.
+    :param filename: the filename of the Excel file
+    :param leaderboard: the Leaderboard to import into
+    :return: the number of players imported
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(filename, read_only=True)
+    players = {}
+    for row in wb.active.iter_rows(max_col=2, values_only=True):
+        name, wins = (tuple(row) + (None, None))[:2]
+        if name is None or not isinstance(wins, int):
+            continue
+        players[str(name)] = players.get(str(name), 0) + wins
+    wb.close()
+    for name, wins in players.items():
+        leaderboard.increment(name, wins)
+    return len(players)
+
+
+def open_leaderboard(filename=LEADERBOARD_FILE, import_from=EXCEL_FILE):
+    """
+    Opens the leaderboard backend matching the file name: an append-only log for '.log' files, SQLite otherwise.
+    If the leaderboard is empty and the Excel workbook exists, its wins are imported once.
+    :param filename: path of the leaderboard file
+    :param import_from: path of the Excel workbook to import, or None
+    :return: the Leaderboard
+    """
+    if filename.endswith('.log'):
+        leaderboard = LogLeaderboard(filename)
+    else:
+        leaderboard = SQLiteLeaderboard(filename)
+    if import_from and os.path.exists(import_from) and leaderboard.is_empty():
+        import_excel(import_from, leaderboard)
+    return leaderboard
+
+
+if __name__ == "__main__":
+    # Usage: python leaderboard.py [winners.xlsx] [winners.db]
+    source = sys.argv[1] if len(sys.argv) > 1 else EXCEL_FILE
+    target = sys.argv[2] if len(sys.argv) > 2 else LEADERBOARD_FILE
+    board = open_leaderboard(target, import_from=None)
+    if board.is_empty():
+        print(f'Imported {import_excel(source, board)} players from {source} into {target}')
+    else:
+        print(f'{target} already holds wins, nothing was imported')
+    for rank, (player, player_wins) in enumerate(board.top(3), start=1):
+        print(f'{rank}. {player}: {player_wins}')
+    board.close()
@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import protocol
+
+"""
+This script is a headless load generator for the Trivia King server.
+
+It spins up thousands of lightweight bots on a single asyncio event loop. Each bot speaks the framed protocol directly,
+so it needs no pygame, no colorama and no thread of its own. The join rate, the answer latency distribution, the ratio
+of correct answers and the probability that a bot disconnects in a round are configurable.
+
+When all the bots are done, the script reports percentiles of:
+- connect: time to open the TCP connection, including the redirect when the server is a cluster coordinator.
+- lobby_join: time from connecting until the server welcomes the bot into the lobby.
+- game_start: time from joining the lobby until the first round starts.
+- round: time from the start of a round until its results arrive.
+- response: time from sending an answer until the server's next message.
+
+Usage example:
+    python loadgen.py 127.0.0.1 40000 --bots 2000 --join-rate 200 --latency normal:1.5,0.5 --correct 0.7
+"""
+
+
+def parse_latency(spec):
+    """
+    Parse an answer latency distribution.
+    :param spec: 'fixed:s', 'uniform:low,high', 'normal:mean,sd' or 'exp:mean', in seconds
+    :return: a function returning a latency sample
+    """
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(',') if value]
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'normal':
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == 'exp':
+        return lambda: random.expovariate(1 / values[0])
+    raise argparse.ArgumentTypeError(f"Unknown latency distribution '{spec}'")
+
+
+def percentiles(samples):
+    """
+    Summarize latency samples.
+    :param samples: list of latencies in seconds
+    :return: dict of count, p50, p90, p99 and max, in milliseconds
+    """
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2)
+
+    return {'count': len(ordered), 'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99),
+            'max': round(ordered[-1] * 1000, 2)}
+
+
+class LoadStats:
+    """
+    Latency samples and counters collected by the bots.
+    """
+
+    def __init__(self):
+        self.samples = {'connect': [], 'lobby_join': [], 'game_start': [], 'round': [], 'response': []}
+        self.counters = {'bots': 0, 'connect_errors': 0, 'disconnected': 0, 'eliminated': 0, 'games_finished': 0,
+                         'questions': 0, 'redirects': 0}
+
+    def report(self):
+        """
+        Build the report of the run.
+        :return: dict of counters and latency percentiles
+        """
+        report = dict(self.counters)
+        report.update({name: percentiles(samples) for name, samples in self.samples.items()})
+        return report
+
+
+class SwarmBot:
+    """
+    A protocol-level bot of the load generator.
+    """
+
+    def __init__(self, name, args, answers, stats):
+        """
+        Initialize the SwarmBot object.
+
+        :param name: name of the bot
+        :param args: the parsed command line arguments
+        :param answers: dict of question text to the correct answer, when known
+        :param stats: the shared LoadStats
+        """
+        self.name = name
+        self.args = args
+        self.answers = answers
+        self.stats = stats
+
+    def choose_answer(self, question):
+        """
+        Choose an answer, correct with the configured probability when the correct answer is known.
+        :param question: text of the QUESTION frame
+        :return: 'T' or 'F'
+        """
+        text = question.strip()
+        if text.startswith('True or False: '):
+            text = text[len('True or False: '):]
+        correct = self.answers.get(text)
+        if correct is None:
+            return random.choice(['T', 'F'])
+        if random.random() < self.args.correct:
+            return 'T' if correct else 'F'
+        return 'F' if correct else 'T'
+
+    async def run(self):
+        """
+        Connect to the server, join the lobby and play until the game is over.
+        """
+        stats = self.stats
+        stats.counters['bots'] += 1
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.args.host, self.args.port), self.args.timeout)
+        except (OSError, asyncio.TimeoutError):
+            stats.counters['connect_errors'] += 1
+            return
+        connected = time.perf_counter()
+        writer.write(protocol.encode_frame(protocol.NAME, self.name))
+        joined = round_start = answered = None
+        try:
+            while True:
+                frame = await asyncio.wait_for(protocol.read_frame_async(reader), self.args.timeout)
+                now = time.perf_counter()
+                if frame is None:
+                    stats.counters['disconnected'] += 1
+                    break
+                msg_type, message = frame
+                if msg_type == protocol.PING:
+                    writer.write(protocol.PONG_FRAME)
+                    continue
+                if msg_type == protocol.REDIRECT:
+                    # A cluster coordinator sends the bot to a node; connecting to it is part of the connect time
+                    stats.counters['redirects'] += 1
+                    writer.close()
+                    host, _, port = message.rpartition(':')
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)),
+                                                            self.args.timeout)
+                    connected = time.perf_counter()
+                    writer.write(protocol.encode_frame(protocol.NAME, self.name))
+                    continue
+                if answered is not None:
+                    # The first message after an answer closes the round: results or nobody eliminated
+                    stats.samples['response'].append(now - answered)
+                    stats.samples['round'].append(now - round_start)
+                    answered = None
+                if joined is None:
+                    joined = now
+                    stats.samples['connect'].append(connected - start)
+                    stats.samples['lobby_join'].append(now - connected)
+                if msg_type == protocol.ROUND:
+                    if round_start is None:
+                        stats.samples['game_start'].append(now - joined)
+                    round_start = now
+                    if random.random() < self.args.disconnect:
+                        stats.counters['disconnected'] += 1
+                        break
+                elif msg_type == protocol.QUESTION:
+                    stats.counters['questions'] += 1
+                    await asyncio.sleep(self.args.latency())
+                    writer.write(protocol.encode_frame(protocol.ANSWER, self.choose_answer(message)))
+                    await writer.drain()
+                    answered = time.perf_counter()
+                elif msg_type == protocol.ELIMINATED:
+                    stats.counters['eliminated'] += 1
+                elif msg_type == protocol.GAME_OVER:
+                    stats.counters['games_finished'] += 1
+                    break
+        except (OSError, asyncio.TimeoutError):
+            stats.counters['disconnected'] += 1
+        finally:
+            writer.close()
+
+
+async def run_swarm(args):
+    """
+    Start the bots at the configured join rate and wait for all of them to finish.
+    :param args: the parsed command line arguments
+    :return: the LoadStats of the run
+    """
+    stats = LoadStats()
+    answers = {}
+    if args.questions:
+        from server import questions
+        answers = dict(questions)
+    tasks = []
+    started = time.perf_counter()
+    for i in range(args.bots):
+        bot = SwarmBot(f'LOAD_{i}', args, answers, stats)
+        tasks.append(asyncio.create_task(bot.run()))
+        if args.join_rate > 0:
+            # Keep the joins on schedule even when creating the bots takes time
+            delay = started + (i + 1) / args.join_rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+    await asyncio.gather(*tasks)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless bot swarm load generator for the Trivia King server.')
+    parser.add_argument('host', help='IP address of the server')
+    parser.add_argument('port', type=int, help='TCP port of the server')
+    parser.add_argument('--bots', type=int, default=100, help='number of bots (default=100)')
+    parser.add_argument('--join-rate', type=float, default=50,
+                        help='bots joining per second, 0 to join all at once (default=50)')
+    parser.add_argument('--latency', type=parse_latency, default=parse_latency('uniform:0.2,2'),
+                        help="answer latency distribution: fixed:s, uniform:low,high, normal:mean,sd or exp:mean "
+                             "(default=uniform:0.2,2)")
+    parser.add_argument('--correct', type=float, default=0.5, help='ratio of correct answers (default=0.5)')
+    parser.add_argument('--disconnect', type=float, default=0.0,
+                        help='probability of a bot disconnecting at each round (default=0)')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds to wait for any message (default=120)')
+    parser.add_argument('--no-questions', dest='questions', action='store_false',
+                        help="don't load the server's questions; all answers are random")
+    parser.add_argument('--json', help='write the report to this JSON file')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    report = asyncio.run(run_swarm(args)).report()
+    report['duration_s'] = round(time.perf_counter() - started, 3)
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import selectors
+import socket
+import time
+
+import protocol
+
+from heartbeat import tune_keepalive
+
+"""
+This module implements the lobby admission of the threaded server.
+
+The lobby used to accept connections with a 10 second accept() timeout that was reset on every arrival, so a steady
+trickle of players kept the lobby open forever, and every player's handshake ran in its own thread, blocked in recv
+until the name arrived, so a slow or idle connection held a thread for as long as it liked. Admission now runs on a
+selector, in the server's thread:
+- The listening socket and the connections still in their handshake are watched together, and a name frame is read as
+  its bytes arrive, so no thread waits on a connection. A connection that does not send its name within
+  handshake_timeout is closed.
+- The lobby closes when it is full (capacity players), when the fill deadline expires (fill_deadline seconds after it
+  opened, however many players keep arriving) or when no player joined for the length of the fill window.
+- The fill window adapts to the arrival rate: it lasts a few times the average gap between the last arrivals, between
+  min_window and idle_window seconds. A burst of players closes the lobby soon after the burst ends, and a quiet lobby
+  keeps waiting for the next player as before.
+- The listening socket is given a larger backlog, so the players arriving while a game is played wait in the
+  kernel's queue instead of being refused.
+- The players with a session (see sessions.py) are carried over from the previous game, and the lobby opens with them.
+- A connection sending WATCH instead of NAME is a spectator (see spectators.py): it is handed over to the server
+  without counting as a player.
+
+The module includes the following functionalities:
+- LobbyPolicy: The capacity, deadlines and fill window of a lobby.
+- DEFAULT_LOBBY: The lobby policy of the threaded server.
+- Lobby: Admits the players of one game.
+"""
+
+
+class LobbyPolicy:
+    """
+    The capacity, deadlines and fill window (in seconds) of a lobby.
+    """
+
+    def __init__(self, capacity=100, fill_deadline=30, idle_window=10, min_window=2, rate_factor=3,
+                 handshake_timeout=5, backlog=128):
+        """
+        Initialize the LobbyPolicy object.
+
+        :param capacity: maximum number of players in a lobby
+        :param fill_deadline: seconds after the first arrival at which the lobby closes, however many players arrive
+        :param idle_window: longest time the lobby waits for the next player
+        :param min_window: shortest time the lobby waits for the next player
+        :param rate_factor: the fill window lasts rate_factor average gaps between arrivals
+        :param handshake_timeout: seconds a connection has to send the player's name
+        :param backlog: backlog of the listening socket
+        """
+        self.capacity = capacity
+        self.fill_deadline = fill_deadline
+        self.idle_window = idle_window
+        self.min_window = min_window
+        self.rate_factor = rate_factor
+        self.handshake_timeout = handshake_timeout
+        self.backlog = backlog
+
+    def window(self, average_gap):
+        """
+        Get the length of the fill window.
+        :param average_gap: average seconds between the last arrivals, or None before the second arrival
+        :return: seconds the lobby waits for the next player
+        """
+        if average_gap is None:
+            return self.idle_window
+        return min(self.idle_window, max(self.min_window, self.rate_factor * average_gap))
+
+
+DEFAULT_LOBBY = LobbyPolicy()
+# Weight of the last gap in the average gap between arrivals
+GAP_WEIGHT = 0.3
+
+
+class Lobby:
+    """
+    Admits the players of one game: accepts connections and reads the players' names on a selector until the lobby
+    closes.
+    """
+
+    def __init__(self, server_socket, policy=DEFAULT_LOBBY, heartbeat=None, load=None):
+        """
+        Initialize the Lobby object.
+
+        :param server_socket: the listening socket
+        :param policy: the LobbyPolicy of the lobby
+        :param heartbeat: the HeartbeatPolicy the accepted connections are tuned for, or None
+        :param load: the ServerLoad to keep up to date with the lobby, or None
+        """
+        self.server_socket = server_socket
+        self.policy = policy
+        self.heartbeat = heartbeat
+        self.load = load
+        self.opened_at = None
+        self.last_join = None
+        self.average_gap = None
+        # client id -> (socket, FrameReader, handshake deadline) of the connections that did not send their name yet
+        self.pending = {}
+        self.players = 0
+
+    def closes_at(self):
+        """
+        :return: time.monotonic() time at which the lobby closes if nobody else joins, or None before it opens
+        """
+        if self.opened_at is None:
+            return None
+        window_end = (self.last_join or self.opened_at) + self.policy.window(self.average_gap)
+        return min(self.opened_at + self.policy.fill_deadline, window_end)
+
+    def joined(self, now):
+        """
+        Updates the fill window with the arrival of a player.
+        :param now: time.monotonic() time of the arrival
+        """
+        if self.last_join is not None:
+            gap = now - self.last_join
+            self.average_gap = gap if self.average_gap is None else (
+                    GAP_WEIGHT * gap + (1 - GAP_WEIGHT) * self.average_gap)
+        self.last_join = now
+        self.players += 1
+        if self.load is not None:
+            self.load.lobby_size = self.players
+            self.load.starts_at = self.closes_at()
+
+    def carry(self, count):
+        """
+        Opens the lobby with the players carried over from the previous game. They do not count as arrivals for the
+        fill window, so the lobby waits for the players coming back over UDP as long as for the first player.
+        :param count: number of players carried over
+        """
+        if count == 0:
+            return
+        self.opened_at = time.monotonic()
+        self.players += count
+        if self.load is not None:
+            self.load.lobby_size = self.players
+            self.load.starts_at = self.closes_at()
+
+    def admit(self, first_id, on_join, on_watch=None):
+        """
+        Admits players until the lobby closes. The lobby opens with the first connection.
+        :param first_id: id of the first player
+        :param on_join: function called with (client id, blocking socket, name, session token) for every player who
+                        joined; the token is None for a NAME frame, and '' for a RESUME frame opening a new session.
+                        It returns True if the player took a new seat, only those count towards the capacity
+        :param on_watch: function called with the blocking socket of every spectator, or None to refuse spectators
+        :return: the id of the next player
+        """
+        next_id = first_id
+        self.server_socket.listen(self.policy.backlog)
+        self.server_socket.setblocking(False)
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.server_socket, selectors.EVENT_READ)
+            accepting = True
+            while True:
+                now = time.monotonic()
+                closes_at = self.closes_at()
+                if self.players >= self.policy.capacity or (closes_at is not None and now >= closes_at):
+                    break
+                if accepting and self.players + len(self.pending) >= self.policy.capacity:
+                    # The lobby is full once the pending handshakes complete, new players wait in the backlog
+                    selector.unregister(self.server_socket)
+                    accepting = False
+                elif not accepting and self.players + len(self.pending) < self.policy.capacity:
+                    selector.register(self.server_socket, selectors.EVENT_READ)
+                    accepting = True
+                deadlines = [deadline for sock, reader, deadline in self.pending.values()]
+                if closes_at is not None:
+                    deadlines.append(closes_at)
+                timeout = max(0.0, min(deadlines) - now) if deadlines else None
+                for key, _ in selector.select(timeout):
+                    if key.fileobj is self.server_socket:
+                        next_id = self.accept(selector, next_id)
+                    else:
+                        self.read_name(selector, key.data, on_join, on_watch)
+                self.expire_handshakes(selector)
+            for client_id in list(self.pending):
+                self.drop(selector, client_id)
+        self.server_socket.setblocking(True)
+        return next_id
+
+    def accept(self, selector, next_id):
+        """
+        Accepts the connections waiting in the backlog.
+        :param selector: the lobby's selector
+        :param next_id: id of the next player
+        :return: the id of the next player
+        """
+        while self.players + len(self.pending) < self.policy.capacity:
+            try:
+                client_socket, client_address = self.server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                break
+            if self.opened_at is None:
+                self.opened_at = time.monotonic()
+            if self.heartbeat is not None:
+                tune_keepalive(client_socket, self.heartbeat.dead_after, self.heartbeat.ack_timeout)
+            client_socket.setblocking(False)
+            self.pending[next_id] = (client_socket, protocol.FrameReader(client_socket),
+                                     time.monotonic() + self.policy.handshake_timeout)
+            selector.register(client_socket, selectors.EVENT_READ, next_id)
+            next_id += 1
+        return next_id
+
+    def read_name(self, selector, client_id, on_join, on_watch=None):
+        """
+        Reads the NAME, BOT, RESUME or WATCH frame of a connection as its bytes arrive, and admits the player or the
+        spectator once it is complete.
+        :param selector: the lobby's selector
+        :param client_id: id of the connection
+        :param on_join: function called with (client id, blocking socket, name, session token) when the player joined,
+                        returning True if the player took a new seat in the lobby
+        :param on_watch: function called with the blocking socket of a spectator, or None to refuse spectators
+        """
+        client_socket, reader, deadline = self.pending[client_id]
+        try:
+            if not reader.receive():
+                raise protocol.ProtocolError('Connection closed during the handshake')
+            frame = reader.pop_frame()
+            if frame is None:
+                return
+            if frame[0] not in (protocol.NAME, protocol.BOT, protocol.RESUME) and (frame[0] != protocol.WATCH or on_watch is None):
+                raise protocol.ProtocolError("Expected the player's name")
+        except (OSError, ValueError):
+            self.drop(selector, client_id)
+            return
+        selector.unregister(client_socket)
+        del self.pending[client_id]
+        client_socket.setblocking(True)
+        if frame[0] == protocol.WATCH:
+            on_watch(client_socket)
+            return
+        now = time.monotonic()
+        if frame[0] == protocol.RESUME:
+            token, name = protocol.decode_resume(frame[1])
+            seated = on_join(client_id, client_socket, name, token)
+        else:
+            seated = on_join(client_id, client_socket, frame[1], None)
+        # A player taking back the seat of a resumed session, or lost while being welcomed, takes no new seat
+        if seated:
+            self.joined(now)
+
+    def expire_handshakes(self, selector):
+        """
+        Closes the connections that did not send their name in time.
+        :param selector: the lobby's selector
+        """
+        now = time.monotonic()
+        for client_id, (client_socket, reader, deadline) in list(self.pending.items()):
+            if now >= deadline:
+                self.drop(selector, client_id)
+
+    def drop(self, selector, client_id):
+        client_socket = self.pending.pop(client_id)[0]
+        selector.unregister(client_socket)
+        try:
+            client_socket.close()
+        except OSError:
+            pass
@@ -0,0 +1,150 @@
+import protocol
+
+import scoring
+
+"""
+This module holds the messages the server sends during a game, encoded once into protocol frames.
+
+A broadcast used to encode its message once per recipient, and the round results were rebuilt by string
+concatenation. GameMessages prepares the frames of a game when it starts: the fixed notices, the frame of every
+question that may be asked and the elimination notice of every player. The same immutable bytes object is then
+written to all the sockets, so the cost of a broadcast no longer grows with the number of recipients.
+
+The module includes the following functionalities:
+- GameMessages: The pre-encoded frames of a single game, and of its spectator feed.
+- encode_info: Encodes a message built at runtime into an INFO frame.
+- resumed_question: Encodes the open question for a player who resumed their session during the round.
+"""
+
+WELCOME = "Please wait for other players to join...\n"
+GREETING = 'Welcome to LuckyBunnies Server, where we are answering trivia questions about geography!\n'
+LOADING = "Loading game..."
+NOT_ENOUGH_PLAYERS = 'Not enough players. Adding bots to the game.'
+NOBODY_ELIMINATED = 'Nobody is eliminated this round! Let"s move to the next round.'
+TIED = "Game is tied !"
+WELCOME_BACK = "Welcome back! You are still in the game.\n"
+WATCHING = "You are watching the next game.\n"
+RESULT_TEXT = {scoring.CORRECT: 'is correct!', scoring.INCORRECT: 'is incorrect!',
+               scoring.LATE: 'did not answer in time !', scoring.INVALID: 'gave an invalid input !'}
+
+WELCOME_FRAME = protocol.encode_frame(protocol.INFO, WELCOME)
+NOT_ENOUGH_PLAYERS_FRAME = protocol.encode_frame(protocol.INFO, NOT_ENOUGH_PLAYERS)
+INTRO_FRAMES = protocol.encode_frames([(protocol.INFO, GREETING), (protocol.INFO, LOADING)])
+WELCOME_BACK_FRAME = protocol.encode_frame(protocol.INFO, WELCOME_BACK)
+WATCHING_FRAME = protocol.encode_frame(protocol.INFO, WATCHING)
+NOBODY_ELIMINATED_FRAME = protocol.encode_frame(protocol.INFO, NOBODY_ELIMINATED)
+TIED_FRAME = protocol.encode_frame(protocol.GAME_OVER, TIED)
+
+
+def encode_info(msg):
+    """
+    Encodes a message built at runtime into an INFO frame.
+    :param msg: the message
+    :return: the frame as bytes
+    """
+    return protocol.encode_frame(protocol.INFO, msg)
+
+
+def resumed_question(question, remaining):
+    """
+    Encodes the open question for a player who resumed their session during the round.
+    :param question: the question
+    :param remaining: seconds left to answer it
+    :return: the frame as bytes
+    """
+    return protocol.encode_frame(protocol.QUESTION, f"True or False: {question}\n"
+                                                    f"You have {max(0, int(remaining))} seconds left to answer.\n")
+
+
+class GameMessages:
+    """
+    The pre-encoded frames of a single game.
+    """
+
+    def __init__(self, pid_to_name, game_questions):
+        """
+        Prepare the frames of a game.
+
+        :param pid_to_name: dict of player id to the name of every player in the game
+        :param game_questions: the questions that may be asked in the game
+        """
+        self.names = dict(pid_to_name)
+        self.players_list = encode_info(
+            ''.join(f"Player {i + 1}: {name}\n" for i, name in enumerate(self.names.values())) + "===============\n")
+        self.questions = {question: protocol.encode_frame(protocol.QUESTION, f"True or False: {question}\n")
+                          for question in game_questions}
+        # The questions are shown to the spectators as INFO frames, which their clients do not answer
+        self.watched_questions = {}
+        self.eliminations = {
+            pid: protocol.encode_frame(protocol.ELIMINATED,
+                                       f"Sorry {name}, you are out of the game!\nPlease wait for the final results.\n")
+            for pid, name in self.names.items()}
+
+    def round_header(self, round_number, player_ids):
+        """
+        Get the text announcing a round.
+        :param round_number: number of the round
+        :param player_ids: ids of the players playing the round
+        :return: the text of the round header
+        """
+        return f'Round {round_number}, played by ' + ', '.join(self.names[pid] for pid in player_ids) + ':'
+
+    def round_header_frame(self, next_round):
+        """
+        Encode the round header into a ROUND frame.
+        :param next_round: the text of the round header
+        :return: the frame as bytes
+        """
+        return protocol.encode_frame(protocol.ROUND, f'{next_round}\n')
+
+    def question(self, question):
+        """
+        Get the frame of a question, encoding it if it was not prepared.
+        :param question: the question
+        :return: the frame as bytes
+        """
+        frame = self.questions.get(question)
+        if frame is None:
+            frame = self.questions[question] = protocol.encode_frame(protocol.QUESTION, f"True or False: {question}\n")
+        return frame
+
+    def watched_question(self, question):
+        """
+        Get the frame of a question in the spectator feed.
+        :param question: the question
+        :return: the frame as bytes
+        """
+        frame = self.watched_questions.get(question)
+        if frame is None:
+            frame = self.watched_questions[question] = encode_info(f"True or False: {question}\n")
+        return frame
+
+    def results(self, round_score, last_two):
+        """
+        Get the text of the round results.
+        :param round_score: the scored RoundScore of the round
+        :param last_two: whether only two players played the round, in which case the correct one wins
+        :return: the text of the results
+        """
+        lines = []
+        for pid, outcome in round_score.results():
+            name = self.names[pid]
+            if last_two and outcome == scoring.CORRECT:
+                lines.append(f'{name} is correct! {name} wins!')
+            else:
+                lines.append(f'{name} {RESULT_TEXT[outcome]}')
+        return '\n'.join(lines) + '\n'
+
+    def game_over(self, name, top_players, winner_rank=None):
+        """
+        Encode the game over message.
+        :param name: name of the winner
+        :param top_players: list of (name, wins) of the top players
+        :param winner_rank: all time rank of the winner, shown when the winner is not one of the top players
+        :return: the text and the GAME_OVER frame
+        """
+        game_over_mess = f'Game over!\nCongratulations to the winner: {name}\nAll Time Server Rankings:\n' + ''.join(
+            f'{rank}. {player[0]}: {player[1]}\n' for rank, player in enumerate(top_players or [], start=1))
+        if winner_rank is not None and winner_rank > len(top_players or []):
+            game_over_mess += f'{name} is now ranked #{winner_rank}.\n'
+        return game_over_mess, protocol.encode_frame(protocol.GAME_OVER, game_over_mess)
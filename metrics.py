@@ -0,0 +1,385 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+"""
+This module implements the metrics of the Trivia King servers.
+
+The servers used to report what they do only by printing it, which gives no numbers for capacity planning or for
+spotting regressions. The servers now count their games, rounds, players and answers, and measure the latency of the
+steps of a game in histograms: how long lobbies take to fill, how long a broadcast to every player takes, how long the
+players take to answer, how long rounds last and how long the leaderboard takes to record a winner. Gauges sample the
+number of connected players, threads and open file descriptors (sockets included) when the metrics are collected.
+
+The metrics are served over HTTP in the Prometheus text format, at http://127.0.0.1:<port>/metrics, when the server
+is started with the TRIVIA_METRICS_PORT environment variable (see server.startup). The same endpoint serves the
+rankings of the leaderboard as JSON, from its in-memory index, at /leaderboard:
+- /leaderboard?top=10: the top players.
+- /leaderboard?player=<name>: the wins and rank of a player, and the players ranked around them.
+- /leaderboard?rank=<rank>: the players ranked around a rank.
+
+Recording a metric takes a lock and a few additions, so the metrics are always recorded, whether they are served or
+not.
+
+The module includes the following functionalities:
+- Counter: A count that only goes up.
+- Gauge: A value that goes up and down, or is sampled from a function when collected.
+- Histogram: A distribution of observed values, in cumulative buckets.
+- Registry: The metrics of a process, rendered in the Prometheus text format.
+- merge_collected, render_collected: Merge the metrics of several processes and render them.
+- serve_metrics: Serves the metrics and the leaderboard's rankings over HTTP in a background thread.
+- The metrics of the servers: LOBBY_FILL, BROADCAST, ANSWER_LATENCY, ROUND_DURATION, LEADERBOARD_WRITE, GAMES,
+  ROUNDS, PLAYERS_JOINED, ANSWERS, ANSWER_TIMEOUTS, CONNECTED_PLAYERS, ACTIVE_THREADS, OPEN_FDS.
+"""
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LOBBY_BUCKETS = (1, 2.5, 5, 10, 15, 20, 30, 60, 120, 300)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+JSON_CONTENT_TYPE = 'application/json'
+# Largest top-K and radius served by /leaderboard
+MAX_RANKING = 1000
+
+
+def format_value(value):
+    """
+    Formats a sample value the way Prometheus expects it.
+    :param value: int or float
+    :return: the text of the value
+    """
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A count that only goes up.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        """
+        Initialize the Counter object.
+
+        :param name: name of the metric
+        :param help_text: description of the metric
+        """
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        """
+        Adds to the count.
+        :param amount: the amount to add
+        """
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        """
+        Get the samples of the metric.
+        :return: list of (name, value) tuples
+        """
+        return [(self.name, self.value)]
+
+
+class Gauge(Counter):
+    """
+    A value that goes up and down. A gauge with a function is sampled from it when the metrics are collected.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, function=None):
+        """
+        Initialize the Gauge object.
+
+        :param name: name of the metric
+        :param help_text: description of the metric
+        :param function: function returning the current value, or None when the value is unavailable
+        """
+        super().__init__(name, help_text)
+        self.function = function
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def samples(self):
+        if self.function is None:
+            return [(self.name, self.value)]
+        value = self.function()
+        return [] if value is None else [(self.name, value)]
+
+
+class Histogram:
+    """
+    A distribution of observed values, counted in buckets by upper bound.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize the Histogram object.
+
+        :param name: name of the metric
+        :param help_text: description of the metric
+        :param buckets: upper bounds of the buckets, in increasing order
+        """
+        self.name = name
+        self.help_text = help_text
+        self.bounds = list(buckets) + [float('inf')]
+        self.counts = [0] * len(self.bounds)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        Records a value.
+        :param value: the observed value, in seconds for a latency
+        """
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        """
+        Get a context manager that observes the time spent in its block.
+        :return: the Timer
+        """
+        return Timer(self)
+
+    def samples(self):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, counts):
+            cumulative += count
+            samples.append((f'{self.name}_bucket{{le="{format_value(float(bound))}"}}', cumulative))
+        samples.append((f'{self.name}_sum', total))
+        samples.append((f'{self.name}_count', cumulative))
+        return samples
+
+
+class Timer:
+    """
+    Observes the time spent in a with block in a Histogram.
+    """
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class Registry:
+    """
+    The metrics of a process.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Adds a metric to the registry. A metric registered twice under the same name is only kept once.
+        :param metric: Counter, Gauge or Histogram
+        :return: the registered metric
+        """
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text):
+        return self.register(Counter(name, help_text))
+
+    def gauge(self, name, help_text, function=None):
+        return self.register(Gauge(name, help_text, function))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, buckets))
+
+    def collect(self):
+        """
+        Collects the current samples of every metric.
+        :return: list of (name, help text, kind, samples) tuples, one per metric, that can be pickled
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return [(metric.name, metric.help_text, metric.kind, metric.samples()) for metric in metrics]
+
+    def render(self):
+        """
+        Renders every metric in the Prometheus text format.
+        :return: the text
+        """
+        return render_collected(self.collect())
+
+
+def render_collected(collected):
+    """
+    Renders collected metrics in the Prometheus text format.
+    :param collected: list of (name, help text, kind, samples) tuples, from Registry.collect
+    :return: the text
+    """
+    lines = []
+    for metric_name, help_text, kind, samples in collected:
+        lines.append(f'# HELP {metric_name} {help_text}')
+        lines.append(f'# TYPE {metric_name} {kind}')
+        lines.extend(f'{name} {format_value(value)}' for name, value in samples)
+    return '\n'.join(lines) + '\n'
+
+
+def merge_collected(collections):
+    """
+    Merges the metrics collected from several processes, adding up the samples of the same name.
+    :param collections: iterable of lists from Registry.collect
+    :return: the merged list
+    """
+    merged = {}
+    for collected in collections:
+        for metric_name, help_text, kind, samples in collected:
+            if metric_name not in merged:
+                merged[metric_name] = (help_text, kind, {})
+            totals = merged[metric_name][2]
+            for name, value in samples:
+                totals[name] = totals.get(name, 0) + value
+    return [(metric_name, help_text, kind, list(totals.items()))
+            for metric_name, (help_text, kind, totals) in merged.items()]
+
+
+REGISTRY = Registry()
+
+
+def rankings(leaderboard, query):
+    """
+    Answers a /leaderboard query.
+    :param leaderboard: the Leaderboard
+    :param query: dict of the query parameters, from parse_qs
+    :return: dict of the rankings asked for
+    """
+    def entries(ranked):
+        return [{'rank': rank, 'name': name, 'wins': wins} for rank, name, wins in ranked]
+
+    def number(key, default):
+        return max(0, min(int(query.get(key, [default])[0]), MAX_RANKING))
+
+    radius = number('radius', 2)
+    result = {'top': [{'rank': rank, 'name': name, 'wins': wins} for rank, (name, wins) in
+                      enumerate(leaderboard.top(number('top', 10)), start=1)]}
+    if 'player' in query:
+        name = query['player'][0]
+        rank = leaderboard.rank(name)
+        result['player'] = {'name': name, 'wins': leaderboard.wins(name), 'rank': rank,
+                            'around': entries(leaderboard.around(rank, radius)) if rank is not None else []}
+    if 'rank' in query:
+        result['around'] = entries(leaderboard.around(int(query['rank'][0]), radius))
+    return result
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Answers GET /metrics with the metrics of the server's registry, and GET /leaderboard with the rankings of its
+    leaderboard.
+    """
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/metrics':
+            self.reply(self.server.registry.render().encode('utf-8'), CONTENT_TYPE)
+        elif url.path == '/leaderboard' and self.server.leaderboard is not None:
+            try:
+                result = rankings(self.server.leaderboard(), parse_qs(url.query))
+            except ValueError:
+                self.send_error(400)
+                return
+            self.reply(json.dumps(result).encode('utf-8'), JSON_CONTENT_TYPE)
+        else:
+            self.send_error(404)
+
+    def reply(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are not printed with the game's events
+        pass
+
+
+def serve_metrics(port, host='127.0.0.1', registry=REGISTRY, leaderboard=None):
+    """
+    Serves the metrics over HTTP in a background thread.
+    :param port: port of the endpoint, 0 for any free port
+    :param host: address of the endpoint, the loopback interface by default
+    :param registry: the Registry to serve, or any object with a render method returning the text of the metrics
+    :param leaderboard: function returning the Leaderboard whose rankings are served, or None
+    :return: the HTTP server, or None if the port cannot be bound
+    """
+    try:
+        http_server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        print(f'Metrics are not served, port {port} cannot be bound: {e}')
+        return None
+    http_server.daemon_threads = True
+    http_server.registry = registry
+    http_server.leaderboard = leaderboard
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    print(f'Serving metrics at http://{host}:{http_server.server_address[1]}/metrics')
+    return http_server
+
+
+def count_open_fds():
+    """
+    Counts the open file descriptors of the process, sockets included.
+    :return: the number, or None if the platform does not list them
+    """
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+LOBBY_FILL = REGISTRY.histogram('trivia_lobby_fill_seconds',
+                                'Time from the first player joining a lobby to the lobby closing.', LOBBY_BUCKETS)
+BROADCAST = REGISTRY.histogram('trivia_broadcast_seconds', 'Time to send a message to every player of a game.')
+ANSWER_LATENCY = REGISTRY.histogram('trivia_answer_seconds',
+                                    'Time from sending a question to receiving the answer of a player.')
+ROUND_DURATION = REGISTRY.histogram('trivia_round_seconds', 'Duration of a round, from its header to its results.')
+LEADERBOARD_WRITE = REGISTRY.histogram('trivia_leaderboard_write_seconds',
+                                       'Time to record a winner in the leaderboard and read the top players.')
+GAMES = REGISTRY.counter('trivia_games_total', 'Games started.')
+ROUNDS = REGISTRY.counter('trivia_rounds_total', 'Rounds played.')
+PLAYERS_JOINED = REGISTRY.counter('trivia_players_joined_total', 'Players and bots that joined a lobby.')
+ANSWERS = REGISTRY.counter('trivia_answers_total', 'Answers received from players, bots included.')
+ANSWER_TIMEOUTS = REGISTRY.counter('trivia_answer_timeouts_total', 'Players that did not answer a question in time.')
+CONNECTED_PLAYERS = REGISTRY.gauge('trivia_connected_players', 'Players connected to the server, bots excluded.')
+ACTIVE_THREADS = REGISTRY.gauge('trivia_active_threads', 'Threads alive in the server process.',
+                                threading.active_count)
+OPEN_FDS = REGISTRY.gauge('process_open_fds', 'Open file descriptors of the server process, sockets included.',
+                          count_open_fds)
@@ -0,0 +1,163 @@
+import math
+import struct
+import time
+
+"""
+This module implements the UDP offers the servers broadcast and the clients listen for.
+
+The original offer (message type 0x2) holds only the server's name and TCP port, so a client could do no better than
+connect to the first offer it heard. The load-aware offer (message type 0x3) extends it with the server's current
+load: the size and capacity of its lobby, the number of games in progress and the estimated number of seconds until
+the next game starts. A client that listens for a short window can then choose the least busy server, which spreads
+the players of a LAN evenly across its servers.
+
+The servers broadcast both offers, so clients that only know the original offer keep working. The load-aware offer is
+sent to its own port (LOAD_OFFER_PORT), which only the clients that parse it listen on: the original clients unpack
+the exact 39 byte format on OFFER_PORT and would fail on a longer datagram. Offers are parsed with unpack_from and
+every field after the original ones is optional, so a longer offer from a newer server is accepted.
+
+The module includes the following functionalities:
+- ServerLoad: The current load of a server, updated by the server and sent in its offers.
+- Offer: An offer received by a client.
+- pack_offer: Packs an original or a load-aware offer.
+- parse_offer: Parses a received offer.
+- choose_offer: Chooses the best of several offers.
+"""
+
+# UDP ports of the original and of the load-aware offers
+OFFER_PORT = 13117
+LOAD_OFFER_PORT = 13118
+MAGIC_COOKIE = 0xabcddcba
+MESSAGE_TYPE_OFFER = 0x2
+MESSAGE_TYPE_LOAD_OFFER = 0x3
+
+OFFER = struct.Struct('!IB32sH')
+# Appended to OFFER in a load-aware offer: lobby size, lobby capacity, games in progress, estimated start
+LOAD = struct.Struct('!IIHH')
+NO_CAPACITY = 0
+UNKNOWN_START = 0xffff
+
+
+class ServerLoad:
+    """
+    The current load of a server. The server updates it as players join and games start and end, and the offers
+    broadcast afterwards carry it.
+    """
+
+    def __init__(self, capacity=NO_CAPACITY):
+        """
+        Initialize the ServerLoad object.
+
+        :param capacity: maximum number of players in a lobby, or NO_CAPACITY for no limit
+        """
+        self.lobby_size = 0
+        self.capacity = capacity or NO_CAPACITY
+        self.games_in_progress = 0
+        self.starts_at = None
+
+    def estimated_start(self, now=None):
+        """
+        Get the estimated number of seconds until the next game starts.
+        :param now: the current time.monotonic() time
+        :return: the seconds, or UNKNOWN_START if no game is expected to start
+        """
+        if self.starts_at is None:
+            return UNKNOWN_START
+        now = time.monotonic() if now is None else now
+        return min(UNKNOWN_START - 1, max(0, math.ceil(self.starts_at - now)))
+
+
+class Offer:
+    """
+    An offer received by a client.
+    """
+
+    def __init__(self, message_type, server_name, address, port, lobby_size=None, capacity=None,
+                 games_in_progress=None, estimated_start=None):
+        """
+        Initialize the Offer object. The load fields are None for an original offer.
+
+        :param message_type: MESSAGE_TYPE_OFFER or MESSAGE_TYPE_LOAD_OFFER
+        :param server_name: name of the server
+        :param address: IP address the offer was received from
+        :param port: TCP port of the server
+        :param lobby_size: number of players in the server's lobby
+        :param capacity: maximum number of players in a lobby, or NO_CAPACITY for no limit
+        :param games_in_progress: number of games the server is running
+        :param estimated_start: seconds until the next game starts, or UNKNOWN_START
+        """
+        self.message_type = message_type
+        self.server_name = server_name
+        self.address = address
+        self.port = port
+        self.lobby_size = lobby_size
+        self.capacity = capacity
+        self.games_in_progress = games_in_progress
+        self.estimated_start = estimated_start
+
+    def has_load(self):
+        return self.lobby_size is not None
+
+    def is_full(self):
+        return self.has_load() and self.capacity != NO_CAPACITY and self.lobby_size >= self.capacity
+
+    def __repr__(self):
+        return 'Offer(' + ', '.join(f'{key}={value!r}' for key, value in vars(self).items()) + ')'
+
+
+def pack_offer(server_name, port, load=None):
+    """
+    Packs an offer.
+    :param server_name: name of the server, padded to 32 bytes
+    :param port: TCP port of the server
+    :param load: ServerLoad of the server, or None for an original offer
+    :return: the packed offer
+    """
+    if load is None:
+        return OFFER.pack(MAGIC_COOKIE, MESSAGE_TYPE_OFFER, server_name.encode('utf-8'), port)
+    return OFFER.pack(MAGIC_COOKIE, MESSAGE_TYPE_LOAD_OFFER, server_name.encode('utf-8'), port) + LOAD.pack(
+        min(load.lobby_size, 0xffffffff), load.capacity, min(load.games_in_progress, 0xffff), load.estimated_start())
+
+
+def parse_offer(data, address):
+    """
+    Parses a received offer.
+    :param data: the received datagram
+    :param address: IP address the datagram was received from
+    :return: the Offer, or None if the datagram is not an offer
+    """
+    if len(data) < OFFER.size:
+        return None
+    magic_cookie, message_type, server_name, port = OFFER.unpack_from(data)
+    if magic_cookie != MAGIC_COOKIE or message_type not in (MESSAGE_TYPE_OFFER, MESSAGE_TYPE_LOAD_OFFER):
+        return None
+    server_name = server_name.rstrip(b'\0').decode('utf-8', errors='replace')
+    if message_type == MESSAGE_TYPE_LOAD_OFFER and len(data) >= OFFER.size + LOAD.size:
+        return Offer(message_type, server_name, address, port, *LOAD.unpack_from(data, OFFER.size))
+    return Offer(message_type, server_name, address, port)
+
+
+def offer_rank(offer):
+    """
+    Get the rank of an offer, lower is better: servers with room in their lobby first, then the ones running the
+    fewest games, with the smallest lobby and the soonest start. Offers without a load come last.
+    :param offer: the Offer
+    :return: a sortable rank
+    """
+    if not offer.has_load():
+        return 1, 1, 0, 0, UNKNOWN_START
+    return int(offer.is_full()), 0, offer.games_in_progress, offer.lobby_size, offer.estimated_start
+
+
+def choose_offer(offers):
+    """
+    Chooses the best of several offers. A server that sent both offers is judged by its load-aware offer.
+    :param offers: iterable of Offer
+    :return: the best Offer, or None if there are none
+    """
+    servers = {}
+    for offer in offers:
+        key = (offer.address, offer.port)
+        if key not in servers or offer.has_load():
+            servers[key] = offer
+    return min(servers.values(), key=offer_rank, default=None)
@@ -0,0 +1,62 @@
+"""
+This module implements the pacing policy of a game: how long the server pauses between the steps of a game, and how
+long it waits for the players' answers.
+
+The server used to pause for fixed times (5 seconds before every question, 2 seconds before the results, 1 second
+after them) and always allowed up to 15 seconds for the answers. A Pacing object can be given to a server or to a room
+to change these delays. With close_early, a round is closed as soon as every live player has answered; without it the
+answer window always lasts answer_timeout seconds, so every round has the same length.
+
+The module includes the following functionalities:
+- Pacing: The delays and answer window of a game.
+- DEFAULT_PACING: The original pacing of the game.
+- FAST_PACING: Short delays for bot-heavy and fast human lobbies.
+- NO_PACING: No delays at all, for benchmarks and replays.
+"""
+
+
+class Pacing:
+    """
+    The delays (in seconds) and answer window of a game.
+    """
+
+    def __init__(self, settle_delay=1, intro_delay=1, players_list_delay=2, question_delay=5, answer_timeout=15,
+                 close_early=True, results_delay=2, next_round_delay=1, winner_delay=2, rankings_delay=2,
+                 game_over_delay=1):
+        """
+        Initialize the Pacing object.
+
+        :param settle_delay: pause after the lobby closes, before checking which players are still connected
+        :param intro_delay: pause after the welcome message
+        :param players_list_delay: pause after the list of players
+        :param question_delay: pause between the round header and the question
+        :param answer_timeout: seconds the players have to answer a question
+        :param close_early: close the round as soon as every live player has answered
+        :param results_delay: pause before announcing the results of a round or the winner
+        :param next_round_delay: pause after the results, before the next round
+        :param winner_delay: pause before announcing the winner of a game
+        :param rankings_delay: pause after the winner and the all time rankings are announced
+        :param game_over_delay: pause after the game over message
+        """
+        self.settle_delay = settle_delay
+        self.intro_delay = intro_delay
+        self.players_list_delay = players_list_delay
+        self.question_delay = question_delay
+        self.answer_timeout = answer_timeout
+        self.close_early = close_early
+        self.results_delay = results_delay
+        self.next_round_delay = next_round_delay
+        self.winner_delay = winner_delay
+        self.rankings_delay = rankings_delay
+        self.game_over_delay = game_over_delay
+
+    def __repr__(self):
+        return 'Pacing(' + ', '.join(f'{key}={value!r}' for key, value in vars(self).items()) + ')'
+
+
+DEFAULT_PACING = Pacing()
+FAST_PACING = Pacing(settle_delay=0.2, intro_delay=0.2, players_list_delay=0.5, question_delay=1, answer_timeout=10,
+                     results_delay=0.5, next_round_delay=0.2, winner_delay=0.5, rankings_delay=0.5,
+                     game_over_delay=0.2)
+NO_PACING = Pacing(settle_delay=0, intro_delay=0, players_list_delay=0, question_delay=0, results_delay=0,
+                   next_round_delay=0, winner_delay=0, rankings_delay=0, game_over_delay=0)
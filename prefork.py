@@ -0,0 +1,301 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+from multiprocessing.connection import wait
+
+import metrics
+import server
+
+from async_server import AsyncTriviaServer
+from leaderboard import Leaderboard
+
+"""
+This script implements the pre-fork mode of the Trivia King server.
+
+A server is a single Python process, so its threads share one GIL and it uses one core however many the host has. In
+pre-fork mode a supervisor starts several worker processes that all accept on the same port: every worker binds its
+listening socket with SO_REUSEPORT and the kernel balances the arriving connections between them. Every worker runs
+its own lobbies and games with the threaded or the asyncio server, so throughput scales with the cores of the host.
+
+The supervisor owns what the workers share:
+- The leaderboard: a worker's get_leaderboard returns a RemoteLeaderboard, which sends every increment and top-K query
+  to the supervisor over the worker's pipe. The supervisor is the only process that writes the leaderboard, so the
+  writes of all the workers are applied one at a time to a single database, and its rankings are served by the
+  supervisor's in-memory index.
+- The metrics: every worker sends its collected metrics to the supervisor every METRICS_INTERVAL seconds, and the
+  supervisor serves the sum of them, and of the workers that died, on its metrics endpoint.
+- The workers themselves: a worker that dies is restarted, after RESTART_DELAY seconds if it died right after starting,
+  so a worker that keeps crashing does not spin the supervisor.
+- The UDP offers, broadcast once for all the workers.
+
+SO_REUSEPORT is needed, so the pre-fork mode runs on Linux and the BSDs but not on Windows.
+
+The script includes the following functionalities:
+- RemoteLeaderboard: The leaderboard of a worker, kept by the supervisor.
+- run_worker: Runs a worker process.
+- Supervisor: Starts, watches and restarts the workers, and serves their leaderboard and metrics.
+
+Usage example:
+    python prefork.py --port 5000 --workers 4
+    python prefork.py --port 5000 --engine threaded --metrics-port 9100
+"""
+
+METRICS_INTERVAL = 1
+RESTART_DELAY = 1
+WORKER_RESTARTS = metrics.REGISTRY.counter('trivia_worker_restarts_total', 'Worker processes restarted after dying.')
+WORKERS = metrics.REGISTRY.gauge('trivia_workers', 'Worker processes running.')
+
+
+class RemoteLeaderboard(Leaderboard):
+    """
+    The leaderboard of a worker process. Every operation is a request to the supervisor over the worker's pipe.
+    """
+
+    def __init__(self, conn):
+        """
+        Initialize the RemoteLeaderboard object.
+
+        :param conn: the worker's end of the pipe to the supervisor
+        """
+        self.conn = conn
+        self.lock = threading.Lock()
+
+    def request(self, *message):
+        """
+        Sends a request to the supervisor and waits for its reply.
+        :param message: the operation and its arguments
+        :return: the reply
+        """
+        with self.lock:
+            self.conn.send(message)
+            return self.conn.recv()
+
+    def increment(self, name, amount=1):
+        return self.request('increment', name, amount)
+
+    def wins(self, name):
+        return self.request('wins', name)
+
+    def top(self, k=3):
+        return self.request('top', k)
+
+    def rank(self, name):
+        return self.request('rank', name)
+
+    def around(self, rank, radius=2):
+        return self.request('around', rank, radius)
+
+    def push_metrics(self):
+        """
+        Sends the worker's metrics to the supervisor.
+        """
+        with self.lock:
+            self.conn.send(('metrics', metrics.REGISTRY.collect()))
+
+
+def push_metrics(leaderboard, interval=METRICS_INTERVAL):
+    """
+    Sends the worker's metrics to the supervisor every interval seconds, and ends the worker when the supervisor is
+    gone.
+    :param leaderboard: the worker's RemoteLeaderboard
+    :param interval: seconds between two updates
+    """
+    while True:
+        try:
+            leaderboard.push_metrics()
+        except (OSError, EOFError):
+            # The supervisor died, a worker is never left running on its own
+            os._exit(1)
+        time.sleep(interval)
+
+
+def run_worker(host, port, conn, engine='async', fill_bots=True, add_bots=0):
+    """
+    Runs a worker process: a server accepting on the shared port, whose leaderboard is kept by the supervisor.
+    :param host: The IP address of the server.
+    :param port: The port number shared by the workers.
+    :param conn: the worker's end of the pipe to the supervisor
+    :param engine: 'async' for the asyncio server, 'threaded' for the threaded server
+    :param fill_bots: Whether to add bots to the game if there are not enough human players.
+    :param add_bots: The number of additional bots to add to every game.
+    """
+    server.startup(host=host, port=port)
+    server.leaderboard = RemoteLeaderboard(conn)
+    threading.Thread(target=push_metrics, args=(server.leaderboard,), daemon=True).start()
+    try:
+        if engine == 'threaded':
+            server.tcp_server(host, port, fill_bots, add_bots, reuse_port=True)
+        else:
+            asyncio.run(AsyncTriviaServer(host, port, fill_bots, add_bots, reuse_port=True).serve())
+    except KeyboardInterrupt:
+        pass
+
+
+class Supervisor:
+    """
+    Starts the worker processes, restarts the ones that die, and serves their leaderboard and metrics.
+    """
+
+    def __init__(self, host, port, workers=None, engine='async', fill_bots=True, add_bots=0):
+        """
+        Initialize the Supervisor object.
+
+        :param host: The IP address of the server.
+        :param port: The port number shared by the workers.
+        :param workers: The number of worker processes (default=the number of cores).
+        :param engine: 'async' for the asyncio server, 'threaded' for the threaded server.
+        :param fill_bots: Whether to add bots to the game if there are not enough human players.
+        :param add_bots: The number of additional bots to add to every game.
+        """
+        self.host = host
+        self.port = port
+        self.count = workers or os.cpu_count() or 1
+        self.engine = engine
+        self.fill_bots = fill_bots
+        self.add_bots = add_bots
+        # The workers are spawned rather than forked, so they do not inherit the supervisor's threads and database
+        self.context = multiprocessing.get_context('spawn')
+        # index -> (process, conn, start time) of the running workers
+        self.workers = {}
+        # index -> time.monotonic() time at which a dead worker is restarted
+        self.restarts = {}
+        # index -> the last metrics collected by the worker
+        self.collected = {}
+        # The counters and histograms of the workers that died, so the totals never go down
+        self.retired = []
+        self.lock = threading.Lock()
+
+    def start_worker(self, index):
+        """
+        Starts a worker process.
+        :param index: index of the worker
+        """
+        conn, worker_conn = self.context.Pipe()
+        process = self.context.Process(target=run_worker, name=f'worker-{index}', daemon=True,
+                                       args=(self.host, self.port, worker_conn, self.engine, self.fill_bots,
+                                             self.add_bots))
+        process.start()
+        worker_conn.close()
+        self.workers[index] = (process, conn, time.monotonic())
+        WORKERS.set(len(self.workers))
+
+    def worker_died(self, index):
+        """
+        Forgets a dead worker, keeps its counters and schedules its restart.
+        :param index: index of the worker
+        """
+        process, conn, started = self.workers.pop(index)
+        process.join()
+        conn.close()
+        WORKERS.set(len(self.workers))
+        print(f'Worker {index} died with exit code {process.exitcode}, restarting it.')
+        with self.lock:
+            collected = self.collected.pop(index, [])
+            self.retired = metrics.merge_collected(
+                [self.retired, [metric for metric in collected if metric[2] != 'gauge']])
+        # A worker that dies right after starting is restarted after a delay
+        delay = RESTART_DELAY if time.monotonic() - started < RESTART_DELAY else 0
+        self.restarts[index] = time.monotonic() + delay
+
+    def handle(self, index, conn, message):
+        """
+        Handles a message of a worker: a leaderboard request, answered at once, or the worker's metrics.
+        :param index: index of the worker
+        :param conn: the supervisor's end of the worker's pipe
+        :param message: the message received
+        """
+        operation = message[0]
+        if operation == 'metrics':
+            with self.lock:
+                self.collected[index] = message[1]
+            return
+        leaderboard = server.get_leaderboard()
+        if operation == 'increment':
+            reply = leaderboard.increment(message[1], message[2])
+        elif operation == 'wins':
+            reply = leaderboard.wins(message[1])
+        elif operation == 'rank':
+            reply = leaderboard.rank(message[1])
+        elif operation == 'around':
+            reply = leaderboard.around(message[1], message[2])
+        else:
+            reply = leaderboard.top(message[1])
+        conn.send(reply)
+
+    def render(self):
+        """
+        Renders the metrics of the supervisor and all the workers, as the registry of the metrics endpoint.
+        :return: the text in the Prometheus text format
+        """
+        with self.lock:
+            collections = [metrics.REGISTRY.collect(), self.retired] + list(self.collected.values())
+        return metrics.render_collected(metrics.merge_collected(collections))
+
+    def run(self):
+        """
+        Starts the workers and supervises them until interrupted.
+        """
+        for index in range(self.count):
+            self.start_worker(index)
+        print(f'Started {self.count} {self.engine} workers on {self.host}:{self.port}')
+        try:
+            while True:
+                now = time.monotonic()
+                for index, restart_at in list(self.restarts.items()):
+                    if now >= restart_at:
+                        del self.restarts[index]
+                        self.start_worker(index)
+                        WORKER_RESTARTS.inc()
+                timeout = max(0.0, min(self.restarts.values()) - now) if self.restarts else None
+                conns = {conn: index for index, (process, conn, started) in self.workers.items()}
+                sentinels = {process.sentinel: index for index, (process, conn, started) in self.workers.items()}
+                for ready in wait(list(conns) + list(sentinels), timeout):
+                    if ready in conns and conns[ready] in self.workers:
+                        try:
+                            self.handle(conns[ready], ready, ready.recv())
+                        except (OSError, EOFError):
+                            # The worker died, its sentinel is ready too
+                            pass
+                    elif ready in sentinels and sentinels[ready] in self.workers:
+                        self.worker_died(sentinels[ready])
+        finally:
+            for process, conn, started in self.workers.values():
+                process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-fork mode of the Trivia King server.')
+    parser.add_argument('--host', help='address to listen on (default=the local address)')
+    parser.add_argument('--port', type=int, help='port shared by the workers (default=an available port)')
+    parser.add_argument('--workers', type=int, help='number of worker processes (default=the number of cores)')
+    parser.add_argument('--engine', choices=['async', 'threaded'], default='async', help='server run by the workers')
+    parser.add_argument('--add-bots', type=int, default=0, help='additional bots in every game')
+    parser.add_argument('--metrics-port', type=int, help='port of the metrics endpoint of all the workers')
+    parser.add_argument('--no-broadcast', dest='broadcast', action='store_false', help="don't broadcast UDP offers")
+    args = parser.parse_args()
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        parser.error('the pre-fork mode needs SO_REUSEPORT, which this platform does not support')
+    # The metrics of all the workers are served by the supervisor, so the workers must not serve their own
+    metrics_port = os.environ.pop('TRIVIA_METRICS_PORT', None)
+    metrics_port = args.metrics_port if args.metrics_port is not None else metrics_port and int(metrics_port)
+    host, port = server.startup(host=args.host, port=args.port)
+
+    supervisor = Supervisor(host, port, args.workers, args.engine, add_bots=args.add_bots)
+    if metrics_port is not None:
+        metrics.serve_metrics(metrics_port, registry=supervisor, leaderboard=server.get_leaderboard)
+    if args.broadcast:
+        # The workers share the port, so one offer covers them all
+        threading.Thread(target=server.udp_broadcast, kwargs={'load': None, 'port': port}, daemon=True).start()
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        print('Shutting down... Goodbye!')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import struct
+
+"""
+This module implements the framed message protocol shared by the server, the client and the bots.
+
+Every TCP message is sent as a frame: a one byte message type, a four byte payload length (network byte order) and
+the UTF-8 encoded payload. Frames never coalesce or split from the receiver's point of view, so several messages can
+safely be batched into a single write, and the receiver dispatches on the message type instead of the message text.
+
+The module includes the following functionalities:
+- encode_frame: Encodes a single message into a frame.
+- encode_frames: Encodes several messages into one buffer, to be sent with a single write.
+- FrameReader: A buffered reader that decodes the frames received on a blocking socket.
+- recv_frame: Receives exactly one frame from a blocking socket.
+- encode_resume, decode_resume: The payload of a RESUME frame.
+- read_frame_async: Reads one frame from an asyncio StreamReader.
+- PING_FRAME, PONG_FRAME: The heartbeat frames.
+"""
+
+# Message types, client to server
+NAME = 0x01
+ANSWER = 0x02
+PONG = 0x03
+REPORT = 0x04  # cluster node to coordinator
+RESUME = 0x05  # the player's name and session token, instead of NAME, see encode_resume
+WATCH = 0x06  # a spectator, instead of NAME: the id of the room to watch, or empty for the next game
+BOT = 0x07  # a bot started by the server, instead of NAME: the bot's name
+
+# Message types, server to client
+INFO = 0x10
+ROUND = 0x11
+QUESTION = 0x12
+ELIMINATED = 0x13
+GAME_OVER = 0x14
+REDIRECT = 0x15
+SESSION = 0x16  # the session token of the player
+PING = 0x20
+
+HEADER = struct.Struct('!BI')
+MAX_PAYLOAD = 1 << 20
+RECV_SIZE = 4096
+
+
+class ProtocolError(OSError):
+    """
+    Raised when a malformed frame is received. It is an OSError so a broken stream is handled like a disconnect.
+    """
+
+
+def encode_frame(msg_type, payload):
+    """
+    Encodes a message into a frame.
+    :param msg_type: type of the message
+    :param payload: str or bytes payload of the message
+    :return: the frame as bytes
+    """
+    if isinstance(payload, str):
+        payload = payload.encode()
+    return HEADER.pack(msg_type, len(payload)) + payload
+
+
+def encode_frames(messages):
+    """
+    Encodes several messages into one buffer.
+    :param messages: iterable of (msg_type, payload) pairs
+    :return: the frames as bytes
+    """
+    return b''.join(encode_frame(msg_type, payload) for msg_type, payload in messages)
+
+
+def decode_header(header):
+    """
+    Decodes and validates a frame header.
+    :param header: the HEADER.size bytes of the header
+    :return: the message type and the payload length
+    """
+    msg_type, length = HEADER.unpack(header)
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(f"Frame of {length} bytes exceeds the maximum payload size")
+    return msg_type, length
+
+
+class FrameReader:
+    """
+    A buffered reader of frames from a blocking socket. Data is received in large chunks and every frame is decoded
+    exactly once.
+    """
+
+    def __init__(self, sock):
+        """
+        Initialize the FrameReader object.
+
+        :param sock: the socket to read from
+        """
+        self.sock = sock
+        self.buffer = bytearray()
+
+    def pop_frame(self):
+        """
+        Removes a complete frame from the buffer.
+        :return: (msg_type, text) of the frame, or None if the buffer does not hold a complete frame
+        """
+        if len(self.buffer) < HEADER.size:
+            return None
+        msg_type, length = decode_header(bytes(self.buffer[:HEADER.size]))
+        end = HEADER.size + length
+        if len(self.buffer) < end:
+            return None
+        text = self.buffer[HEADER.size:end].decode()
+        del self.buffer[:end]
+        return msg_type, text
+
+    def receive(self):
+        """
+        Receives once from the socket into the buffer, for a socket a selector reported readable.
+        :return: False if the connection was closed
+        """
+        data = self.sock.recv(RECV_SIZE)
+        self.buffer += data
+        return data != b''
+
+    def read_frame(self):
+        """
+        Reads the next frame, receiving from the socket as needed. Socket timeouts are propagated and keep the
+        partially received data in the buffer.
+        :return: (msg_type, text) of the frame, or None if the connection was closed
+        """
+        while True:
+            frame = self.pop_frame()
+            if frame is not None:
+                return frame
+            data = self.sock.recv(RECV_SIZE)
+            if data == b'':
+                return None
+            self.buffer += data
+
+
+def recv_exactly(sock, size):
+    """
+    Receives exactly size bytes from a blocking socket.
+    :param sock: the socket to read from
+    :param size: number of bytes to receive
+    :return: the bytes, or None if the connection was closed first
+    """
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if chunk == b'':
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def recv_frame(sock):
+    """
+    Receives exactly one frame from a blocking socket, without reading past its end. Used by the server, where the
+    socket is read one message at a time by different threads.
+    :param sock: the socket to read from
+    :return: (msg_type, text) of the frame, or None if the connection was closed
+    """
+    header = recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    msg_type, length = decode_header(header)
+    payload = recv_exactly(sock, length)
+    if payload is None:
+        return None
+    return msg_type, payload.decode()
+
+
+async def read_frame_async(reader):
+    """
+    Reads one frame from an asyncio StreamReader.
+    :param reader: the StreamReader to read from
+    :return: (msg_type, text) of the frame, or None if the connection was closed
+    """
+    # asyncio is only imported by the asyncio users of the protocol, where it is already loaded
+    import asyncio
+
+    try:
+        msg_type, length = decode_header(await reader.readexactly(HEADER.size))
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+    return msg_type, payload.decode()
+
+
+def encode_resume(token, name):
+    """
+    Encodes the payload of a RESUME frame. A client that sends RESUME instead of NAME keeps its connection between
+    games, and can reconnect to its seat with the token the server sent in a SESSION frame.
+    :param token: the session token, or '' to open a new session
+    :param name: the name of the player
+    :return: the payload
+    """
+    return f'{token} {name}'
+
+
+def decode_resume(payload):
+    """
+    Decodes the payload of a RESUME frame.
+    :param payload: the text of the frame
+    :return: (token, name), the token is '' for a new session
+    """
+    token, _, name = payload.partition(' ')
+    return token, name
+
+
+# The heartbeat frames have no payload, so they are encoded once
+PING_FRAME = encode_frame(PING, b'')
+PONG_FRAME = encode_frame(PONG, b'')
@@ -0,0 +1,203 @@
+import array
+import csv
+import json
+import mmap
+import os
+import random
+import struct
+
+"""
+This module implements the question banks of the Trivia King server.
+
+A question bank maps question ids (0 to len(bank) - 1) to a question and its answer. Besides the 20 questions built
+into the server, a bank can be loaded from a file of millions of questions:
+- JSONL: one {"question": "...", "answer": true} object per line.
+- CSV: one question,answer row per line, with an optional header row. Answers are true/false, T/F, Y/N or 1/0.
+
+On first load a compact binary index of the line offsets is written next to the file (<file>.idx), and rebuilt when
+the file changes. Both the file and the index are memory mapped, so startup only maps them and a game only pages in
+the questions it actually asks: startup time and resident memory stay flat as the bank grows.
+
+The module includes the following functionalities:
+- BuiltinQuestionBank: A bank over a dict of question to answer, like the server's built-in questions.
+- FileQuestionBank: A memory mapped bank over a JSONL or CSV file.
+- open_question_bank: Opens the bank stored in a file.
+"""
+
+INDEX_MAGIC = b'TKQI'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sIQQd')
+TRUE_ANSWERS = {'true', 't', 'y', 'yes', '1'}
+FALSE_ANSWERS = {'false', 'f', 'n', 'no', '0'}
+
+
+def parse_answer(value):
+    """
+    Parse the answer of a question.
+    :param value: bool, or a string like 'true', 'F', 'Y' or '0'
+    :return: True or False
+    """
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_ANSWERS:
+        return True
+    if text in FALSE_ANSWERS:
+        return False
+    raise ValueError(f"Invalid answer '{value}'")
+
+
+class BuiltinQuestionBank:
+    """
+    A question bank over a dict of question to answer. The questions are asked in the order of the dict.
+    """
+
+    def __init__(self, questions):
+        """
+        Initialize the BuiltinQuestionBank object.
+
+        :param questions: dict of question to answer (True or False)
+        """
+        self.entries = list(questions.items())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, question_id):
+        """
+        Get a question.
+        :param question_id: id of the question
+        :return: (question, answer) of the question
+        """
+        return self.entries[question_id]
+
+    def game_questions(self, limit):
+        """
+        Choose the questions of a game.
+        :param limit: maximum number of questions
+        :return: list of question ids
+        """
+        return list(range(min(limit, len(self))))
+
+
+class FileQuestionBank:
+    """
+    A memory mapped question bank over a JSONL or CSV file. The questions of a game are sampled at random.
+    """
+
+    def __init__(self, filename):
+        """
+        Initialize the FileQuestionBank object, building the index of the file if it is missing or out of date.
+
+        :param filename: path of the JSONL or CSV file
+        """
+        self.filename = filename
+        self.is_csv = filename.lower().endswith('.csv')
+        self.index_filename = filename + '.idx'
+        if not self.index_is_current():
+            self.build_index()
+        with open(filename, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.index_filename, 'rb') as f:
+            self.index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = INDEX_HEADER.unpack_from(self.index)[2]
+        # The offsets are read in place from the mapped index, count + 1 of them with the end of the last line
+        self.offsets = memoryview(self.index)[INDEX_HEADER.size:].cast('Q')
+
+    def index_is_current(self):
+        """
+        Check if the index exists and matches the current version of the file.
+        :return: True if the index can be used
+        """
+        try:
+            with open(self.index_filename, 'rb') as f:
+                magic, version, count, size, mtime = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+        except (OSError, struct.error):
+            return False
+        stat = os.stat(self.filename)
+        return (magic, version, size, mtime) == (INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime)
+
+    def build_index(self):
+        """
+        Scan the file once and write the offsets of its question lines to the index. Blank lines and a CSV header row
+        are skipped.
+        """
+        stat = os.stat(self.filename)
+        offsets = array.array('Q')
+        offset = 0
+        end = 0
+        with open(self.filename, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    if not offsets and self.is_csv and not self.is_csv_question(line):
+                        offset += len(line)
+                        continue
+                    # A question ends where the next one starts; blank lines in between are stripped when reading
+                    offsets.append(offset)
+                    end = offset + len(line)
+                offset += len(line)
+        if not offsets:
+            raise ValueError(f"No questions found in {self.filename}")
+        count = len(offsets)
+        offsets.append(end)
+        temp = self.index_filename + '.tmp'
+        with open(temp, 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, count, stat.st_size, stat.st_mtime))
+            offsets.tofile(f)
+        os.replace(temp, self.index_filename)
+
+    @staticmethod
+    def is_csv_question(line):
+        """
+        Check if a CSV line is a question, as opposed to a header row.
+        :param line: the raw line
+        :return: True if the line has a valid answer
+        """
+        row = next(csv.reader([line.decode()]), [])
+        try:
+            parse_answer(row[1])
+            return True
+        except (IndexError, ValueError):
+            return False
+
+    def __len__(self):
+        return self.count
+
+    def get(self, question_id):
+        """
+        Get a question, reading only its line from the mapped file.
+        :param question_id: id of the question
+        :return: (question, answer) of the question
+        """
+        if not 0 <= question_id < self.count:
+            raise IndexError(f"Question id {question_id} out of range")
+        start = self.offsets[question_id]
+        end = self.offsets[question_id + 1]
+        line = self.data[start:end].decode().strip()
+        if self.is_csv:
+            row = next(csv.reader([line]))
+            return row[0], parse_answer(row[1])
+        entry = json.loads(line)
+        return entry['question'], parse_answer(entry['answer'])
+
+    def game_questions(self, limit):
+        """
+        Choose the questions of a game at random.
+        :param limit: maximum number of questions
+        :return: list of question ids
+        """
+        return random.sample(range(self.count), min(limit, self.count))
+
+    def close(self):
+        self.offsets.release()
+        self.index.close()
+        self.data.close()
+
+
+def open_question_bank(filename):
+    """
+    Opens the question bank stored in a JSONL or CSV file.
+    :param filename: path of the file
+    :return: the FileQuestionBank
+    """
+    return FileQuestionBank(filename)
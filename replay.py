@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+
+import async_server
+import messages
+import server
+
+from game_log import GAME_LOG_FILE, GameLog
+from pacing import NO_PACING
+from question_bank import open_question_bank
+from scoring import decode_answer
+from virtual_player import ScriptedPlayer
+
+"""
+This script replays the games of a game log (see game_log.py) at full speed.
+
+Every player of a logged game is replaced by a ScriptedPlayer that gives the answers the player gave, and the rounds
+are played again by the round engine of the threaded server (server.play) or of the asyncio server
+(async_server.play), without the pacing delays. The eliminations of every replayed round are checked against the
+log, so a change to the round engine that changes the outcome of a game is caught, and the time spent in the engine is
+reported, which makes recorded games realistic traffic for benchmarks.
+
+The correct answer of every round is read from the log, so a game can be replayed without the question bank it was
+played with; the bank is only needed to show the questions' text.
+
+The script includes the following functionalities:
+- LoggedQuestionBank: The questions of the logged games, with the answers recorded in the log.
+- script_players: Makes the scripted players of a logged game.
+- replay_game: Replays a logged game and checks its eliminations.
+
+Usage example:
+    python replay.py games.log
+    python replay.py games.log --engine async --repeat 100
+    python replay.py games.log --game 3 --bank questions.jsonl --verbose
+"""
+
+
+class LoggedQuestionBank:
+    """
+    The questions of the logged games, with the answers recorded in the log. The text is read from a question bank if
+    one is given.
+    """
+
+    def __init__(self, bank=None):
+        """
+        Initialize the LoggedQuestionBank object.
+
+        :param bank: the question bank the games were played with, or None
+        """
+        self.bank = bank
+        self.answers = {}
+
+    def add(self, question_id, answer):
+        self.answers[question_id] = answer
+
+    def get(self, question_id):
+        """
+        Get a question and its logged answer.
+        :param question_id: id of the question
+        :return: (question, answer)
+        """
+        if self.bank is not None:
+            try:
+                return self.bank.get(question_id)[0], self.answers[question_id]
+            except (IndexError, KeyError):
+                pass
+        return f'Question #{question_id}', self.answers[question_id]
+
+
+def script_players(game):
+    """
+    Makes the scripted players of a logged game.
+    :param game: the Game read from the log
+    :return: dict of player id to ScriptedPlayer
+    """
+    answers = {player_id: [] for player_id in game.players}
+    for logged_round in game.rounds:
+        for player_id, (code, delay) in logged_round['answers'].items():
+            answers[player_id].append(decode_answer(code))
+    return {player_id: ScriptedPlayer(player_id, name, answers[player_id])
+            for player_id, (name, bot) in game.players.items()}
+
+
+def replay_game(game, bank, loop=None):
+    """
+    Replays a logged game with the round engine of a server.
+    :param game: the Game read from the log
+    :param bank: the LoggedQuestionBank of the log
+    :param loop: the event loop to run async_server.play on, or None to run server.play
+    :return: (number of rounds whose eliminations differ from the log, seconds spent in the engine)
+    """
+    players = script_players(game)
+    for logged_round in game.rounds:
+        bank.add(logged_round['question_id'], logged_round['answer'])
+    game_messages = messages.GameMessages({pid: player.name for pid, player in players.items()},
+                                          [bank.get(logged_round['question_id'])[0] for logged_round in game.rounds])
+    mismatches = 0
+    elapsed = 0.0
+    for number, logged_round in enumerate(game.rounds, start=1):
+        # Players that disconnected before the round are not in it
+        for player_id in [pid for pid in players if pid not in logged_round['answers']]:
+            players.pop(player_id)
+        before = set(players)
+        next_round = game_messages.round_header(number, players.keys())
+        started = time.perf_counter()
+        if loop is not None:
+            loop.run_until_complete(async_server.play(players, logged_round['question_id'], next_round,
+                                                      game_messages, NO_PACING, bank))
+        else:
+            server.play(players, {pid: player.name for pid, player in players.items()}, logged_round['question_id'],
+                        [], next_round, game_messages, NO_PACING, bank)
+        elapsed += time.perf_counter() - started
+        if before - set(players) != set(logged_round['eliminated']):
+            mismatches += 1
+    return mismatches, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays the games of a game log at full speed.')
+    parser.add_argument('log', nargs='?', default=GAME_LOG_FILE, help=f'the game log (default={GAME_LOG_FILE})')
+    parser.add_argument('--game', type=int, help='replay only the game with this index')
+    parser.add_argument('--bank', help='the question bank the games were played with, to show the questions')
+    parser.add_argument('--engine', choices=['threaded', 'async'], default='threaded', help='round engine to drive')
+    parser.add_argument('--repeat', type=int, default=1, help='number of times every game is replayed')
+    parser.add_argument('--verbose', action='store_true', help="print the replayed games' messages")
+    args = parser.parse_args()
+
+    log = GameLog(args.log)
+    offsets = log.offsets()
+    if args.game is not None:
+        offsets = offsets[args.game:args.game + 1]
+    bank = LoggedQuestionBank(open_question_bank(args.bank) if args.bank else server.builtin_bank)
+    games = [log.read_game(offset) for offset in offsets]
+
+    rounds = mismatches = 0
+    elapsed = 0.0
+    with contextlib.ExitStack() as stack:
+        loop = None
+        if args.engine == 'async':
+            loop = asyncio.new_event_loop()
+            stack.callback(loop.close)
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+        for _ in range(args.repeat):
+            for game in games:
+                game_mismatches, game_elapsed = replay_game(game, bank, loop)
+                rounds += len(game.rounds)
+                mismatches += game_mismatches
+                elapsed += game_elapsed
+
+    print(f'Replayed {len(games) * args.repeat} games, {rounds} rounds in {elapsed:.3f}s '
+          f'({rounds / elapsed if elapsed else 0:.0f} rounds/s) with the {args.engine} engine.')
+    if mismatches:
+        print(f'{mismatches} rounds eliminated other players than in the log.')
+    raise SystemExit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import array
+import time
+
+"""
+This module implements the batch scoring of a round.
+
+Every answer used to be mapped to a human readable result string as it arrived, with the correct answer looked up
+again for every player, and the round was then judged by building lists over those strings. A RoundScore instead
+stores the raw answer of every player as a one byte code in a compact array. When the answer window closes the whole
+round is scored at once: a single translation of the array (done in C by bytes.translate) gives the outcome of every
+player, and the elimination mask and result counts are derived from it. The cost of scoring stays negligible even in
+lobbies of tens of thousands of players, and the messages are formatted from the outcomes separately (see messages.py).
+
+The module includes the following functionalities:
+- encode_answer: Maps the text of an answer to its answer code.
+- decode_answer: Maps an answer code back to the text of an answer, e.g. to replay a logged game.
+- RoundScore: The answer codes of a round and their scoring.
+"""
+
+# Answer codes, as stored while the answers arrive
+NO_ANSWER = 0
+ANSWER_TRUE = 1
+ANSWER_FALSE = 2
+ANSWER_LATE = 3
+ANSWER_INVALID = 4
+
+# Outcome codes, once the round is scored
+MISSING = 0
+CORRECT = 1
+INCORRECT = 2
+LATE = 3
+INVALID = 4
+OUTCOMES = (MISSING, CORRECT, INCORRECT, LATE, INVALID)
+
+ANSWER_CODES = {'0': ANSWER_FALSE, '1': ANSWER_TRUE, 'Y': ANSWER_TRUE, 'N': ANSWER_FALSE, 'T': ANSWER_TRUE,
+                'F': ANSWER_FALSE, 'NONE': ANSWER_LATE}
+ANSWER_TEXTS = {NO_ANSWER: None, ANSWER_TRUE: '1', ANSWER_FALSE: '0', ANSWER_LATE: 'NONE', ANSWER_INVALID: '?'}
+
+
+def translation(mapping):
+    """
+    Build a 256 byte translation table for bytes.translate.
+    :param mapping: dict of code to the code it is translated to; other codes are translated to 0
+    :return: the table
+    """
+    table = bytearray(256)
+    for code, value in mapping.items():
+        table[code] = value
+    return bytes(table)
+
+
+# The answer codes translated to outcome codes, by correct answer
+OUTCOME_TABLES = {
+    True: translation({ANSWER_TRUE: CORRECT, ANSWER_FALSE: INCORRECT, ANSWER_LATE: LATE, ANSWER_INVALID: INVALID}),
+    False: translation({ANSWER_TRUE: INCORRECT, ANSWER_FALSE: CORRECT, ANSWER_LATE: LATE, ANSWER_INVALID: INVALID}),
+}
+# The outcome codes translated to 1 for the players that are eliminated
+ELIMINATION_TABLE = translation({INCORRECT: 1, LATE: 1, INVALID: 1})
+
+
+def encode_answer(answer):
+    """
+    Maps the text of an answer to its answer code.
+    :param answer: the text received from the player
+    :return: the answer code
+    """
+    return ANSWER_CODES.get(answer.strip().upper(), ANSWER_INVALID)
+
+
+def decode_answer(code):
+    """
+    Maps an answer code back to the text of an answer with that code.
+    :param code: the answer code
+    :return: the text, or None for NO_ANSWER
+    """
+    return ANSWER_TEXTS[code]
+
+
+class RoundScore:
+    """
+    The answer codes of the players of a round, scored in one batch when the answer window closes.
+    """
+
+    def __init__(self, player_ids):
+        """
+        Initialize the RoundScore object. Every player starts with NO_ANSWER. The time every answer arrives is kept
+        for the game log.
+
+        :param player_ids: ids of the players of the round
+        """
+        self.player_ids = list(player_ids)
+        self.positions = {pid: i for i, pid in enumerate(self.player_ids)}
+        self.codes = array.array('B', bytes(len(self.player_ids)))
+        self.opened_at = time.monotonic()
+        self.answered_at = array.array('d', bytes(8 * len(self.player_ids)))
+        self.outcomes = None
+        self.counts = None
+
+    def record(self, player_id, answer):
+        """
+        Records the answer of a player.
+        :param player_id: id of the player
+        :param answer: the text received from the player
+        """
+        position = self.positions[player_id]
+        self.codes[position] = encode_answer(answer)
+        self.answered_at[position] = time.monotonic()
+
+    def score(self, correct_answer):
+        """
+        Scores the round.
+        :param correct_answer: the answer to the question, True or False
+        :return: the outcome code of every player, in the order of player_ids
+        """
+        self.outcomes = self.codes.tobytes().translate(OUTCOME_TABLES[bool(correct_answer)])
+        self.counts = {outcome: self.outcomes.count(outcome) for outcome in OUTCOMES}
+        return self.outcomes
+
+    def answered(self):
+        """
+        :return: number of players with an outcome, i.e. that answered, were late or gave an invalid input
+        """
+        return len(self.outcomes) - self.counts[MISSING]
+
+    def nobody_eliminated(self):
+        """
+        Check if everyone with an outcome is either correct or wrong, in which case nobody is eliminated.
+        :return: True if nobody is eliminated this round
+        """
+        return self.counts[CORRECT] == 0 or self.counts[CORRECT] == self.answered()
+
+    def elimination_mask(self):
+        """
+        :return: bytes with 1 for every player that is eliminated, in the order of player_ids
+        """
+        return self.outcomes.translate(ELIMINATION_TABLE)
+
+    def eliminated(self):
+        """
+        :return: list of the ids of the players that are eliminated
+        """
+        mask = self.elimination_mask()
+        return [self.player_ids[i] for i in range(len(mask)) if mask[i]] if mask.count(1) else []
+
+    def results(self):
+        """
+        :return: list of (player id, outcome code) of the players with an outcome
+        """
+        return [(pid, outcome) for pid, outcome in zip(self.player_ids, self.outcomes) if outcome != MISSING]
@@ -1,24 +1,43 @@
-import concurrent.futures
-import copy
 import random
+import selectors
 import socket
-import struct
 import sys
 import time
 import ipaddress
+import os
 import threading
-import warnings
 
-# Filter out the specific warning message
-warnings.filterwarnings("ignore", message="Your system is avx2 capable but pygame was not built with support for it.")
+import protocol
 
-import pygame
+import messages
 
-from colorama import Fore
+from scoring import RoundScore
 
-from Bot import Bot
+from virtual_player import VirtualPlayer, is_virtual
 
-from openpyxl import load_workbook
+from bot_pool import BotPool
+
+from offers import LOAD_OFFER_PORT, MAGIC_COOKIE, MESSAGE_TYPE_OFFER, OFFER_PORT, ServerLoad, pack_offer
+
+from pacing import DEFAULT_PACING
+
+from heartbeat import DEFAULT_HEARTBEAT, is_connection_alive, tune_keepalive
+
+from leaderboard import LEADERBOARD_FILE, open_leaderboard
+
+from question_bank import BuiltinQuestionBank, open_question_bank
+
+from game_log import GAME_LOG_FILE, GameLog, GameRecorder
+
+from lobby import DEFAULT_LOBBY, Lobby
+
+from sessions import RESUME_WINDOW, SessionTable
+
+from spectators import SpectatorFeed, SpectatorHub
+
+from audio import SoundBank
+
+import metrics
 
 """
 This script implements a server for the Trivia King game.
@@ -35,20 +54,22 @@ The script includes the following functionalities:
 The server uses the following external libraries:
 - colorama: for colored console output
 - pygame: for playing sounds
-- openpyxl: for updating and retrieving data from an Excel file to maintain player scores
+- openpyxl: for importing the player scores of the legacy Excel file into the leaderboard
 
 The server functions include:
 - udp_broadcast: Broadcasts server offers via UDP messages.
 - tcp_server: Manages client connections, handles game logic, and communicates with clients over TCP/IP.
 - play_sound: Plays a sound file.
-- update_excel: Updates an Excel file with player scores.
-- get_top_three_players: Retrieves the top three players from the Excel file.
+- update_excel: Updates an Excel file with player scores (legacy, replaced by the leaderboard).
+- get_top_three_players: Retrieves the top three players from the Excel file (legacy, replaced by the leaderboard).
+- get_leaderboard: Opens the leaderboard that maintains player scores.
+- startup: Resolves the configuration of the server, and serves its metrics when asked to.
 - pad_server_name: Pads the server name to a fixed length for broadcasting.
 - get_local_ipv4_address: Retrieves the local IPv4 address of the server.
 - find_available_port: Finds an available port for the server to bind to.
+- create_server_socket: Creates the listening TCP socket of the server.
 - get_local_broadcast_ip: Retrieves the local broadcast IP address.
 - check_if_disconnected: Checks if any clients have disconnected.
-- everyone_wrong_or_right: Checks if all players either answered correctly or incorrectly.
 - safe_sendall: Safely sends a message to all clients, handling potential socket errors.
 - send_to_all: Sends a message to all clients.
 - elimination_msg: Sends an elimination message to a specific client.
@@ -59,13 +80,12 @@ The server functions include:
 
 def play_sound(sound_file):
     """
-    Play a sound file.
+    Play a sound file, decoded once and cached by the server's SoundBank. Nothing is played in headless mode.
     :param sound_file:
     :return:
     """
-    pygame.mixer.init()
-    sound = pygame.mixer.Sound(sound_file)
-    sound.play()
+    if not HEADLESS:
+        sound_bank.play(sound_file)
 
 def update_excel(filename, name):
     """
@@ -75,6 +95,8 @@ def update_excel(filename, name):
     - filename: The filename of the Excel file.
     - name: The name of the winner.
     """
+    from openpyxl import load_workbook
+
     try:
         # Load the workbook with write access
         wb = load_workbook(filename, read_only=False)
@@ -121,6 +143,8 @@ def get_top_three_players(filename):
     Returns:
     A list of tuples containing the top three players with their names and wins.
     """
+    from openpyxl import load_workbook
+
     try:
         # Load the workbook
         wb = load_workbook(filename, read_only=True)
@@ -149,6 +173,23 @@ def get_top_three_players(filename):
         pass
 
 
+leaderboard = None
+leaderboard_lock = threading.Lock()
+
+
+def get_leaderboard():
+    """
+    Get the leaderboard of the server, opening it on first use. The wins of the legacy winners.xlsx file are imported
+    the first time the leaderboard is created.
+    :return: the Leaderboard
+    """
+    global leaderboard
+    with leaderboard_lock:
+        if leaderboard is None:
+            leaderboard = open_leaderboard(LEADERBOARD_FILE, import_from='winners.xlsx')
+        return leaderboard
+
+
 # Function to pad server name to 32 characters
 def pad_server_name(server_name):
     return server_name.ljust(32, '\0')
@@ -159,10 +200,13 @@ def get_local_ipv4_address():
     Get the local IPv4 address of the server.
     :return:
     """
-    # Get the local hostname
-    temp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    temp_sock.connect(("8.8.8.8", 80))
-    return temp_sock.getsockname()[0]
+    # Get the local hostname; without a network the server falls back to the loopback address
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as temp_sock:
+            temp_sock.connect(("8.8.8.8", 80))
+            return temp_sock.getsockname()[0]
+    except OSError:
+        return '127.0.0.1'
 
 def find_available_port():
     """
@@ -177,11 +221,44 @@ def find_available_port():
 
 
 # Define constants
-MAGIC_COOKIE = 0xabcddcba
-MESSAGE_TYPE_OFFER = 0x2
-LOCAL_IP = get_local_ipv4_address()
 server_name = pad_server_name("Lucky Bunnies")
-available_port = find_available_port()
+# The load of the server, sent in the load-aware offers
+server_load = ServerLoad()
+# Resolved by startup, so importing the module has no side effects
+LOCAL_IP = None
+available_port = None
+HEADLESS = False
+sound_bank = SoundBank()
+metrics_server = None
+
+
+def startup(host=None, port=None, headless=None, metrics_port=None):
+    """
+    Resolves the configuration of the server: its IP address, its TCP port and whether it runs headless. The values
+    given are used as they are, the others are found once, on the first call. The metrics are served on the first
+    call that is given a metrics port, with the rankings of the leaderboard.
+    :param host: IP address of the server (default=the local IPv4 address)
+    :param port: TCP port of the server (default=an available port)
+    :param headless: whether to run without audio (default=the TRIVIA_HEADLESS environment variable)
+    :param metrics_port: port of the HTTP metrics endpoint (default=the TRIVIA_METRICS_PORT environment variable, or
+                         no endpoint)
+    :return: the IP address and the TCP port
+    """
+    global LOCAL_IP, available_port, HEADLESS, metrics_server
+    if host is not None or LOCAL_IP is None:
+        LOCAL_IP = host or get_local_ipv4_address()
+    if port is not None or available_port is None:
+        available_port = port or find_available_port()
+    if headless is not None:
+        HEADLESS = headless
+    else:
+        HEADLESS = HEADLESS or os.environ.get('TRIVIA_HEADLESS', '') not in ('', '0')
+    if metrics_port is None and os.environ.get('TRIVIA_METRICS_PORT'):
+        metrics_port = int(os.environ['TRIVIA_METRICS_PORT'])
+    if metrics_port is not None and metrics_server is None:
+        metrics_server = metrics.serve_metrics(metrics_port, leaderboard=get_leaderboard)
+    return LOCAL_IP, available_port
+
 
 def get_local_broadcast_ip():
     """
@@ -197,18 +274,22 @@ def get_local_broadcast_ip():
     return broadcast_ip
 
 
-def udp_broadcast():
+def udp_broadcast(load=server_load, port=None):
     """
         Broadcasts server offers via UDP messages.
 
-        The function broadcasts offers containing the server name and port to potential clients.
+        The function broadcasts offers containing the server name and port to potential clients, followed by a
+        load-aware offer that also carries the current load of the server. The load-aware offer is sent to its own
+        port, so the clients that only know the original offer never receive it.
         It uses a UDP socket to send messages to the local broadcast IP address.
 
+        :param load: ServerLoad of the server, or None to only send the original offer
+        :param port: TCP port to offer (default=available_port)
         """
+    startup()
     BROADCAST_IP = get_local_broadcast_ip()
-    BROADCAST_PORT = 13117
-    server_port = available_port
-    packed_data = struct.pack('!IB32sH', MAGIC_COOKIE, MESSAGE_TYPE_OFFER, server_name.encode('utf-8'), server_port)
+    server_port = port or available_port
+    packed_data = pack_offer(server_name, server_port)
 
     # Create a UDP socket
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -219,7 +300,9 @@ def udp_broadcast():
         time.sleep(0.5)
         while True:
             # Send new message every second
-            sock.sendto(packed_data, (BROADCAST_IP, BROADCAST_PORT))
+            sock.sendto(packed_data, (BROADCAST_IP, OFFER_PORT))
+            if load is not None:
+                sock.sendto(pack_offer(server_name, server_port, load), (BROADCAST_IP, LOAD_OFFER_PORT))
             time.sleep(1)
     except KeyboardInterrupt:
         print('Stopping broadcast')
@@ -252,6 +335,10 @@ questions = {
     "The highest waterfall in the world is Angel Falls": True,
 }
 
+# The built-in questions are the default question bank; a game asks at most MAX_ROUNDS questions of its bank
+builtin_bank = BuiltinQuestionBank(questions)
+MAX_ROUNDS = len(questions)
+
 bot_names = [
     "BOT_columbus",
     "BOT_magellan",
@@ -275,16 +362,21 @@ bot_names = [
     "BOT_william_clark"
 ]
 
-acceptable_answers = {'0': 'F', '1': 'T', 'Y': 'T', 'N': 'F', 'T': 'T', 'F': 'F', 'NONE': None}
 disconnected_clients = {}
 pid_to_name = {}
 
 
-def tcp_server(host, port, fill_bots=True, add_bots=0):
+def tcp_server(host, port, fill_bots=True, add_bots=0, pacing=DEFAULT_PACING, heartbeat=DEFAULT_HEARTBEAT,
+               question_bank=builtin_bank, virtual_bots=True, bot_pool_size=8, game_log=None, lobby=DEFAULT_LOBBY,
+               reuse_port=False, resume_window=RESUME_WINDOW):
     """
      Manages client connections, handles game logic, and communicates with clients over TCP/IP.
 
-     The function listens for incoming client connections and creates a new thread for each client.
+     The function admits the players of every game in a lobby (see lobby.py), without a thread per connection.
+     Players with a session (see sessions.py) stay connected when the game is over and open the next lobby; a player
+     whose connection is lost gets their seat back in the lobby, or a seat in the next lobby once the game is over.
+     Every game is published to a spectator feed (see spectators.py), streamed to the eliminated players until the
+     game is over and to the spectators that connected during the lobby.
      It handles game logic, including sending trivia questions, receiving answers, and managing player eliminations.
      Bots can be added to the game automatically if there are not enough human players.
 
@@ -293,39 +385,108 @@ def tcp_server(host, port, fill_bots=True, add_bots=0):
      - port (int): The port number to bind the server socket.
      - fill_bots (bool): Whether to add bots to the game if there are not enough human players (default=True).
      - add_bots (int): The number of additional bots to add to the game (default=0).
+     - pacing (Pacing): The delays and answer window of the games (default=DEFAULT_PACING).
+     - heartbeat (HeartbeatPolicy): The bound within which dead connections are detected (default=DEFAULT_HEARTBEAT).
+     - question_bank: The bank the questions of the games are chosen from (default=builtin_bank).
+     - virtual_bots (bool): Whether the bots play inside the server process instead of connecting over TCP
+       (default=True).
+     - bot_pool_size (int): The number of connected bots kept ready between games, when the bots are not virtual
+       (default=8).
+     - game_log (GameLog): The log the events of every game are appended to (default=None, the games are not logged).
+     - lobby (LobbyPolicy): The capacity, deadlines and fill window of the lobbies (default=DEFAULT_LOBBY).
+     - reuse_port (bool): Whether to bind with SO_REUSEPORT, so several worker processes accept on the same port
+       (default=False).
+     - resume_window (float): Seconds a player with a session can reconnect after the connection is lost
+       (default=RESUME_WINDOW).
 
      Returns:
      None
      """
     global pid_to_name
     global disconnected_clients
-    welcome_msg = "Please wait for other players to join...\n"
 
-    # Function to send welcome message to all the clients
-    def handle_client(client_id, client_socket, players):
+    def welcome_player(client_id, client_socket, player_name, token=None):
         """
-        Handles client connections and game logic for each client.
+        Welcomes a player admitted to the lobby. A player sending a session token opens a session, or resumes it.
         :param client_id: id of the client joining
         :param client_socket: socket of the client joining
-        :param players: dict of players
+        :param player_name: name of the player
+        :param token: the session token of the player, '' to open a session, or None for a player without a session
+        :return: True if the player took a new seat in the lobby, False if they took back their seat or were lost
+        """
+        session = None
+        if token is not None:
+            session = sessions.resume(token) if token else None
+            if session is None:
+                session = sessions.open(player_name, client_socket)
+            elif session.player is not client_socket:
+                # The old connection of a returning player is lost, the new one takes its seat
+                try:
+                    session.player.close()
+                except OSError:
+                    pass
+                session.attach(client_socket)
+                seat = next((pid for pid, seated in player_sessions.items() if seated is session), None)
+                if seat is not None and seat in client_sockets_og:
+                    client_sockets_og[seat] = client_socket
+                    print(f"Player {player_name} reconnected.\n")
+                    safe_sendall(seat, client_socket, protocol.encode_frame(protocol.SESSION, session.token))
+                    return False
+        try:
+            client_socket.sendall(messages.WELCOME_FRAME if session is None else
+                                  messages.WELCOME_FRAME + protocol.encode_frame(protocol.SESSION, session.token))
+        except OSError:
+            client_socket.close()
+            return False
+        if session is not None:
+            player_sessions[client_id] = session
+        client_sockets_og[client_id] = client_socket
+        players[client_id] = player_name
+        print(f"Player {player_name} joined the lobby.\n")
+        send_to_all(client_sockets_og, f"Player {player_name} joined the lobby.\n")
+        metrics.PLAYERS_JOINED.inc()
+        metrics.CONNECTED_PLAYERS.set(len(client_sockets_og))
+        return True
+
+    def watch_game(client_socket):
+        """
+        Subscribes a spectator to the feed of the next game.
+        :param client_socket: socket of the spectator
         :return:
         """
         try:
-            player_name = client_socket.recv(1024)
-            client_socket.sendall(welcome_msg.encode())
-            print(f"Player {player_name.decode()} joined the lobby.\n")
-            send_to_all(client_sockets_og, f"Player {player_name.decode()} joined the lobby.\n")
-            players[client_id] = (player_name.decode())
+            client_socket.sendall(messages.WATCHING_FRAME)
         except OSError:
-            global disconnected_clients
-            try:
-                disconnected_clients[client_id] = players[client_id]
-            except Exception:
-                pass
+            client_socket.close()
+            return
+        print("A spectator is watching the next game.\n")
+        spectator_hub.watch(client_socket, feed)
+
+    def add_bot_players(first_id, count, client_sockets):
+        """
+        Adds bots to the lobby in bulk: VirtualPlayers, or connected Bot clients taken from the bot pool.
+        :param first_id: id of the first bot
+        :param count: number of bots
+        :param client_sockets: dict of the client sockets of the game
+        :return:
+        """
+        if virtual_bots:
+            bots = [(VirtualPlayer(client_id, name), name) for client_id, name in
+                    zip(range(first_id, first_id + count), random.choices(bot_names, k=count))]
+        else:
+            bots = bot_pool.take(count)
+            game_bots.extend(bots)
+        for client_id, (bot, name) in enumerate(bots, start=first_id):
+            client_sockets_og[client_id] = bot
+            client_sockets[client_id] = bot
+            players[client_id] = name
+        metrics.PLAYERS_JOINED.inc(len(bots))
+        joined = ''.join(f"Player {name} joined the lobby.\n" for bot, name in bots)
+        print(joined)
+        send_to_all(client_sockets_og, joined)
 
     # Create a TCP/IP socket
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket = create_server_socket(reuse_port)
 
     # Bind the socket to the address and port
 
@@ -337,46 +498,60 @@ def tcp_server(host, port, fill_bots=True, add_bots=0):
         except OSError:
 
             server_socket.close()
-            server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server_socket = create_server_socket(reuse_port)
+
+    server_load.capacity = lobby.capacity
+    sessions = SessionTable(resume_window)
+    # The sessions of the players carried over into the next lobby
+    carried = []
+    # The spectators of every game are streamed from a single thread
+    spectator_hub = SpectatorHub()
+    feed = None
+    # Bots that are not virtual are kept connected between games
+    bot_pool = None
+    if not virtual_bots:
+        bot_pool = BotPool(bot_names, bot_pool_size)
+        bot_pool.fill()
 
     try:
         while True:
-            # Listen for incoming connections
-            server_socket.listen()
+            game_bots = []
             pid_to_name = {}
             players = {}
             client_sockets_og = {}
-            # Accept incoming connections, create a new thread for each client,
-            # and welcome them, while waiting for all players to join the lobby.
-            i = 0
-            while True:
-                client_handlers = []
-                try:
-                    i += 1
-                    client_socket, client_address = server_socket.accept()
-                    client_handler = threading.Thread(target=handle_client, args=(i, client_socket, players))
-                    client_sockets_og[i] = client_socket
-                    client_handler.start()
-                    client_handlers.append(client_handler)
-                    server_socket.settimeout(10)
-                except socket.timeout:
-                    # If no new connections are made within the 10 second period, start the game
-                    server_socket.settimeout(None)
-                    for t in client_handlers:
-                        t.join()
-                    for client_id, sock in client_sockets_og.copy().items():
-                        try:
-                            # Check if the socket is still connected
-                            sock.sendall("".encode())
-                        except OSError:
-                            # If an OSError is raised, the socket is no longer connected
-                            print(f"Player {players[client_id]} is no longer connected")
-                            client_sockets_og.pop(client_id)
-                            players.pop(client_id)
-                    break
+            # client id -> Session of the players with a session
+            player_sessions = {}
+            # client id -> Spectator of the eliminated players, who watch the rest of the game
+            watching = {}
+            # The spectators of a lobby that started no game watch the next one
+            if feed is None or feed.closed:
+                feed = SpectatorFeed()
+            # Accept incoming connections and welcome the players on a selector, until the lobby is full, its fill
+            # deadline expires or nobody joined for the length of its fill window
+            server_load.games_in_progress = 0
+            server_load.lobby_size = 0
+            server_load.starts_at = None
+            metrics.CONNECTED_PLAYERS.set(0)
+            game_lobby = Lobby(server_socket, lobby, heartbeat, server_load)
+            sessions.expire()
+            for client_id, session in enumerate(carried, start=1):
+                welcome_player(client_id, session.player, session.name, session.token)
+            game_lobby.carry(len(client_sockets_og))
+            game_lobby.admit(len(carried) + 1, welcome_player, watch_game)
+            for client_id, sock in client_sockets_og.copy().items():
+                if not is_alive(sock):
+                    print(f"Player {players.get(client_id)} is no longer connected")
+                    client_sockets_og.pop(client_id)
+                    players.pop(client_id, None)
+            if game_lobby.opened_at is not None:
+                metrics.LOBBY_FILL.observe(time.monotonic() - game_lobby.opened_at)
 
             client_sockets = dict(client_sockets_og)
-            time.sleep(1)
+            # The lobby is closed: players arriving now wait for the next game
+            server_load.lobby_size = 0
+            server_load.starts_at = None
+            server_load.games_in_progress = 1
+            time.sleep(pacing.settle_delay)
             check_if_disconnected(client_sockets, client_sockets_og, players)
 
             if len(client_sockets) == 0:
@@ -384,66 +559,52 @@ def tcp_server(host, port, fill_bots=True, add_bots=0):
                 continue
             elif len(client_sockets) < 4 and fill_bots:
                 print('Not enough players. Adding bots to the game.')
-                send_to_all(client_sockets, 'Not enough players. Adding bots to the game.')
-                i = len(client_sockets)
-                for j in range(4 - len(client_sockets)):
-                    i += 1
-                    add_bots -= 1
-                    server_socket.listen()
-                    name = random.choice(bot_names)
-                    bot_thread = threading.Thread(target=Bot(name, address=LOCAL_IP, server_port=available_port, isBot=True).run)
-                    bot_thread.start()
-                    client_socket, client_address = server_socket.accept()
-                    client_handler = threading.Thread(target=handle_client, args=(i, client_socket, players))
-                    client_sockets_og[i] = client_socket
-                    client_sockets[i] = client_socket
-                    client_handler.start()
-                    client_handler.join()
+                send_to_all(client_sockets, messages.NOT_ENOUGH_PLAYERS_FRAME)
+                missing = 4 - len(client_sockets)
+                add_bots -= missing
+                add_bot_players(max(client_sockets_og, default=0) + 1, missing, client_sockets)
 
             if add_bots > 0:
-                i = len(client_sockets)
-                for j in range(add_bots):
-                    i += 1
-                    server_socket.listen()
-                    name = random.choice(bot_names)
-                    bot_thread = threading.Thread(target=Bot(name, address=LOCAL_IP, server_port=available_port, isBot=True).run)
-                    bot_thread.start()
-                    client_socket, client_address = server_socket.accept()
-                    client_handler = threading.Thread(target=handle_client, args=(i, client_socket, players))
-                    client_sockets_og[i] = client_socket
-                    client_sockets[i] = client_socket
-                    client_handler.start()
-                    client_handler.join()
+                add_bot_players(max(client_sockets_og, default=0) + 1, add_bots, client_sockets)
 
-            time.sleep(1)
+            time.sleep(pacing.settle_delay)
             check_if_disconnected(client_sockets, client_sockets_og, players)
 
+            metrics.GAMES.inc()
+            metrics.CONNECTED_PLAYERS.set(sum(not is_virtual(sock) for sock in client_sockets_og.values()))
             print('Welcome to LuckyBunnies Server, where we are answering trivia questions about geography!\n')
-            send_to_all(client_sockets,'Welcome to LuckyBunnies Server, where we are answering trivia questions about geography!\n')
             print("Loading game...\n")
-            send_to_all(client_sockets,"Loading game...")
-            time.sleep(1)
-            message = ""
+            # Both messages are batched into a single write
+            send_to_all(client_sockets, messages.INTRO_FRAMES)
+            feed.publish(messages.INTRO_FRAMES)
+            time.sleep(pacing.intro_delay)
             pid_to_name = dict(players)
-
-            for i, key in enumerate(pid_to_name.keys()):
-                message += f"Player {i + 1}: {pid_to_name[key]}\n"
-            message += "===============\n"
-            print(message)
-            curr_threads = []
+            recorder = None
+            if game_log is not None:
+                recorder = GameRecorder()
+                pool_bots = [bot for bot, name in game_bots]
+                for pid, name in pid_to_name.items():
+                    recorder.join(pid, name, is_virtual(client_sockets[pid]) or client_sockets[pid] in pool_bots)
+            # Choose the questions of the game, and encode its messages once before the first round
+            game_questions = question_bank.game_questions(MAX_ROUNDS)
+            game_messages = messages.GameMessages(pid_to_name,
+                                                  [question_bank.get(qid)[0] for qid in game_questions])
+            print(''.join(f"Player {i + 1}: {name}\n" for i, name in enumerate(pid_to_name.values())) + "===============\n")
             # send the players list to all the clients
-            send_to_all(client_sockets, message)
+            send_to_all(client_sockets, game_messages.players_list)
+            feed.publish(game_messages.players_list)
 
             curr_threads = []
-            time.sleep(2)
+            time.sleep(pacing.players_list_delay)
             # Start the game: send questions to all the clients and wait for their answers
             i = 1
-            for question in questions:
+            for question_id in game_questions:
                 # check if any clients have disconnected
                 for dc in disconnected_clients:
                     print(f'{disconnected_clients[dc]} has disconnected from the game.')
-                    send_to_all(client_sockets,
-                                f'{disconnected_clients[dc]} has disconnected from the game.\n')
+                    notice = messages.encode_info(f'{disconnected_clients[dc]} has disconnected from the game.\n')
+                    send_to_all(client_sockets, notice)
+                    feed.publish(notice)
                     pid_to_name.pop(dc)
                     client_sockets.pop(dc)
 
@@ -454,49 +615,95 @@ def tcp_server(host, port, fill_bots=True, add_bots=0):
                 if len(pid_to_name) < 2:
                     break
 
-                next_round = f'Round {i}, played by '
-                next_round += ', '.join([pid_to_name[player] for player in client_sockets.keys()]) + ':'
-                # print(next_round)
-                # send_to_all(client_sockets, f'{next_round}\n')
+                next_round = game_messages.round_header(i, client_sockets.keys())
                 i += 1
-                res = play(client_sockets, pid_to_name, question, curr_threads, next_round=next_round)
+                in_round = dict(client_sockets)
+                res = play(client_sockets, pid_to_name, question_id, curr_threads, next_round=next_round,
+                           game_messages=game_messages, pacing=pacing, question_bank=question_bank,
+                           recorder=recorder, feed=feed, heartbeat=heartbeat)
+                # The eliminated players watch the rest of the game, the bots are done
+                pool_bots = [bot for bot, name in game_bots]
+                for client_id, sock in in_round.items():
+                    if client_id not in client_sockets and not is_virtual(sock) and sock not in pool_bots:
+                        watching[client_id] = spectator_hub.watch(sock, feed, keep=True)
                 if res is True:
                     if len(pid_to_name) == 1:
                         break
 
+            # The final result is sent to the players still connected, and to the eliminated players and the
+            # spectators through the feed
+            finalists = {pid: sock for pid, sock in client_sockets_og.items() if pid not in watching}
             if len(pid_to_name) == 0:
-                send_to_all(client_sockets_og, "Game is tied !")
+                send_to_all(finalists, messages.TIED_FRAME)
+                feed.close(messages.TIED_FRAME)
                 print("No players left in the game.\nGame over, sending out offer requests...\n\n")
-                time.sleep(1)
+                time.sleep(pacing.game_over_delay)
 
             elif len(pid_to_name) > 1:
                 print("Game is tied !\nLooking for new players... ")
-                send_to_all(client_sockets_og, "Game is tied !")
-                time.sleep(1)
+                send_to_all(finalists, messages.TIED_FRAME)
+                feed.close(messages.TIED_FRAME)
+                time.sleep(pacing.game_over_delay)
 
 
             elif len(pid_to_name) == 1:
                 name = next(iter(pid_to_name.values()))
-                time.sleep(2)
-                update_excel('winners.xlsx', name)
-                top_three_players = get_top_three_players('winners.xlsx')
-                game_over_mess = f'Game over!\nCongratulations to the winner: {name}\nAll Time Server Rankings:\n'
-                i = 1
-                for player in top_three_players:
-                    game_over_mess += f'{i}. {player[0]}: {player[1]}\n'
-                    i += 1
+                time.sleep(pacing.winner_delay)
+                with metrics.LEADERBOARD_WRITE.time():
+                    get_leaderboard().increment(name)
+                    top_three_players = get_leaderboard().top(3)
+                    winner_rank = get_leaderboard().rank(name)
+                game_over_mess, game_over_frame = game_messages.game_over(name, top_three_players, winner_rank)
                 print(game_over_mess)
-                send_to_all(client_sockets_og, game_over_mess)
-                time.sleep(2)
+                send_to_all(finalists, game_over_frame)
+                feed.close(game_over_frame)
+                time.sleep(pacing.rankings_delay)
                 print("Game over, sending out offer requests...\n\n")
-                time.sleep(1)
+                time.sleep(pacing.game_over_delay)
+
+            if recorder is not None:
+                recorder.result(next(iter(pid_to_name)) if len(pid_to_name) == 1 else None)
+                game_log.append(recorder)
+
+            # The eliminated players' sockets are given back once they were sent the whole feed; a player that
+            # stopped reading was dropped
+            feed.close()
+            for spectator in watching.values():
+                spectator.done.wait()
+
+            if bot_pool is not None:
+                bot_pool.release(game_bots)
+
+            # The players with a session stay connected and are carried over into the next lobby
+            carried = []
+            for client_id, session in player_sessions.items():
+                if client_id in client_sockets_og and is_alive(client_sockets_og[client_id]):
+                    client_sockets_og[client_id].settimeout(None)
+                    carried.append(session)
+                else:
+                    session.detach()
 
     except KeyboardInterrupt:
         server_socket.close()
         print("Shutting down the server... Goodbye!")
 
 
-def play(client_sockets, pid_to_name, question, curr_threads, next_round=""):
+def create_server_socket(reuse_port=False):
+    """
+    Creates the listening TCP socket of the server.
+    :param reuse_port: whether to set SO_REUSEPORT, so the kernel balances the connections between the processes
+                       bound to the port
+    :return: the socket, not bound yet
+    """
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    return server_socket
+
+
+def play(client_sockets, pid_to_name, question_id, curr_threads, next_round="", game_messages=None,
+         pacing=DEFAULT_PACING, question_bank=builtin_bank, recorder=None, feed=None, heartbeat=DEFAULT_HEARTBEAT):
     """
         Manages a round of the trivia game.
 
@@ -506,66 +713,113 @@ def play(client_sockets, pid_to_name, question, curr_threads, next_round=""):
         Args:
         - client_sockets (dict): A dictionary containing client IDs and their corresponding sockets.
         - pid_to_name (dict): A dictionary mapping player IDs to their names.
-        - question (str): The trivia question to be asked.
+        - question_id (int): The id of the trivia question to be asked.
         - curr_threads (list): A list of current active threads.
         - next_round (str): Information about the next round (default="").
+        - game_messages (GameMessages): The pre-encoded messages of the game (default=None, encoded for this round).
+        - pacing (Pacing): The delays and answer window of the round (default=DEFAULT_PACING).
+        - question_bank: The bank the question is read from (default=builtin_bank).
+        - recorder (GameRecorder): The recorder of the game's events (default=None, the round is not recorded).
+        - feed (SpectatorFeed): The spectator feed the round is published to (default=None, nobody watches).
+        - heartbeat (HeartbeatPolicy): The pings sent while waiting for the answers (default=DEFAULT_HEARTBEAT).
 
         Returns:
         True if no players are eliminated in the round.
         """
+    metrics.ROUNDS.inc()
+    with metrics.ROUND_DURATION.time():
+        return play_round(client_sockets, pid_to_name, question_id, next_round, game_messages, pacing, question_bank,
+                          recorder, feed, heartbeat)
+
+
+def play_round(client_sockets, pid_to_name, question_id, next_round, game_messages, pacing, question_bank,
+               recorder=None, feed=None, heartbeat=DEFAULT_HEARTBEAT):
+    """
+    Plays a round of the trivia game, see play.
+    """
+    question, answer = question_bank.get(question_id)
+    if game_messages is None:
+        game_messages = messages.GameMessages(pid_to_name, [question])
 
     print(next_round)
-    send_to_all(client_sockets, f'{next_round}\n')
-    time.sleep(5)
+    round_header = game_messages.round_header_frame(next_round)
+    send_to_all(client_sockets, round_header)
+    if feed is not None:
+        feed.publish(round_header)
+    time.sleep(pacing.question_delay)
     print(f"True or False: {question}\n")
-    client_answers = {}
-    # for client_id, sock in client_sockets.items():
-    #     t = threading.Thread(target=send_question, args=(client_id, sock, question))
-    #     t.start()
-    #     curr_threads.append(t)
-    # for t in curr_threads:
-    #     t.join()
-    mess = str(f"True or False: {question}\n")
-    send_to_all(client_sockets, mess) # f"True or False: {question}\n")
+    round_score = RoundScore(client_sockets.keys())
+    send_to_all(client_sockets, game_messages.question(question))
+    if feed is not None:
+        feed.publish(game_messages.watched_question(question))
     curr_threads = []
+    deadline = time.monotonic() + pacing.answer_timeout
     for idx, client_id in enumerate(client_sockets):
         sock = client_sockets[client_id]
-        t = threading.Thread(target=play_trivia, args=(client_id, sock, question, client_answers))
+        if is_virtual(sock):
+            # Virtual bots answer with a function call, without a thread
+            reply = sock.answer(question)
+            if reply is not None:
+                round_score.record(client_id, reply)
+                metrics.ANSWERS.inc()
+            continue
+        t = threading.Thread(target=play_trivia,
+                             args=(client_id, sock, round_score, deadline, heartbeat))
         t.start()
         curr_threads.append(t)
+    # The round closes as soon as every player has answered, or when the answer window is over
     for t in curr_threads:
         t.join()
-    if everyone_wrong_or_right(list(client_answers.values())):
+    if not pacing.close_early:
+        time.sleep(max(0.0, deadline - time.monotonic()))
+    # The whole round is scored at once, after the answer window closes
+    round_score.score(answer)
+    if recorder is not None:
+        recorder.round(question_id, answer, round_score,
+                       [] if round_score.nobody_eliminated() else round_score.eliminated())
+    if round_score.nobody_eliminated():
         print('Nobody is eliminated this round! Let"s move to the next round.')
-        send_to_all(client_sockets, 'Nobody is eliminated this round! Let"s move to the next round.')
-        time.sleep(1)
+        send_to_all(client_sockets, messages.NOBODY_ELIMINATED_FRAME)
+        if feed is not None:
+            feed.publish(messages.NOBODY_ELIMINATED_FRAME)
+        time.sleep(pacing.next_round_delay)
         return True
-    time.sleep(2)
-    mess = ''
-    if len(pid_to_name) > 2:
-        for player in client_answers.keys():
-            print(f'{pid_to_name[player]} {client_answers[player]}')
-            mess += f'{pid_to_name[player]} {client_answers[player]}\n'
-    else:
-        for player in client_answers.keys():
-            ans = client_answers[player]
-            if ans == "is correct!":
-                print(f'{pid_to_name[player]} is correct! {pid_to_name[player]} wins!')
-                mess += f'{pid_to_name[player]} is correct! {pid_to_name[player]} wins!\n'
-            else:
-                print(f'{pid_to_name[player]} {client_answers[player]}')
-                mess += f'{pid_to_name[player]} {client_answers[player]}\n'
-
-    send_to_all(client_sockets, mess)
-    time.sleep(1)
+    time.sleep(pacing.results_delay)
+    mess = game_messages.results(round_score, last_two=len(pid_to_name) <= 2)
+    print(mess)
+    results = messages.encode_info(mess)
+    send_to_all(client_sockets, results)
+    if feed is not None:
+        feed.publish(results)
+    time.sleep(pacing.next_round_delay)
 
-    for player in client_answers.keys():
-        if client_answers[player] != 'is correct!':
-            t = threading.Thread(target=elimination_msg, args=(client_sockets[player], pid_to_name[player]))
+    curr_threads = []
+    for player in round_score.eliminated():
+        if not is_virtual(client_sockets[player]):
+            t = threading.Thread(target=elimination_msg, args=(client_sockets[player],
+                                                               game_messages.eliminations[player]))
             t.start()
-            client_sockets.pop(player)
-            pid_to_name.pop(player)
-            t.join()
+            curr_threads.append(t)
+        client_sockets.pop(player)
+        pid_to_name.pop(player)
+    for t in curr_threads:
+        t.join()
+
+
+def is_alive(sock):
+    """
+    Checks if a client is still connected. A PING frame is sent, which the client answers with a PONG, and gives
+    the kernel unacknowledged data to time out on; then the socket is checked for a connection closed by the client.
+    :param sock: socket of the client
+    :return: True if the client is still connected
+    """
+    if is_virtual(sock):
+        return sock.connected
+    try:
+        sock.sendall(protocol.PING_FRAME)
+    except OSError:
+        return False
+    return is_connection_alive(sock)
 
 
 def check_if_disconnected(client_sockets, client_sockets_og, players):
@@ -577,55 +831,58 @@ def check_if_disconnected(client_sockets, client_sockets_og, players):
     :return:
     """
     for client_id, sock in client_sockets.copy().items():
-        try:
-            # Check if the socket is still connected
-            sock.sendall("".encode())
-        except OSError:
-            # If an OSError is raised, the socket is no longer connected
+        if not is_alive(sock):
             print(f"{players[client_id]} has disconnected.")
             client_sockets.pop(client_id)
             client_sockets_og.pop(client_id)
             players.pop(client_id)
 
 
-def everyone_wrong_or_right(lst):
-    """
-    Checks if everyone in the list is either all correct or all wrong.
-    :param lst: list of client answers
-    :return: True if everyone is either all correct or all wrong, False otherwise
-    """
-    return all([x != 'is correct!' for x in lst]) or all([x == 'is correct!' for x in lst])
-
-
 def safe_sendall(client_id, sock, message):
     """
     Safely sends a message to a client.
     :param client_id: client id
     :param sock: socket to send message to
-    :param message: message to send
+    :param message: encoded frames to send
     :return:
     """
     try:
-        sock.sendall(message.encode())
+        sock.sendall(message)
     except (OSError, socket.timeout, ConnectionResetError, ConnectionAbortedError, BrokenPipeError) as e:
         if client_id in pid_to_name:
             global disconnected_clients
             disconnected_clients[client_id] = pid_to_name[client_id]
 
 
-def send_to_all(list_of_sockets, msg):
+def send_to_all(list_of_sockets, msg, msg_type=protocol.INFO):
     """
     Sends a message to all clients.
     :param list_of_sockets: list of sockets to send a message to
-    :param msg: message to send
+    :param msg: message to send, or already encoded frames shared by all the clients
+    :param msg_type: protocol message type of the message
+    :return:
+    """
+    if isinstance(msg, str):
+        msg = protocol.encode_frame(msg_type, msg)
+    with metrics.BROADCAST.time():
+        send_frames_to_all(list_of_sockets, msg)
+
+
+def send_frames_to_all(list_of_sockets, msg):
+    """
+    Sends encoded frames to all clients, each from its own thread.
+    :param list_of_sockets: list of sockets to send a message to
+    :param msg: the encoded frames
     :return:
     """
     try:
         curr_threads = []
         curr = None
         for client_id, sock in list_of_sockets.copy().items():
+            if is_virtual(sock):
+                continue
             curr = client_id
-            t = threading.Thread(target=lambda sockt, message: safe_sendall(client_id, sockt, msg), args=(sock, msg))
+            t = threading.Thread(target=safe_sendall, args=(client_id, sock, msg))
             t.start()
             curr_threads.append(t)
         for t in curr_threads:
@@ -636,15 +893,15 @@ def send_to_all(list_of_sockets, msg):
             disconnected_clients[curr] = pid_to_name[curr]
 
 
-def elimination_msg(conn, name):
+def elimination_msg(conn, message):
     """
     Sends an elimination message to a client.
     :param conn: socket connection
-    :param name: name of the client
+    :param message: the pre-encoded elimination frame of the client
     :return:
     """
     try:
-        conn.sendall(f"Sorry {name}, you are out of the game!\nPlease wait for the final results.\n".encode())
+        conn.sendall(message)
     except (OSError, socket.timeout, ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
         pass
 
@@ -658,42 +915,58 @@ def send_question(client_id, conn, question):
     :return:
     """
     try:
-        conn.sendall(f'True or False: {question}\n'.encode())
+        conn.sendall(protocol.encode_frame(protocol.QUESTION, f'True or False: {question}\n'))
     except (OSError, socket.timeout, ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
         if client_id in pid_to_name:
             global disconnected_clients
             disconnected_clients[client_id] = pid_to_name[client_id]
 
 
-def play_trivia(client_id, conn, question, client_answers):
+def play_trivia(client_id, conn, round_score, deadline=None, heartbeat=DEFAULT_HEARTBEAT):
     """
-    Plays the trivia game with a client. Receives the client's answer and checks if it is correct.
+    Plays the trivia game with a client. Receives the client's answer and records it in the round's score.
+    While waiting, the client is pinged at the heartbeat interval: a client that is not heard from within the
+    heartbeat bound is disconnected, and a dead host fails the connection once a ping is not acknowledged within
+    the heartbeat's ack_timeout, before the answer window closes.
     :param client_id: client id
     :param conn: socket connection
-    :param question: question in the trivia game
-    :param client_answers: dictionary of client answers
+    :param round_score: RoundScore of the round
+    :param deadline: time.monotonic() time at which the answer window closes (default=15 seconds from now)
+    :param heartbeat: the HeartbeatPolicy of the connection
     :return:
     """
     global disconnected_clients
+    asked = last_seen = time.monotonic()
+    if deadline is None:
+        deadline = asked + DEFAULT_PACING.answer_timeout
     try:
-        conn.settimeout(15)
-        ans = conn.recv(1024).decode().strip().upper()
-        if ans == "":
+        # Skip the PONG answers to the heartbeat pings until the client's answer arrives
+        frame = (protocol.PONG, '')
+        with selectors.DefaultSelector() as selector:
+            selector.register(conn, selectors.EVENT_READ)
+            while frame is not None and frame[0] == protocol.PONG:
+                now = time.monotonic()
+                if now >= deadline:
+                    raise socket.timeout
+                if heartbeat.is_dead(last_seen, now):
+                    frame = None
+                elif selector.select(min(deadline - now, heartbeat.interval)):
+                    conn.settimeout(max(0.001, deadline - time.monotonic()))
+                    frame = protocol.recv_frame(conn)
+                    last_seen = time.monotonic()
+                elif time.monotonic() < deadline:
+                    conn.sendall(protocol.PING_FRAME)
+        if frame is None:
             disconnected_clients[client_id] = pid_to_name[client_id]
             return
-        client_answer = acceptable_answers.get(ans, 'bad answer')
-        correct_answer = 'T' if questions[question] else 'F'
-
-        if client_answer is None:
-            client_answers[client_id] = 'did not answer in time !'
-        elif client_answer == 'bad answer':
-            client_answers[client_id] = 'gave an invalid input !'
-        elif client_answer == correct_answer:
-            client_answers[client_id] = 'is correct!'
-        else:
-            client_answers[client_id] = 'is incorrect!'
-    except (socket.timeout, ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
-        # client_answers[client_id] = 'incorrect'
+        round_score.record(client_id, frame[1])
+        metrics.ANSWERS.inc()
+        metrics.ANSWER_LATENCY.observe(time.monotonic() - asked)
+    except socket.timeout:
+        metrics.ANSWER_TIMEOUTS.inc()
+        if client_id in pid_to_name:
+            disconnected_clients[client_id] = pid_to_name[client_id]
+    except OSError:
         if client_id in pid_to_name:
             disconnected_clients[client_id] = pid_to_name[client_id]
 
@@ -701,8 +974,12 @@ def play_trivia(client_id, conn, question, client_answers):
 if __name__ == "__main__":
     # Start the server
     try:
+        # An optional JSONL or CSV question bank can be given on the command line
+        bank = open_question_bank(sys.argv[1]) if len(sys.argv) > 1 else builtin_bank
+        host, port = startup()
         thread_a = threading.Thread(target=udp_broadcast)
-        thread_b = threading.Thread(target=tcp_server, args=(LOCAL_IP, available_port, False, 2))
+        thread_b = threading.Thread(target=tcp_server, args=(host, port, False, 2),
+                                    kwargs={'question_bank': bank, 'game_log': GameLog(GAME_LOG_FILE)})
         # Start both threads
         thread_a.start()
         thread_b.start()
@@ -0,0 +1,128 @@
+import secrets
+import threading
+import time
+
+"""
+This module implements the persistent player sessions of the Trivia King servers.
+
+A client used to drop its connection after every game, wait for the next UDP offer, reconnect and send its name again,
+and a player whose connection failed for a moment lost their seat. A client that sends a RESUME frame instead of NAME
+now opens a session: the server answers with a SESSION frame holding a random token, keeps the connection open when
+the game is over and moves the player straight into the next lobby. When the connection is lost, the player's seat is
+kept for resume_window seconds: a client that reconnects within the window and sends its token gets its seat back,
+in the game it was playing.
+
+The module includes the following functionalities:
+- Session: The session of a player.
+- SessionTable: The sessions of a server, by token.
+"""
+
+RESUME_WINDOW = 30
+
+
+class Session:
+    """
+    The session of a player.
+    """
+
+    def __init__(self, token, name, player, resume_window=RESUME_WINDOW):
+        """
+        Initialize the Session object.
+
+        :param token: the session token sent to the client
+        :param name: name of the player
+        :param player: the player's connection: a socket for the threaded server, an AsyncPlayer for the asyncio server
+        :param resume_window: seconds the seat is kept after the connection is lost
+        """
+        self.token = token
+        self.name = name
+        self.player = player
+        self.resume_window = resume_window
+        self.detached_at = None
+
+    def detach(self):
+        """
+        Marks the connection of the session as lost, which starts the resume window.
+        """
+        if self.detached_at is None:
+            self.detached_at = time.monotonic()
+
+    def attach(self, player):
+        """
+        Gives the session a new connection.
+        :param player: the player's new connection
+        """
+        self.player = player
+        self.detached_at = None
+
+    def is_resumable(self, now=None):
+        """
+        Check if the session can still be resumed.
+        :param now: the current time.monotonic() time
+        :return: True if the connection is alive or was lost less than resume_window seconds ago
+        """
+        if self.detached_at is None:
+            return True
+        now = time.monotonic() if now is None else now
+        return now - self.detached_at < self.resume_window
+
+
+class SessionTable:
+    """
+    The sessions of a server, by token.
+    """
+
+    def __init__(self, resume_window=RESUME_WINDOW):
+        """
+        Initialize the SessionTable object.
+
+        :param resume_window: seconds a seat is kept after the connection is lost
+        """
+        self.resume_window = resume_window
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def open(self, name, player):
+        """
+        Opens a new session.
+        :param name: name of the player
+        :param player: the player's connection
+        :return: the Session
+        """
+        session = Session(secrets.token_hex(8), name, player, self.resume_window)
+        with self.lock:
+            self.sessions[session.token] = session
+        return session
+
+    def resume(self, token):
+        """
+        Finds the session of a token.
+        :param token: the token sent by the client
+        :return: the Session, or None if the token is unknown or its session expired
+        """
+        with self.lock:
+            session = self.sessions.get(token)
+            if session is not None and not session.is_resumable():
+                del self.sessions[token]
+                session = None
+        return session
+
+    def close(self, session):
+        """
+        Forgets a session.
+        :param session: the Session
+        """
+        with self.lock:
+            self.sessions.pop(session.token, None)
+
+    def expire(self):
+        """
+        Forgets the sessions whose resume window is over.
+        :return: list of the expired Sessions
+        """
+        now = time.monotonic()
+        with self.lock:
+            expired = [session for session in self.sessions.values() if not session.is_resumable(now)]
+            for session in expired:
+                del self.sessions[session.token]
+        return expired
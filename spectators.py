@@ -0,0 +1,340 @@
+import selectors
+import socket
+import threading
+import time
+
+import metrics
+
+"""
+This module implements the spectator channel of the Trivia King servers.
+
+An eliminated player used to hear nothing more of the game until its final result, and nobody outside a game could
+watch it. Every game now publishes its events (the intro, the rounds, the questions, the results and the game over)
+to a SpectatorFeed: a ring buffer of the last capacity encoded frames, written once by the game whatever the number of
+spectators. Every spectator reads the feed at its own cursor, so a game never waits for a spectator:
+- A spectator that falls more than capacity frames behind skips ahead to the oldest frame still in the buffer, and
+  the frames it skipped are counted.
+- A spectator that does not read anything for stall_timeout seconds is dropped.
+Spectators are read-only: questions are published as INFO frames, so a spectator's client never answers them.
+
+The threaded server streams the feeds from a single SpectatorHub thread with non-blocking writes on a selector, and
+the asyncio server streams them from one task per spectator (stream_feed), so neither adds a thread or a task per
+message to the round engine.
+
+The module includes the following functionalities:
+- SpectatorFeed: The events of a game, in a ring buffer.
+- Spectator: A spectator of the threaded server, and its cursor.
+- SpectatorHub: Streams the feeds to the spectators of the threaded server.
+- stream_feed: Streams a feed to a spectator of the asyncio server.
+"""
+
+FEED_CAPACITY = 256
+STALL_TIMEOUT = 5
+SPECTATORS = metrics.REGISTRY.gauge('trivia_spectators', 'Spectators watching a game, eliminated players included.')
+SKIPPED_FRAMES = metrics.REGISTRY.counter('trivia_spectator_skipped_frames_total',
+                                          'Frames slow spectators skipped to catch up with their game.')
+DROPPED_SPECTATORS = metrics.REGISTRY.counter('trivia_spectators_dropped_total',
+                                              'Spectators disconnected because they stopped reading.')
+
+
+class SpectatorFeed:
+    """
+    The events of a game, in a ring buffer of encoded frames read by every spectator at its own cursor. A cursor is
+    the sequence number of the next frame to read.
+    """
+
+    def __init__(self, capacity=FEED_CAPACITY):
+        """
+        Initialize the SpectatorFeed object.
+
+        :param capacity: number of frames kept in the buffer
+        """
+        self.capacity = capacity
+        self.slots = [b''] * capacity
+        # Sequence number of the next frame published
+        self.head = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        # Functions called after every publish, by the threaded server's SpectatorHub
+        self.listeners = []
+        # The asyncio.Event the spectators of the asyncio server wait on, see wait
+        self.changed = None
+
+    def publish(self, data):
+        """
+        Adds encoded frames to the feed. Never waits for a spectator.
+        :param data: the encoded frames
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.slots[self.head % self.capacity] = data
+            self.head += 1
+        self.notify()
+
+    def close(self, data=None):
+        """
+        Ends the feed, when the game is over.
+        :param data: the last encoded frames of the feed, or None
+        """
+        with self.lock:
+            if self.closed:
+                return
+            if data is not None:
+                self.slots[self.head % self.capacity] = data
+                self.head += 1
+            self.closed = True
+        self.notify()
+
+    def notify(self):
+        for listener in list(self.listeners):
+            listener()
+        if self.changed is not None:
+            self.changed.set()
+            self.changed = None
+
+    def read(self, cursor):
+        """
+        Reads the frames published since a cursor. A cursor whose frames were overwritten skips ahead to the oldest
+        frame in the buffer.
+        :param cursor: the sequence number of the next frame to read
+        :return: (the frames as bytes, the next cursor, number of frames skipped)
+        """
+        with self.lock:
+            oldest = max(0, self.head - self.capacity)
+            skipped = max(0, oldest - cursor)
+            cursor = max(cursor, oldest)
+            data = b''.join(self.slots[seq % self.capacity] for seq in range(cursor, self.head))
+            return data, self.head, skipped
+
+    def finished(self, cursor):
+        """
+        Check if a cursor read the whole feed.
+        :param cursor: the sequence number of the next frame to read
+        :return: True if the feed is closed and has no frame after the cursor
+        """
+        with self.lock:
+            return self.closed and cursor >= self.head
+
+    async def wait(self, cursor):
+        """
+        Waits until a frame after the cursor is published or the feed is closed. The feeds of the asyncio server are
+        published from its event loop.
+        :param cursor: the sequence number of the next frame to read
+        """
+        # asyncio is only imported by the asyncio server, the threaded server never loads it
+        import asyncio
+
+        if cursor < self.head or self.closed:
+            return
+        if self.changed is None:
+            self.changed = asyncio.Event()
+        await self.changed.wait()
+
+
+class Spectator:
+    """
+    A spectator of the threaded server: its socket, the feed it watches and its cursor.
+    """
+
+    def __init__(self, sock, feed, cursor=0, keep=False):
+        """
+        Initialize the Spectator object.
+
+        :param sock: socket of the spectator
+        :param feed: the SpectatorFeed it watches
+        :param cursor: the sequence number of the first frame it is sent
+        :param keep: whether the socket is given back to the server when the feed is over, for an eliminated
+                     player, instead of being closed
+        """
+        self.sock = sock
+        self.feed = feed
+        self.cursor = cursor
+        self.keep = keep
+        self.pending = b''
+        self.moved_at = time.monotonic()
+        self.dropped = False
+        self.done = threading.Event()
+
+
+class SpectatorHub:
+    """
+    Streams the feeds to the spectators of the threaded server, from a single thread. The spectators' sockets are
+    written without blocking on a selector, so a slow spectator only delays itself.
+    """
+
+    def __init__(self, stall_timeout=STALL_TIMEOUT):
+        """
+        Initialize the SpectatorHub object.
+
+        :param stall_timeout: seconds a spectator may read nothing before it is dropped
+        """
+        self.stall_timeout = stall_timeout
+        self.selector = selectors.DefaultSelector()
+        # The game thread wakes the hub up through a socket pair, whichever feed it published to
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ)
+        self.lock = threading.Lock()
+        self.arrivals = []
+        # socket -> Spectator
+        self.spectators = {}
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def watch(self, sock, feed, cursor=None, keep=False):
+        """
+        Subscribes a socket to a feed.
+        :param sock: socket of the spectator
+        :param feed: the SpectatorFeed to stream
+        :param cursor: the sequence number of the first frame to send, or None to start with the next frame published
+        :param keep: whether the socket is given back when the feed is over, see Spectator
+        :return: the Spectator, whose done event is set once the socket is given back or closed
+        """
+        if self.wake not in feed.listeners:
+            feed.listeners.append(self.wake)
+        spectator = Spectator(sock, feed, feed.head if cursor is None else cursor, keep)
+        with self.lock:
+            self.arrivals.append(spectator)
+        self.wake()
+        return spectator
+
+    def wake(self):
+        try:
+            self.wakeup_writer.send(b'\0')
+        except OSError:
+            # The socket pair is full, a wake-up is already pending
+            pass
+
+    def run(self):
+        while True:
+            # Stalled spectators are checked every second while some data is waiting to be sent
+            waiting = any(spectator.pending for spectator in self.spectators.values())
+            for key, mask in self.selector.select(1 if waiting else None):
+                if key.fileobj is self.wakeup_reader:
+                    try:
+                        while self.wakeup_reader.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                elif mask & selectors.EVENT_READ:
+                    self.discard_input(key.data)
+            with self.lock:
+                arrivals, self.arrivals = self.arrivals, []
+            for spectator in arrivals:
+                spectator.sock.setblocking(False)
+                self.selector.register(spectator.sock, selectors.EVENT_READ, spectator)
+                self.spectators[spectator.sock] = spectator
+                SPECTATORS.inc()
+            now = time.monotonic()
+            for spectator in list(self.spectators.values()):
+                self.flush(spectator, now)
+
+    def discard_input(self, spectator):
+        """
+        Reads and discards what a spectator sends, which is only heartbeats, and notices a closed connection.
+        :param spectator: the Spectator
+        """
+        try:
+            if spectator.sock.recv(4096):
+                return
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            pass
+        self.finish(spectator, dropped=True)
+
+    def flush(self, spectator, now):
+        """
+        Sends a spectator what its socket accepts of the frames after its cursor.
+        :param spectator: the Spectator
+        :param now: the current time.monotonic() time
+        """
+        if spectator.sock not in self.spectators:
+            return
+        if not spectator.pending:
+            spectator.pending, spectator.cursor, skipped = spectator.feed.read(spectator.cursor)
+            if skipped:
+                SKIPPED_FRAMES.inc(skipped)
+            if not spectator.pending:
+                spectator.moved_at = now
+                if spectator.feed.finished(spectator.cursor):
+                    self.finish(spectator)
+                return
+        try:
+            sent = spectator.sock.send(spectator.pending)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self.finish(spectator, dropped=True)
+            return
+        if sent:
+            spectator.pending = spectator.pending[sent:]
+            spectator.moved_at = now
+        elif now - spectator.moved_at >= self.stall_timeout:
+            DROPPED_SPECTATORS.inc()
+            self.finish(spectator, dropped=True)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if spectator.pending else 0)
+        self.selector.modify(spectator.sock, events, spectator)
+        if not spectator.pending and spectator.feed.finished(spectator.cursor):
+            self.finish(spectator)
+
+    def finish(self, spectator, dropped=False):
+        """
+        Stops streaming to a spectator: its socket is given back to the server, or closed.
+        :param spectator: the Spectator
+        :param dropped: whether the spectator was dropped before the end of the feed
+        """
+        self.selector.unregister(spectator.sock)
+        del self.spectators[spectator.sock]
+        SPECTATORS.dec()
+        spectator.dropped = dropped
+        if spectator.keep and not dropped:
+            spectator.sock.setblocking(True)
+        else:
+            try:
+                spectator.sock.close()
+            except OSError:
+                pass
+        spectator.done.set()
+
+
+async def stream_feed(feed, spectator, cursor=0, stall_timeout=STALL_TIMEOUT):
+    """
+    Streams a feed to a spectator of the asyncio server until the feed is closed. The spectator's writer is looked up
+    before every write, so a player who resumes their session on a new connection is streamed on the new one.
+    :param feed: the SpectatorFeed to stream
+    :param spectator: the spectator, with the asyncio StreamWriter of its current connection as writer
+    :param cursor: the sequence number of the first frame to send
+    :param stall_timeout: seconds a spectator may read nothing before it is dropped
+    :return: True if the spectator was sent the whole feed, False if it was dropped, its connection is then closed
+    """
+    import asyncio
+
+    SPECTATORS.inc()
+    try:
+        while not feed.finished(cursor):
+            start = cursor
+            data, cursor, skipped = feed.read(cursor)
+            if skipped:
+                SKIPPED_FRAMES.inc(skipped)
+            if not data:
+                await feed.wait(cursor)
+                continue
+            writer = spectator.writer
+            try:
+                writer.write(data)
+                await asyncio.wait_for(writer.drain(), stall_timeout)
+            except (OSError, RuntimeError, asyncio.TimeoutError):
+                if spectator.writer is not writer:
+                    # The connection was replaced while the frames were sent, they are sent again on the new one
+                    cursor = start
+                    continue
+                DROPPED_SPECTATORS.inc()
+                # Only the connection that failed is closed, never one the spectator resumed on since
+                writer.close()
+                return False
+        return True
+    finally:
+        SPECTATORS.dec()
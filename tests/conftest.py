@@ -0,0 +1,30 @@
+import os
+import socket
+import sys
+
+import pytest
+
+# The modules of the game live at the top of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def free_port():
+    """
+    Finds a TCP port nobody listens on.
+    :return: the port number
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def port():
+    return free_port()
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    # The servers create their leaderboard and game files in the working directory
+    monkeypatch.chdir(tmp_path)
@@ -0,0 +1,140 @@
+import asyncio
+
+import async_server
+import messages
+import protocol
+from pacing import NO_PACING, Pacing
+from question_bank import BuiltinQuestionBank
+from server import bot_names
+
+
+async def connect(port, msg_type, payload):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(protocol.encode_frame(msg_type, payload))
+    await writer.drain()
+    return reader, writer
+
+
+async def read_until(reader, msg_type, timeout=5):
+    """
+    Reads frames until one of a type arrives.
+    :return: the payload of the frame
+    """
+    while True:
+        frame = await asyncio.wait_for(protocol.read_frame_async(reader), timeout)
+        assert frame is not None, 'connection closed'
+        if frame[0] == msg_type:
+            return frame[1]
+
+
+async def start_server(port, pacing=NO_PACING, **kwargs):
+    server = async_server.AsyncTriviaServer('127.0.0.1', port, fill_bots=False, pacing=pacing, **kwargs)
+    task = asyncio.create_task(server.serve())
+    for _ in range(100):
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+        except OSError:
+            await asyncio.sleep(0.01)
+            continue
+        writer.close()
+        return server, task
+    raise RuntimeError('the server did not start')
+
+
+def test_bots_are_routed_by_their_bot_frame_not_by_their_name(port):
+    async def scenario():
+        server, task = await start_server(port)
+        try:
+            bot_room = async_server.Room(99)
+            bot_room.bots_needed = 1
+            server.bot_rooms.append(bot_room)
+            # A human whose name happens to be a bot's name plays in the filling room
+            human_reader, human = await connect(port, protocol.RESUME, protocol.encode_resume('', bot_names[0]))
+            await read_until(human_reader, protocol.SESSION)
+            assert not bot_room.lobby
+            assert [player.name for player in server.filling.lobby.values()] == [bot_names[0]]
+            # A bot started by the server says so, and takes the seat waiting for it
+            _, bot = await connect(port, protocol.BOT, bot_names[0])
+            for _ in range(100):
+                if bot_room.lobby:
+                    break
+                await asyncio.sleep(0.01)
+            assert [player.bot for player in bot_room.lobby.values()] == [True]
+            assert not server.bot_rooms
+            human.close()
+            bot.close()
+        finally:
+            task.cancel()
+
+    asyncio.run(scenario())
+
+
+async def open_session(port, name):
+    reader, writer = await connect(port, protocol.RESUME, protocol.encode_resume('', name))
+    return reader, writer, await read_until(reader, protocol.SESSION)
+
+
+QUICK_PACING = Pacing(settle_delay=0, intro_delay=0, players_list_delay=0, question_delay=0, answer_timeout=5,
+                      results_delay=0, next_round_delay=0, winner_delay=0, rankings_delay=0, game_over_delay=0)
+
+
+def test_a_player_resuming_during_a_question_is_asked_again_and_can_answer(port):
+    async def scenario():
+        server, task = await start_server(port, room_capacity=2, pacing=QUICK_PACING)
+        try:
+            alice_reader, alice, _ = await open_session(port, 'alice')
+            bob_reader, bob, token = await open_session(port, 'bob')
+            question = await read_until(bob_reader, protocol.QUESTION)
+            # Bob's connection is lost while the question is open, and he comes back with his session token
+            bob.close()
+            await asyncio.sleep(0.2)
+            bob_reader, bob = await connect(port, protocol.RESUME, protocol.encode_resume(token, 'bob'))
+            assert messages.WELCOME_BACK in await read_until(bob_reader, protocol.INFO)
+            asked_again = await read_until(bob_reader, protocol.QUESTION)
+            assert asked_again.startswith(question) and 'seconds left' in asked_again
+            bob.write(protocol.encode_frame(protocol.ANSWER, 'Y'))
+            await read_until(alice_reader, protocol.QUESTION)
+            alice.write(protocol.encode_frame(protocol.ANSWER, 'N'))
+            results = await read_until(bob_reader, protocol.INFO)
+            assert 'bob is correct!' in results or 'bob is incorrect!' in results
+            alice.close()
+            bob.close()
+        finally:
+            task.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_an_eliminated_player_resuming_keeps_watching_on_the_new_connection(port):
+    async def scenario():
+        bank = BuiltinQuestionBank({f'Question {i} is true': True for i in range(5)})
+        server, task = await start_server(port, room_capacity=3, pacing=QUICK_PACING, question_bank=bank)
+        try:
+            players = {name: await open_session(port, name) for name in ('alice', 'bob', 'carol')}
+            for name, answer in (('alice', 'Y'), ('bob', 'N'), ('carol', 'Y')):
+                reader, writer, _ = players[name]
+                await read_until(reader, protocol.QUESTION)
+                writer.write(protocol.encode_frame(protocol.ANSWER, answer))
+            bob_reader, bob, token = players['bob']
+            await read_until(bob_reader, protocol.ELIMINATED)
+            # Bob watches the second round, loses his connection and resumes his session
+            while 'Question 1' not in await read_until(bob_reader, protocol.INFO):
+                pass
+            bob.close()
+            await asyncio.sleep(0.2)
+            bob_reader, bob = await connect(port, protocol.RESUME, protocol.encode_resume(token, 'bob'))
+            await read_until(bob_reader, protocol.SESSION)
+            for name, answer in (('alice', 'Y'), ('carol', 'N')):
+                reader, writer, _ = players[name]
+                await read_until(reader, protocol.QUESTION)
+                writer.write(protocol.encode_frame(protocol.ANSWER, answer))
+            # The rest of the game is streamed on the new connection, which is kept for the next game
+            assert 'winner: alice' in await read_until(bob_reader, protocol.GAME_OVER)
+            assert await read_until(bob_reader, protocol.INFO) == messages.WELCOME
+            for _, writer, _ in players.values():
+                writer.close()
+            bob.close()
+        finally:
+            task.cancel()
+
+    asyncio.run(scenario())
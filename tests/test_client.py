@@ -0,0 +1,49 @@
+import os
+import selectors
+import socket
+import threading
+
+import client
+import protocol
+
+
+def test_an_answer_typed_while_reconnecting_answers_the_pending_question(monkeypatch):
+    typed_reader, typed_writer = os.pipe()
+    # The player types into a pipe instead of the standard input
+    monkeypatch.setattr(client, 'open_answer_input',
+                        lambda selector: selector.register(typed_reader, selectors.EVENT_READ) and True)
+    monkeypatch.setattr(client, 'RESUME_TIMEOUT', 0.5)
+    monkeypatch.setattr(client, 'RESUME_RETRY', 0.1)
+    listener = socket.create_server(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    received = []
+
+    def fake_server():
+        with listener:
+            first, _ = listener.accept()
+            with first:
+                received.append(protocol.recv_frame(first))
+                first.sendall(protocol.encode_frames([(protocol.SESSION, 'token'),
+                                                      (protocol.QUESTION, 'True or False: Rome is in France\n'),
+                                                      (protocol.PING, '')]))
+                # The client answers the ping once it read the question
+                received.append(protocol.recv_frame(first))
+            # The connection is lost while the question is open; the answer is typed before the client is back
+            os.write(typed_writer, b'N\n')
+            second, _ = listener.accept()
+            with second:
+                second.settimeout(5)
+                received.append(protocol.recv_frame(second))
+                received.append(protocol.recv_frame(second))
+
+    server_thread = threading.Thread(target=fake_server, daemon=True)
+    server_thread.start()
+    try:
+        client.Client('alice', headless=True).tcp_client('127.0.0.1', port)
+    finally:
+        os.close(typed_reader)
+        os.close(typed_writer)
+    server_thread.join(5)
+    assert received == [(protocol.RESUME, protocol.encode_resume('', 'alice')), (protocol.PONG, ''),
+                        (protocol.RESUME, protocol.encode_resume('token', 'alice')),
+                        (protocol.ANSWER, 'N')]
@@ -0,0 +1,95 @@
+import asyncio
+
+import game_log
+import messages
+import server
+from game_log import GAME, GameLog, GameRecorder
+from pacing import NO_PACING
+from replay import LoggedQuestionBank, replay_game
+from virtual_player import ScriptedPlayer
+
+# One list of answers per player, one answer per round; None leaves the question unanswered
+SCRIPTS = {
+    1: ['T', 'F', 'T', 'F'],
+    2: ['F', 'T', 'F', 'T'],
+    3: ['T', 'maybe'],
+    4: [None, 'T'],
+    5: ['T', 'F', 'F', 'F'],
+}
+
+
+def record_game(monkeypatch):
+    """
+    Plays a game of scripted players with the threaded round engine, recording it.
+    :return: (the GameRecorder, the ids of the players eliminated in every round, the winner)
+    """
+    monkeypatch.setattr(server, 'disconnected_clients', {})
+    players = {pid: ScriptedPlayer(pid, f'player {pid}', answers) for pid, answers in SCRIPTS.items()}
+    recorder = GameRecorder()
+    for pid, player in players.items():
+        recorder.join(pid, player.name, bot=pid == 5)
+    question_ids = list(range(len(server.builtin_bank)))
+    game_messages = messages.GameMessages({pid: player.name for pid, player in players.items()},
+                                          [server.builtin_bank.get(qid)[0] for qid in question_ids])
+    eliminated = []
+    for number, question_id in enumerate(question_ids, start=1):
+        if len(players) <= 1:
+            break
+        before = set(players)
+        server.play(players, {pid: player.name for pid, player in players.items()}, question_id, [],
+                    game_messages.round_header(number, players.keys()), game_messages, NO_PACING, server.builtin_bank,
+                    recorder=recorder)
+        eliminated.append(before - set(players))
+    winner = next(iter(players)) if len(players) == 1 else None
+    recorder.result(winner)
+    return recorder, eliminated, winner
+
+
+def test_a_recorded_game_is_read_back_and_a_truncated_final_block_is_skipped(monkeypatch):
+    recorder, eliminated, winner = record_game(monkeypatch)
+    log = GameLog('games.log')
+    first = log.append(recorder)
+    second = log.append(recorder)
+    # A third game whose block was cut short, e.g. by a crash during the write
+    with open('games.log', 'ab') as f:
+        f.write(recorder.block()[:GAME.size + 3])
+
+    assert log.offsets() == [first, second]
+    assert second - first == len(recorder.block())
+    game = log.read_game(first)
+    assert game.players == {pid: (f'player {pid}', pid == 5) for pid in SCRIPTS}
+    assert [set(logged_round['eliminated']) for logged_round in game.rounds] == eliminated
+    assert game.winner == winner
+    assert len(game.rounds[0]['answers']) == len(SCRIPTS)
+    assert [game.offset for game in log.games()] == [first, second]
+
+
+def test_a_log_with_only_a_truncated_block_has_no_games(monkeypatch):
+    recorder, _, _ = record_game(monkeypatch)
+    with open('games.log', 'wb') as f:
+        f.write(game_log.LOG_HEADER.pack(game_log.LOG_MAGIC, game_log.LOG_VERSION))
+        f.write(recorder.block()[:-1])
+    assert GameLog('games.log').offsets() == []
+    assert GameLog('missing.log').offsets() == []
+
+
+def test_replayed_games_eliminate_the_logged_players_on_both_engines(monkeypatch):
+    recorder, eliminated, _ = record_game(monkeypatch)
+    assert any(eliminated)
+    log = GameLog('games.log')
+    game = log.read_game(log.append(recorder))
+
+    assert replay_game(game, LoggedQuestionBank(server.builtin_bank))[0] == 0
+    loop = asyncio.new_event_loop()
+    try:
+        assert replay_game(game, LoggedQuestionBank(server.builtin_bank), loop)[0] == 0
+    finally:
+        loop.close()
+
+
+def test_a_replay_reports_the_rounds_that_differ_from_the_log(monkeypatch):
+    recorder, _, _ = record_game(monkeypatch)
+    log = GameLog('games.log')
+    game = log.read_game(log.append(recorder))
+    game.rounds[0]['eliminated'].append(1)
+    assert replay_game(game, LoggedQuestionBank(server.builtin_bank))[0] == 1
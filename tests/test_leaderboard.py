@@ -0,0 +1,115 @@
+import random
+
+import pytest
+
+from leaderboard import INDEX_SIZE, Leaderboard, LogLeaderboard, RankedIndex, SQLiteLeaderboard
+
+
+class Incomplete(Leaderboard):
+    def increment(self, name, amount=1):
+        return amount
+
+    def wins(self, name):
+        return 0
+
+    def top(self, k=3):
+        return []
+
+
+def test_a_backend_missing_a_method_fails_when_it_is_created():
+    with pytest.raises(TypeError, match='around'):
+        Incomplete()
+
+
+@pytest.mark.parametrize('backend, file_name', [(SQLiteLeaderboard, 'winners.db'), (LogLeaderboard, 'winners.log')])
+def test_backends_implement_the_interface(backend, file_name):
+    board = backend(file_name)
+    try:
+        board.increment('alice', 2)
+        board.increment('bob')
+        assert board.top(2) == [('alice', 2), ('bob', 1)]
+        assert board.rank('bob') == 2
+        assert board.around(1, radius=1) == [(1, 'alice', 2), (2, 'bob', 1)]
+    finally:
+        board.close()
+
+
+def ranked(scores):
+    """
+    Ranks the players by brute force, the oracle of the RankedIndex.
+    :param scores: dict of name to wins
+    :return: list of (rank, name, wins) tuples of the players with wins
+    """
+    players = sorted((-wins, name) for name, wins in scores.items() if wins > 0)
+    return [(rank, name, -wins) for rank, (wins, name) in enumerate(players, start=1)]
+
+
+def check_index(index, scores):
+    expected = ranked(scores)
+    ranks = {name: rank for rank, name, wins in expected}
+    assert index.players == len(expected)
+    for name in scores:
+        assert index.rank(name) == ranks.get(name)
+    for k in (0, 1, 3, len(expected), len(expected) + 1):
+        assert index.top(k) == [(name, wins) for rank, name, wins in expected[:k]]
+    for rank in (1, 2, len(expected) // 2, len(expected), len(expected) + 2):
+        for radius in (0, 1, 4):
+            first = max(rank - radius, 1)
+            assert index.around(rank, radius) == expected[first - 1:rank + radius]
+    for first in range(1, len(expected) + 2):
+        assert index.page(first, 3) == expected[first - 1:first + 2]
+
+
+def test_the_ranked_index_loads_the_players_in_order():
+    scores = {'alice': 3, 'bob': 5, 'carol': 3, 'dave': 0, 'erin': 1, 'frank': 5, 'grace': -1}
+    index = RankedIndex()
+    index.load(scores.items())
+    assert index.top(4) == [('bob', 5), ('frank', 5), ('alice', 3), ('carol', 3)]
+    assert index.rank('carol') == 4
+    assert index.rank('dave') is None
+    assert index.around(5, radius=1) == [(4, 'carol', 3), (5, 'erin', 1)]
+    check_index(index, scores)
+
+
+def test_an_empty_ranked_index_has_no_players():
+    index = RankedIndex()
+    index.load([])
+    check_index(index, {})
+    assert index.rank('alice') is None
+
+
+def test_the_ranked_index_matches_a_sort_through_random_increments():
+    generator = random.Random(1234)
+    names = [f'player{i}' for i in range(40)]
+    scores = {name: generator.randrange(0, 20) for name in names[:20]}
+    index = RankedIndex()
+    index.load(scores.items())
+    check_index(index, scores)
+    for step in range(600):
+        name = generator.choice(names)
+        # Mostly wins, with some wins taken back, and a few jumps past the size of the Fenwick tree
+        amount = generator.choice([1, 1, 1, 2, 5, -1, -3])
+        if step % 150 == 149:
+            amount = INDEX_SIZE + generator.randrange(INDEX_SIZE)
+        scores[name] = scores.get(name, 0) + amount
+        assert index.add(name, amount) == scores[name]
+        if step % 10 == 0:
+            check_index(index, scores)
+    check_index(index, scores)
+    assert max(scores.values()) > INDEX_SIZE
+    # A fresh index loaded with wins past the size of the Fenwick tree
+    reloaded = RankedIndex()
+    reloaded.load(scores.items())
+    check_index(reloaded, scores)
+
+
+def test_a_player_whose_wins_are_taken_back_is_no_longer_ranked():
+    index = RankedIndex()
+    index.load([('alice', 2), ('bob', 1)])
+    assert index.add('alice', -2) == 0
+    assert index.rank('alice') is None
+    assert index.top(3) == [('bob', 1)]
+    assert index.add('bob', -5) == -4
+    check_index(index, {'alice': 0, 'bob': -4})
+    assert index.add('bob', 6) == 2
+    check_index(index, {'alice': 0, 'bob': 2})
@@ -0,0 +1,89 @@
+import multiprocessing
+import socket
+import threading
+import time
+
+import protocol
+import server
+from lobby import Lobby, LobbyPolicy
+from pacing import NO_PACING
+
+
+def join(port, name):
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall(protocol.encode_frame(protocol.NAME, name))
+    return sock
+
+
+def first_round(sock):
+    """
+    Reads a player's frames until the header of the first round.
+    :return: the names of the players of the round
+    """
+    sock.settimeout(10)
+    reader = protocol.FrameReader(sock)
+    while True:
+        frame = reader.read_frame()
+        assert frame is not None, 'connection closed'
+        if frame[0] == protocol.ROUND:
+            return frame[1].split('played by ', 1)[1].rstrip(':\n').split(', ')
+
+
+def test_bots_fill_a_lobby_with_gaps_in_its_player_ids(port):
+    policy = LobbyPolicy(fill_deadline=2, idle_window=1, min_window=1)
+    # The threaded server runs forever, in a process of its own so it stops with the test
+    game_server = multiprocessing.get_context('fork').Process(
+        target=server.tcp_server, args=('127.0.0.1', port), kwargs={'pacing': NO_PACING, 'lobby': policy}, daemon=True)
+    game_server.start()
+    try:
+        for _ in range(500):
+            try:
+                alice = join(port, 'alice')
+                break
+            except OSError:
+                time.sleep(0.01)
+        # The second connection takes id 2 and leaves before sending its name, so the players hold ids 1 and 3
+        socket.create_connection(('127.0.0.1', port)).close()
+        time.sleep(0.2)
+        carol = join(port, 'carol')
+        with alice, carol:
+            players = first_round(alice)
+            assert first_round(carol) == players
+    finally:
+        game_server.terminate()
+        game_server.join()
+    assert len(players) == 4
+    assert {'alice', 'carol'} <= set(players)
+
+
+def test_players_who_take_no_new_seat_do_not_fill_the_lobby(port):
+    server_socket = socket.create_server(('127.0.0.1', port))
+    lobby = Lobby(server_socket, LobbyPolicy(capacity=2, fill_deadline=5, idle_window=5))
+    joined = []
+
+    def on_join(client_id, client_socket, name, token):
+        joined.append(name)
+        client_socket.close()
+        # A player resuming a session takes back the seat they held
+        return token is None
+
+    admitting = threading.Thread(target=lobby.admit, args=(1, on_join))
+    admitting.start()
+    connections = []
+    try:
+        for name in ('ghost', 'alice', 'bob'):
+            if name == 'ghost':
+                sock = socket.create_connection(('127.0.0.1', port))
+                sock.sendall(protocol.encode_frame(protocol.RESUME, protocol.encode_resume('token', name)))
+            else:
+                sock = join(port, name)
+            connections.append(sock)
+            time.sleep(0.1)
+        admitting.join(5)
+        assert not admitting.is_alive()
+    finally:
+        for sock in connections:
+            sock.close()
+        server_socket.close()
+    assert joined == ['ghost', 'alice', 'bob']
+    assert lobby.players == 2
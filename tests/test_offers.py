@@ -0,0 +1,51 @@
+import socket
+import struct
+
+import pytest
+
+import server
+from offers import MESSAGE_TYPE_LOAD_OFFER, MESSAGE_TYPE_OFFER, ServerLoad, pack_offer, parse_offer
+
+# The offer format of the original clients, unpacked with an exact length
+LEGACY_OFFER_FORMAT = '!IB32sH'
+
+
+def udp_receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(2)
+    return sock
+
+
+def test_the_load_aware_offer_does_not_parse_as_an_original_offer():
+    load_offer = pack_offer(server.pad_server_name('Lucky Bunnies'), 40000, ServerLoad(8))
+    with pytest.raises(struct.error):
+        struct.unpack(LEGACY_OFFER_FORMAT, load_offer)
+    assert parse_offer(load_offer, '127.0.0.1').message_type == MESSAGE_TYPE_LOAD_OFFER
+
+
+def test_original_clients_only_receive_original_offers(monkeypatch):
+    with udp_receiver() as legacy, udp_receiver() as load_aware:
+        monkeypatch.setattr(server, 'startup', lambda: ('127.0.0.1', 40000))
+        monkeypatch.setattr(server, 'get_local_broadcast_ip', lambda: '127.0.0.1')
+        monkeypatch.setattr(server, 'OFFER_PORT', legacy.getsockname()[1])
+        monkeypatch.setattr(server, 'LOAD_OFFER_PORT', load_aware.getsockname()[1])
+        sleeps = []
+
+        def sleep(seconds):
+            # The broadcast loop sends one round of offers, and is interrupted at its next sleep
+            sleeps.append(seconds)
+            if len(sleeps) > 1:
+                raise KeyboardInterrupt
+
+        monkeypatch.setattr(server.time, 'sleep', sleep)
+        server.udp_broadcast(ServerLoad(8), port=40000)
+
+        data, _ = legacy.recvfrom(1024)
+        assert struct.unpack(LEGACY_OFFER_FORMAT, data)[1] == MESSAGE_TYPE_OFFER
+        legacy.settimeout(0.1)
+        with pytest.raises(socket.timeout):
+            legacy.recvfrom(1024)
+        data, address = load_aware.recvfrom(1024)
+        offer = parse_offer(data, address[0])
+        assert (offer.message_type, offer.port, offer.capacity) == (MESSAGE_TYPE_LOAD_OFFER, 40000, 8)
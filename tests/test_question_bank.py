@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+from question_bank import INDEX_HEADER, INDEX_MAGIC, INDEX_VERSION, FileQuestionBank, open_question_bank
+
+
+def write(path, text):
+    with open(path, 'w', newline='') as f:
+        f.write(text)
+    return str(path)
+
+
+def questions(bank):
+    return [bank.get(question_id) for question_id in range(len(bank))]
+
+
+def test_jsonl_bank_skips_blank_lines(tmp_path):
+    filename = write(tmp_path / 'bank.jsonl', '{"question": "Rome is in Italy", "answer": true}\n'
+                                              '\n'
+                                              '   \n'
+                                              '{"question": "Paris is in Spain", "answer": "F"}\n'
+                                              '\n')
+    bank = open_question_bank(filename)
+    try:
+        assert questions(bank) == [('Rome is in Italy', True), ('Paris is in Spain', False)]
+        with pytest.raises(IndexError):
+            bank.get(2)
+    finally:
+        bank.close()
+
+
+def test_csv_bank_skips_its_header_and_blank_lines(tmp_path):
+    filename = write(tmp_path / 'bank.csv', 'question,answer\r\n'
+                                            '\r\n'
+                                            '"Lima, the capital of Peru, is in South America",yes\r\n'
+                                            '\r\n'
+                                            'The Nile is in Asia,0\r\n')
+    bank = open_question_bank(filename)
+    try:
+        assert questions(bank) == [('Lima, the capital of Peru, is in South America', True),
+                                   ('The Nile is in Asia', False)]
+    finally:
+        bank.close()
+
+
+def test_csv_bank_without_a_header_keeps_its_first_question(tmp_path):
+    filename = write(tmp_path / 'bank.csv', 'Rome is in Italy,true\nParis is in Spain,false\n')
+    bank = open_question_bank(filename)
+    try:
+        assert questions(bank) == [('Rome is in Italy', True), ('Paris is in Spain', False)]
+    finally:
+        bank.close()
+
+
+def test_index_records_the_offsets_and_the_version_of_the_file(tmp_path):
+    text = 'question,answer\nRome is in Italy,true\n\nParis is in Spain,false\n'
+    filename = write(tmp_path / 'bank.csv', text)
+    open_question_bank(filename).close()
+    with open(filename + '.idx', 'rb') as f:
+        index = f.read()
+    magic, version, count, size, mtime = INDEX_HEADER.unpack_from(index)
+    stat = os.stat(filename)
+    assert (magic, version, count, size, mtime) == (INDEX_MAGIC, INDEX_VERSION, 2, stat.st_size, stat.st_mtime)
+    offsets = [int.from_bytes(index[i:i + 8], 'little') for i in range(INDEX_HEADER.size, len(index), 8)]
+    first = text.index('Rome')
+    second = text.index('Paris')
+    assert offsets == [first, second, len(text)]
+
+
+def test_index_is_reused_while_the_file_is_unchanged(tmp_path, monkeypatch):
+    filename = write(tmp_path / 'bank.jsonl', '{"question": "Rome is in Italy", "answer": true}\n')
+    open_question_bank(filename).close()
+
+    def build_index(self):
+        raise AssertionError('the index was rebuilt')
+
+    monkeypatch.setattr(FileQuestionBank, 'build_index', build_index)
+    bank = open_question_bank(filename)
+    assert questions(bank) == [('Rome is in Italy', True)]
+    bank.close()
+
+
+def test_index_is_rebuilt_after_the_file_changes(tmp_path):
+    filename = write(tmp_path / 'bank.jsonl', '{"question": "Rome is in Italy", "answer": true}\n')
+    open_question_bank(filename).close()
+    write(filename, '{"question": "Paris is in Spain", "answer": false}\n'
+                    '{"question": "Lima is in Peru", "answer": true}\n')
+    bank = open_question_bank(filename)
+    try:
+        assert questions(bank) == [('Paris is in Spain', False), ('Lima is in Peru', True)]
+    finally:
+        bank.close()
+    # A file of the same size is told apart by its modification time
+    size = os.stat(filename).st_size
+    write(filename, '{"question": "Oslo is in Norway", "answer": false}\n'
+                    '{"question": "Lima is in Peru", "answer": true}\n')
+    stat = os.stat(filename)
+    assert stat.st_size == size
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    bank = open_question_bank(filename)
+    try:
+        assert questions(bank) == [('Oslo is in Norway', False), ('Lima is in Peru', True)]
+    finally:
+        bank.close()
+
+
+def test_a_file_without_questions_is_refused(tmp_path):
+    filename = write(tmp_path / 'bank.csv', 'question,answer\n\n')
+    with pytest.raises(ValueError):
+        open_question_bank(filename)
@@ -0,0 +1,56 @@
+import pytest
+
+from scoring import CORRECT, INCORRECT, INVALID, LATE, MISSING, RoundScore, decode_answer, encode_answer
+
+# answer text, outcome when the correct answer is True, outcome when it is False
+CASES = [
+    ('T', CORRECT, INCORRECT),
+    ('Y', CORRECT, INCORRECT),
+    ('1', CORRECT, INCORRECT),
+    (' t\n', CORRECT, INCORRECT),
+    ('F', INCORRECT, CORRECT),
+    ('N', INCORRECT, CORRECT),
+    ('0', INCORRECT, CORRECT),
+    ('n', INCORRECT, CORRECT),
+    ('NONE', LATE, LATE),
+    ('maybe', INVALID, INVALID),
+    ('', INVALID, INVALID),
+    (None, MISSING, MISSING),
+]
+
+
+@pytest.mark.parametrize('correct_answer', [True, False])
+def test_every_answer_is_scored_against_the_correct_answer(correct_answer):
+    score = RoundScore(range(len(CASES)))
+    for pid, (answer, _, _) in enumerate(CASES):
+        if answer is not None:
+            score.record(pid, answer)
+    outcomes = score.score(correct_answer)
+
+    expected = [if_true if correct_answer else if_false for _, if_true, if_false in CASES]
+    assert list(outcomes) == expected
+    assert score.eliminated() == [pid for pid, outcome in enumerate(expected) if outcome in (INCORRECT, LATE, INVALID)]
+    assert score.answered() == len(CASES) - 1
+    assert score.results() == [(pid, outcome) for pid, outcome in enumerate(expected) if outcome != MISSING]
+    assert not score.nobody_eliminated()
+
+
+@pytest.mark.parametrize('answers, nobody_eliminated', [
+    (['T', 'Y', None], True),
+    (['F', 'N', 'NONE'], True),
+    (['T', 'F', None], False),
+    (['T', 'NONE', '1'], False),
+    ([None, None], True),
+])
+def test_nobody_is_eliminated_when_everyone_is_right_or_nobody_is(answers, nobody_eliminated):
+    score = RoundScore(['p%d' % i for i in range(len(answers))])
+    for i, answer in enumerate(answers):
+        if answer is not None:
+            score.record('p%d' % i, answer)
+    score.score(True)
+    assert score.nobody_eliminated() == nobody_eliminated
+
+
+@pytest.mark.parametrize('answer', ['T', 'Y', '1', 'F', 'N', '0', 'NONE'])
+def test_decoded_answers_score_like_the_original(answer):
+    assert encode_answer(decode_answer(encode_answer(answer))) == encode_answer(answer)
@@ -0,0 +1,84 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import protocol
+import server
+from heartbeat import DEFAULT_HEARTBEAT, HeartbeatPolicy, tune_keepalive
+from pacing import DEFAULT_PACING
+from scoring import RoundScore
+
+
+@pytest.fixture
+def player(monkeypatch):
+    monkeypatch.setattr(server, 'pid_to_name', {1: 'alice'})
+    monkeypatch.setattr(server, 'disconnected_clients', {})
+    server_side, client_side = socket.socketpair()
+    yield server_side, client_side
+    server_side.close()
+    client_side.close()
+
+
+def test_play_trivia_drops_a_silent_player_before_the_answer_deadline(player):
+    server_side, client_side = player
+    heartbeat = HeartbeatPolicy(interval=0.05, dead_after=0.3)
+    start = time.monotonic()
+    server.play_trivia(1, server_side, RoundScore([1]), start + 10, heartbeat)
+    assert time.monotonic() - start < 2
+    assert server.disconnected_clients == {1: 'alice'}
+    # The player was pinged while the server waited
+    client_side.settimeout(1)
+    assert protocol.recv_frame(client_side)[0] == protocol.PING
+
+
+def test_the_default_heartbeat_flags_a_peer_that_never_answers_within_the_default_answer_window(player):
+    server_side, client_side = player
+    # The default policy and answer window, ten times faster
+    scale = 10
+    heartbeat = HeartbeatPolicy(DEFAULT_HEARTBEAT.interval / scale, DEFAULT_HEARTBEAT.dead_after / scale)
+    answer_window = DEFAULT_PACING.answer_timeout / scale
+    start = time.monotonic()
+    server.play_trivia(1, server_side, RoundScore([1]), start + answer_window, heartbeat)
+    assert time.monotonic() - start < answer_window
+    assert server.disconnected_clients == {1: 'alice'}
+
+
+def test_play_trivia_keeps_waiting_for_a_player_answering_the_pings(player):
+    server_side, client_side = player
+    heartbeat = HeartbeatPolicy(interval=0.05, dead_after=0.3)
+    round_score = RoundScore([1])
+
+    def client():
+        reader = protocol.FrameReader(client_side)
+        answer_at = time.monotonic() + 0.6
+        while time.monotonic() < answer_at:
+            if reader.read_frame()[0] == protocol.PING:
+                client_side.sendall(protocol.PONG_FRAME)
+        client_side.sendall(protocol.encode_frame(protocol.ANSWER, 'Y'))
+
+    thread = threading.Thread(target=client, daemon=True)
+    thread.start()
+    server.play_trivia(1, server_side, round_score, time.monotonic() + 10, heartbeat)
+    thread.join()
+    assert server.disconnected_clients == {}
+    round_score.score(True)
+    assert round_score.answered() == 1
+
+
+@pytest.mark.skipif(not hasattr(socket, 'TCP_USER_TIMEOUT'), reason='TCP_USER_TIMEOUT is Linux only')
+def test_unacknowledged_data_fails_a_connection_within_the_ack_timeout():
+    with socket.socket() as sock:
+        tune_keepalive(sock, dead_after=20, ack_timeout=5)
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT) == 5000
+
+
+def test_the_threaded_server_does_not_import_asyncio():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    loaded = subprocess.run([sys.executable, '-c', "import sys, server; print('asyncio' in sys.modules)"], cwd=root,
+                            capture_output=True, text=True, check=True).stdout
+    assert loaded.strip() == 'False'
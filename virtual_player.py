@@ -0,0 +1,107 @@
+import collections
+import random
+import time
+
+"""
+This module implements the virtual bots of the Trivia King servers.
+
+A bot used to be a Bot client started in a new thread, connecting back to the server over TCP, going through the
+lobby handshake and then playing over loopback. A VirtualPlayer plays inside the server process instead: the round
+engine asks it for its answer with a plain function call, and the messages sent to it are dropped. A virtual bot
+costs no socket, no thread and no encoding, so lobbies are filled instantly and a room can hold hundreds of bots
+without exhausting file descriptors.
+
+A VirtualPlayer can stand in for a socket in server.py (sendall) and for an AsyncPlayer in async_server.py (send,
+flush, discard_pending, close); the servers use is_virtual to call answer instead of waiting on a connection.
+
+The module includes the following functionalities:
+- VirtualPlayer: A bot that plays inside the server process.
+- ScriptedPlayer: A virtual player that gives scripted answers, to replay a logged game.
+- is_virtual: Checks if a player is a virtual bot.
+"""
+
+
+class VirtualPlayer:
+    """
+    A bot that plays inside the server process, answering questions at random like the Bot client.
+    """
+
+    is_virtual = True
+
+    def __init__(self, client_id, name):
+        """
+        Initialize the VirtualPlayer object.
+
+        :param client_id: id of the player
+        :param name: name of the bot
+        """
+        self.client_id = client_id
+        self.name = name
+        self.connected = True
+        self.last_seen = time.monotonic()
+
+    def answer(self, question):
+        """
+        Answer a question.
+        :param question: the question asked
+        :return: the text of the answer, or None to leave the question unanswered
+        """
+        return random.choice(['0', '1'])
+
+    def sendall(self, data):
+        """
+        Drop data sent to the bot, like socket.sendall.
+        :param data: bytes sent
+        """
+
+    def send(self, data):
+        """
+        Drop data sent to the bot, like AsyncPlayer.send.
+        :param data: bytes sent
+        """
+
+    async def flush(self):
+        pass
+
+    def discard_pending(self):
+        pass
+
+    def close(self):
+        """
+        Remove the bot from the game.
+        """
+        self.connected = False
+
+
+class ScriptedPlayer(VirtualPlayer):
+    """
+    A virtual player that gives the answers it is scripted with, one per question, in order.
+    """
+
+    def __init__(self, client_id, name, answers=()):
+        """
+        Initialize the ScriptedPlayer object.
+
+        :param client_id: id of the player
+        :param name: name of the player
+        :param answers: the texts of the answers, None for a question the player did not answer
+        """
+        super().__init__(client_id, name)
+        self.answers = collections.deque(answers)
+
+    def answer(self, question):
+        """
+        Answer a question with the next scripted answer.
+        :param question: the question asked
+        :return: the text of the answer, or None to leave the question unanswered
+        """
+        return self.answers.popleft() if self.answers else None
+
+
+def is_virtual(player):
+    """
+    Check if a player, or the socket of a player, is a virtual bot.
+    :param player: socket, AsyncPlayer or VirtualPlayer
+    :return: True for a VirtualPlayer
+    """
+    return getattr(player, 'is_virtual', False)